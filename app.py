@@ -1,13 +1,19 @@
 import uvicorn
 from fastapi import FastAPI
 
-from routers import categories, quizzes, users
+from instrumentation import MetricsMiddleware
+from resources import resources
+from routers import categories, metrics, quizzes, users
 
 # FastAPI entry point, include routes and start server
-app = FastAPI()
+# The application scoped resources (database connections, repositories, caches and executors) are managed by the
+# startup and shutdown events
+app = FastAPI(on_startup=[resources.startup], on_shutdown=[resources.shutdown])
 app.include_router(categories.router)
 app.include_router(quizzes.router)
 app.include_router(users.router)
+app.include_router(metrics.router)
+app.add_middleware(MetricsMiddleware)
 
 if __name__ == "__main__":
     # noinspection PyTypeChecker
@@ -3,10 +3,32 @@ from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from starlette import status
 
+from settings import get_settings
+from utilities import BoundedExecutor, LRUCache
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Verified access tokens (token -> username), a token is cached until it expires (at most for the cache ttl)
+access_token_cache = LRUCache(maxsize=get_settings().principal_cache_size, ttl=get_settings().principal_cache_ttl)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 credentials_exception = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
     detail="Could not validate credentials",
     headers={"WWW-Authenticate": "Bearer"},
 )
+service_unavailable_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Too many concurrent authentication requests, try again later",
+    headers={"Retry-After": "1"},
+)
+
+
+def create_password_executor() -> BoundedExecutor:
+    """
+    Creates the executor that hashes and verifies passwords. bcrypt releases the GIL, so a small dedicated thread pool
+    hashes in parallel without occupying the threadpool that executes the database calls.
+    The executor is application scoped (see resources.AppResources)
+    :return: Bounded executor
+    """
+    return BoundedExecutor(max_workers=get_settings().password_hash_workers,
+                           queue_size=get_settings().password_hash_queue_size,
+                           thread_name_prefix="password")
@@ -1,11 +1,16 @@
 from datetime import timedelta, datetime
 from typing import Optional
+from uuid import uuid4
 # noinspection PyPackageRequirements
 from jose import jwt, JWTError, ExpiredSignatureError
 # noinspection PyPackageRequirements
 from jose.exceptions import JWTClaimsError
 
-from . import pwd_context, credentials_exception
+from utilities import BoundedExecutor, ExecutorSaturatedError
+from . import pwd_context, credentials_exception, service_unavailable_exception
+
+# Value of the "type" claim, access tokens have no type claim
+REFRESH_TOKEN_TYPE = "refresh"
 
 
 def verify_password(plain_password, hashed_password):
@@ -27,6 +32,35 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+async def verify_password_async(executor: BoundedExecutor, plain_password, hashed_password):
+    """
+    Validates a plain text password with a hashed password in the password executor
+    :param executor: Password executor
+    :param plain_password: Plain text user password
+    :param hashed_password: Hashed user password (from DB)
+    :raises HTTPException: 503 if the password executor is saturated
+    :return: True or False
+    """
+    try:
+        return await executor.run(verify_password, plain_password, hashed_password)
+    except ExecutorSaturatedError:
+        raise service_unavailable_exception
+
+
+async def get_password_hash_async(executor: BoundedExecutor, password):
+    """
+    Calculates the password hash in the password executor
+    :param executor: Password executor
+    :param password: Plain text password
+    :raises HTTPException: 503 if the password executor is saturated
+    :return: Password hash
+    """
+    try:
+        return await executor.run(get_password_hash, password)
+    except ExecutorSaturatedError:
+        raise service_unavailable_exception
+
+
 def create_access_token(*, data: dict, secret_key: str, algorithm: str, expires_delta: Optional[timedelta] = None):
     """
 
@@ -46,19 +80,53 @@ def create_access_token(*, data: dict, secret_key: str, algorithm: str, expires_
     return encoded_jwt
 
 
-def get_username_from_access_token(token: str, secret_key: str, algorithm: str) -> Optional[str]:
+def create_refresh_token(*, subject: str, secret_key: str, algorithm: str, expires_delta: timedelta) -> str:
+    """
+    Creates a refresh token, a refresh token can be exchanged for new access tokens until it expires or is revoked
+    :param subject: Username
+    :param secret_key: The secret key that should be used for token encoding
+    :param algorithm: The algorith that should be used for token encoding (like HS256)
+    :param expires_delta: Lifetime timespan of the token
+    :return: JWT refresh token (the "jti" claim identifies the token for the revocation)
+    """
+    return jwt.encode({
+        "sub": subject,
+        "type": REFRESH_TOKEN_TYPE,
+        "jti": uuid4().hex,
+        "exp": datetime.utcnow() + expires_delta
+    }, secret_key, algorithm=algorithm)
+
+
+def get_claims_from_access_token(token: str, secret_key: str, algorithm: str) -> dict:
     """
-    Decodes a token and returns the "sub" (= username) of the decoded token
+    Decodes and verifies an access token and returns the claims of the decoded token
     :param token: JWT access token
     :param secret_key: The secret key that should be used for token decoding
     :param algorithm: The algorith that should be used for token decoding (like HS256)
-    :return: Username
+    :return: Claims (contains at least the "sub" (= username))
     """
     try:
         payload = jwt.decode(token, secret_key, algorithms=[algorithm])
-        username: str = payload.get("sub")
-        if not username:
-            raise credentials_exception
-        return username
     except (JWTError, ExpiredSignatureError, JWTClaimsError):
         raise credentials_exception
+    # Refresh tokens are not accepted as access tokens
+    if not payload.get("sub") or "type" in payload:
+        raise credentials_exception
+    return payload
+
+
+def get_claims_from_refresh_token(token: str, secret_key: str, algorithm: str) -> dict:
+    """
+    Decodes and verifies a refresh token and returns the claims of the decoded token (the revocation is not checked)
+    :param token: JWT refresh token
+    :param secret_key: The secret key that should be used for token decoding
+    :param algorithm: The algorith that should be used for token decoding (like HS256)
+    :return: Claims (contains at least the "sub" (= username), "jti" and "exp")
+    """
+    try:
+        payload = jwt.decode(token, secret_key, algorithms=[algorithm])
+    except (JWTError, ExpiredSignatureError, JWTClaimsError):
+        raise credentials_exception
+    if payload.get("type") != REFRESH_TOKEN_TYPE or not all(payload.get(claim) for claim in ("sub", "jti", "exp")):
+        raise credentials_exception
+    return payload
@@ -0,0 +1,55 @@
+"""
+Benchmark: per document cost of converting a raw MongoDB quiz document into the domain model.
+
+- legacy: orm model instantiation (as done by iterating a queryset) -> to_json -> json.loads -> domain model
+- raw: raw document (as_pymongo) -> convert_son2dict -> domain model
+
+Usage: python -m benchmarks.conversion [question count] [document count]
+"""
+import json
+import sys
+from timeit import timeit
+
+import schemas
+from orm.models import Answer, Category, Question, Quiz, User
+from orm.repositories import QuizRepository
+
+
+def create_quiz_son(question_count: int) -> dict:
+    """
+    Creates a raw MongoDB quiz document
+    :param question_count: Number of questions (each question has 4 answers)
+    :return: Raw MongoDB document
+    """
+    quiz = Quiz(
+        identifier=1,
+        title="Benchmark Quiz",
+        description="A quiz for benchmarking",
+        owner=User(email="john.doe@gmail.com"),
+        categories=[Category(identifier=1), Category(identifier=2)],
+        questions=[Question(identifier=q, title=f"Question {q}", answers=[
+            Answer(identifier=q * 4 + a, answer_text=f"Answer {a}", is_correct=a == 0) for a in range(4)
+        ]) for q in range(question_count)]
+    )
+    return quiz.to_mongo().to_dict()
+
+
+def convert_legacy(son: dict) -> schemas.Quiz:
+    document: Quiz = Quiz._from_son(son)
+    return schemas.Quiz(**json.loads(document.to_json(use_db_field=False)))
+
+
+def main(question_count: int = 50, document_count: int = 1000):
+    son = create_quiz_son(question_count)
+    repository = QuizRepository()
+    assert convert_legacy(son) == repository._convert_son2domainmodel(son)
+
+    print(f"Quiz documents with {question_count} questions, {document_count} conversions")
+    legacy = timeit(lambda: convert_legacy(son), number=document_count) / document_count
+    raw = timeit(lambda: repository._convert_son2domainmodel(son), number=document_count) / document_count
+    print(f"legacy: {legacy * 1e6:10.1f} us/document")
+    print(f"raw:    {raw * 1e6:10.1f} us/document ({legacy / raw:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,298 @@
+"""
+Benchmark suite: latency percentiles and throughput of the API routes (on top of the in-memory repository backend,
+seeded with a realistic dataset, no MongoDB is required) and micro benchmarks of grading, conversions and schema
+validation. Routes that are served from the caches are measured with warm caches (.cached) and with cleared caches
+(.uncached, the cost of the handler and the repositories).
+
+The results are saved as JSON and compared against a baseline, the run fails (exit code 1) if the median latency of
+a benchmark regressed by more than the threshold.
+
+Usage: python -m benchmarks.suite [--quizzes N] [--questions N] [--iterations N] [--output FILE]
+                                  [--baseline FILE] [--threshold RATIO] [--save-baseline]
+"""
+import argparse
+import json
+import random
+import sys
+from math import ceil
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+from fastapi.testclient import TestClient
+
+import schemas
+import services
+from app import app
+from auth import create_password_executor
+from auth.utilities import get_password_hash
+from dependencies import get_password_executor, get_repository_container, login_rate_limit, signup_rate_limit
+from orm.async_repositories import ThreadPoolRepositoryContainer
+from orm.memory_repositories import MemoryDatabase, MemoryRepositoryContainer
+from orm.models import Answer, Question, Quiz
+from orm.repositories import QuizRepository, RepositoryContainerBase, answer_key_cache, category_cache, \
+    principal_cache
+from response_cache import category_response_cache, quiz_list_response_cache, quiz_response_cache
+
+USER_PASSWORD = "Benchmark2022!"
+# Distinct question sets, the quizzes share them to keep the memory usage of large datasets low
+QUESTION_SETS = 20
+
+
+def percentile(latencies: List[float], ratio: float) -> float:
+    """
+    Nearest rank percentile
+    :param latencies: Sorted latencies
+    :param ratio: Percentile between 0 and 1 (e.g. 0.95)
+    :return: Latency
+    """
+    return latencies[max(0, ceil(ratio * len(latencies)) - 1)]
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 3,
+            setup: Optional[Callable[[], object]] = None) -> dict:
+    """
+    Measures the latency of a function
+    :param fn: Benchmarked function
+    :param iterations: Number of measured calls
+    :param warmup: Number of calls before the measurement
+    :param setup: Called before every call, not measured (e.g. clears the caches)
+    :return: Result (iterations, latency percentiles in milliseconds and throughput per second)
+    """
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        fn()
+        latencies.append(perf_counter() - start)
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "mean_ms": sum(latencies) / iterations * 1000,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "throughput_per_s": iterations / sum(latencies)
+    }
+
+
+def create_questions(question_count: int, first_identifier: int) -> List[schemas.Question]:
+    """
+    Creates questions with 4 answers each (the first answer is correct)
+    :param question_count: Number of questions
+    :param first_identifier: First question identifier
+    :return: Questions
+    """
+    return [schemas.Question(identifier=first_identifier + q, title=f"Question {q}", answers=[
+        schemas.Answer(identifier=(first_identifier + q) * 4 + a, answer_text=f"Answer {a}", is_correct=a == 0)
+        for a in range(4)
+    ]) for q in range(question_count)]
+
+
+def create_submit(quiz: schemas.Quiz) -> dict:
+    """
+    Creates a quiz submit with the correct answers
+    :param quiz: Quiz
+    :return: Quiz submit (json)
+    """
+    return schemas.QuizSubmit(identifier=quiz.identifier, questions=[
+        schemas.QuestionSubmit(identifier=question.identifier, answers=[
+            schemas.AnswerSubmit(identifier=answer.identifier, is_correct=answer.is_correct)
+            for answer in question.answers
+        ]) for question in quiz.questions
+    ]).dict()
+
+
+def seed_container(quiz_count: int, question_count: int, category_count: int = 50,
+                   user_count: int = 100) -> RepositoryContainerBase:
+    """
+    Creates an in-memory repository container with a reproducible dataset
+    :param quiz_count: Number of quizzes
+    :param question_count: Number of questions per quiz (each question has 4 answers)
+    :param category_count: Number of categories
+    :param user_count: Number of users (all users have the same password)
+    :return: In-memory repository container
+    """
+    rng = random.Random(42)
+    database = MemoryDatabase()
+    container = MemoryRepositoryContainer(database)
+    for c in range(1, category_count + 1):
+        container.category.persist(
+            schemas.CategoryInDb(identifier=c, title=f"Category {c}", description=f"Benchmark category {c}"))
+    password_hash = get_password_hash(USER_PASSWORD)
+    for u in range(user_count):
+        container.user.persist(schemas.UserInDb(email=f"user{u}@example.com", first_name="Bench", last_name="Mark",
+                                                disabled=False, password_hash=password_hash))
+    # The quizzes are stored directly, persist would copy the shared question sets
+    question_sets = [create_questions(question_count, s * question_count + 1) for s in range(QUESTION_SETS)]
+    quiz_collection = database.get_collection(Quiz, schemas.Quiz)
+    for q in range(1, quiz_count + 1):
+        quiz_collection.put(schemas.Quiz(identifier=q, title=f"Quiz {q}", description=f"Benchmark quiz {q}",
+                                         owner=f"user{rng.randrange(user_count)}@example.com",
+                                         categories=rng.sample(range(1, category_count + 1), 2),
+                                         questions=question_sets[q % QUESTION_SETS]))
+    database.observe_sequence_value(Quiz.identifier.get_sequence_id(), quiz_count)
+    database.observe_sequence_value(Question.identifier.get_sequence_id(), QUESTION_SETS * question_count)
+    database.observe_sequence_value(Answer.identifier.get_sequence_id(), (QUESTION_SETS + 1) * question_count * 4)
+    return container
+
+
+def clear_data_caches():
+    """
+    Clears the caches of the quizzes and categories (answer keys, category snapshot and responses)
+    :return: None
+    """
+    answer_key_cache.clear()
+    category_cache.invalidate()
+    for response_cache in (quiz_response_cache, quiz_list_response_cache, category_response_cache):
+        response_cache.clear()
+
+
+def run_route_benchmarks(container: RepositoryContainerBase, iterations: int) -> Dict[str, dict]:
+    """
+    Benchmarks the API routes with the test client
+    :param container: Seeded repository container
+    :param iterations: Number of measured requests of the cheap routes (bcrypt routes use a tenth)
+    :return: Results by benchmark name
+    """
+    rng = random.Random(7)
+    quizzes = container.quiz.filter(limit=0)
+    submits = [create_submit(quiz) for quiz in rng.sample(quizzes, min(len(quizzes), 50))]
+    new_quiz = {"title": "New Quiz", "description": "Created by the benchmark", "categories": [1, 2],
+                "questions": [{"title": f"Question {q}", "answers": [
+                    {"answer_text": f"Answer {a}", "is_correct": a == 0} for a in range(4)]} for q in range(10)]}
+    login = {"username": "user0@example.com", "password": USER_PASSWORD}
+
+    def request(method: str, url: str, **kwargs):
+        response = client.request(method, url, **kwargs)
+        assert response.status_code == 200, f"{method} {url}: {response.status_code}"
+        return response
+
+    password_executor = create_password_executor()
+    app.dependency_overrides[get_repository_container] = lambda: ThreadPoolRepositoryContainer(container,
+                                                                                               password_executor)
+    app.dependency_overrides[get_password_executor] = lambda: password_executor
+    app.dependency_overrides[login_rate_limit] = lambda: None
+    app.dependency_overrides[signup_rate_limit] = lambda: None
+    try:
+        client = TestClient(app)
+        token = request("POST", "/users/token", data=login).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        heavy_iterations = max(5, iterations // 10)
+        # Routes that are served from the response or answer key caches
+        cached_routes = {
+            "route.read_quizzes": lambda: request("GET", "/quizzes/", params={"limit": 20}),
+            "route.read_quizzes_summary": lambda: request("GET", "/quizzes/", params={"limit": 100, "view": "summary"}),
+            "route.read_quiz": lambda: request("GET", f"/quizzes/{rng.choice(quizzes).identifier}"),
+            "route.validate_quiz": lambda: request("POST", "/quizzes/validate", json=rng.choice(submits))
+        }
+        results = {}
+        for name, fn in cached_routes.items():
+            results[f"{name}.cached"] = measure(fn, iterations)
+            results[f"{name}.uncached"] = measure(fn, iterations, setup=clear_data_caches)
+        return {
+            **results,
+            "route.create_quiz": measure(
+                lambda: request("POST", "/quizzes/", json=new_quiz, headers=headers), heavy_iterations),
+            "route.token": measure(lambda: request("POST", "/users/token", data=login), heavy_iterations, warmup=1)
+        }
+    finally:
+        for dependency in (get_repository_container, get_password_executor, login_rate_limit, signup_rate_limit):
+            app.dependency_overrides.pop(dependency, None)
+        password_executor.shutdown()
+
+
+def run_micro_benchmarks(container: RepositoryContainerBase, iterations: int) -> Dict[str, dict]:
+    """
+    Benchmarks grading, conversions and schema validation
+    :param container: Seeded repository container
+    :param iterations: Number of measured calls
+    :return: Results by benchmark name
+    """
+    quiz: schemas.Quiz = container.quiz.get(1)
+    submit = schemas.QuizSubmit(**create_submit(quiz))
+    answer_key = services.compile_answer_key(quiz)
+    quiz_dict = quiz.dict()
+    upsert_dict = schemas.QuizUpsert(**quiz_dict).dict()
+    # The conversions of the MongoDB repository (no database access)
+    repository = QuizRepository()
+    document = repository._convert2dbmodel(quiz)
+    son = document.to_mongo().to_dict()
+    return {
+        "micro.validate_quiz": measure(lambda: services.validate_quiz(quiz, submit), iterations),
+        "micro.grade_quiz": measure(lambda: services.grade_quiz(answer_key, submit), iterations),
+        "micro.convert2domainmodel": measure(lambda: repository._convert2domainmodel(document), iterations),
+        "micro.convert_son2domainmodel": measure(lambda: repository._convert_son2domainmodel(son), iterations),
+        "micro.quiz_validation": measure(lambda: schemas.Quiz(**quiz_dict), iterations),
+        "micro.quiz_upsert_validation": measure(lambda: schemas.QuizUpsert(**upsert_dict), iterations)
+    }
+
+
+def compare_results(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """
+    Compares the median latencies with a baseline
+    :param results: Results by benchmark name
+    :param baseline: Baseline results by benchmark name (benchmarks that are not in the baseline are skipped)
+    :param threshold: Allowed slowdown ratio (e.g. 0.25 -> 25% slower)
+    :return: Descriptions of the regressions
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        ratio = result["p50_ms"] / expected["p50_ms"] - 1
+        if ratio > threshold:
+            regressions.append(f"{name}: p50 {result['p50_ms']:.3f} ms, baseline {expected['p50_ms']:.3f} ms "
+                               f"(+{ratio:.0%})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Runs the benchmark suite")
+    parser.add_argument("--quizzes", type=int, default=2000, help="Number of seeded quizzes")
+    parser.add_argument("--questions", type=int, default=100, help="Number of questions per quiz")
+    parser.add_argument("--iterations", type=int, default=100, help="Number of measured calls per benchmark")
+    parser.add_argument("--output", default="benchmark-results.json", help="Result file")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json", help="Baseline file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed median slowdown (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Saves the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    # The caches are process wide, start without entries of other datasets
+    clear_data_caches()
+    principal_cache.clear()
+
+    container = seed_container(args.quizzes, args.questions)
+    results = {**run_route_benchmarks(container, args.iterations), **run_micro_benchmarks(container, args.iterations)}
+    for name, result in results.items():
+        print(f"{name:40} p50 {result['p50_ms']:9.3f} ms  p95 {result['p95_ms']:9.3f} ms  "
+              f"p99 {result['p99_ms']:9.3f} ms  {result['throughput_per_s']:10.1f}/s")
+
+    report = {"parameters": {"quizzes": args.quizzes, "questions": args.questions, "iterations": args.iterations},
+              "results": results}
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        return 0
+
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print(f"No baseline found ({args.baseline}), use --save-baseline to create one")
+        return 0
+    if baseline["parameters"] != report["parameters"]:
+        print("The baseline was created with different parameters, the results are not compared")
+        return 0
+    regressions = compare_results(results, baseline["results"], args.threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
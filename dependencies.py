@@ -1,42 +1,85 @@
-from typing import Optional
-from fastapi import Depends, HTTPException
+from math import ceil
+from time import time
+from typing import List, Optional
+from fastapi import Depends, Form, HTTPException, Request
+from pydantic import BaseModel
 
 import schemas
-from orm.repositories import RepositoryContainerBase, RepositoryContainer
+from orm.async_repositories import AsyncRepositoryContainerBase
 from settings import get_settings
-from auth import oauth2_scheme, credentials_exception
-from auth.utilities import get_username_from_access_token
+from auth import access_token_cache, oauth2_scheme, credentials_exception
+from auth.utilities import get_claims_from_access_token
+from rate_limiting import RateLimiter
+from resources import resources
 from schemas import UserInDb
+from utilities import BoundedExecutor, encode_cursor, decode_cursor, first_or_default
 
+# Rate limiters of the authentication endpoints (bcrypt is the most expensive operation of the API)
+login_ip_limiter = RateLimiter("login_ip", rate=get_settings().rate_limit_ip_rate,
+                               capacity=get_settings().rate_limit_ip_burst)
+login_username_limiter = RateLimiter("login_username", rate=get_settings().rate_limit_username_rate,
+                                     capacity=get_settings().rate_limit_username_burst)
+signup_ip_limiter = RateLimiter("signup_ip", rate=get_settings().rate_limit_ip_rate,
+                                capacity=get_settings().rate_limit_ip_burst)
+rate_limiters = [login_ip_limiter, login_username_limiter, signup_ip_limiter]
 
-def get_repository_container() -> RepositoryContainerBase:
+# Sort orders for paginated queries, the identifier is the tie-breaker (keyset pagination requires a unique order)
+SORT_ORDERS = {
+    "identifier": ["identifier"],
+    "-identifier": ["-identifier"],
+    "title": ["title", "identifier"],
+    "-title": ["-title", "-identifier"]
+}
+# Types of the cursor values by sort field, the values are part of the database query (a dict would be an operator)
+CURSOR_VALUE_TYPES = {
+    "identifier": int,
+    "title": str
+}
+
+
+async def get_repository_container() -> AsyncRepositoryContainerBase:
     """
-    Returns the repositoy container that holds all available repositories
+    Returns the repositoy container that holds all available repositories.
+    The container is application scoped, it is created on startup (see resources.AppResources)
     :return: Repository Container
     """
-    return RepositoryContainer()
+    return resources.repository_container
+
+
+async def get_password_executor() -> BoundedExecutor:
+    """
+    Returns the executor that hashes and verifies the passwords.
+    The executor is application scoped, it is created on startup (see resources.AppResources)
+    :return: Password executor
+    """
+    return resources.password_executor
 
 
-def get_user_from_token(*,
-                        token: str = Depends(oauth2_scheme),
-                        db: RepositoryContainerBase = Depends(get_repository_container)
-                        ) -> Optional[UserInDb]:
+async def get_user_from_token(*,
+                              token: str = Depends(oauth2_scheme),
+                              db: AsyncRepositoryContainerBase = Depends(get_repository_container)
+                              ) -> Optional[UserInDb]:
     """
     Extracts the current user from the JWT Token
     :param db: Repository Container
     :param token: JWT access token
     :return: Current user
     """
-    settings = get_settings()
-    username = get_username_from_access_token(token=token,
+    username = access_token_cache.get(token)
+    if username is None:
+        settings = get_settings()
+        claims = get_claims_from_access_token(token=token,
                                               secret_key=settings.auth_secret_key,
                                               algorithm=settings.auth_algorithm)
+        username = claims["sub"]
+        if "exp" in claims:
+            access_token_cache.put(token, username, ttl=claims["exp"] - time())
     # noinspection PyTypeChecker
-    user: Optional[schemas.UserInDb] = db.user.get(username)
+    user: Optional[schemas.UserInDb] = await db.user.get_principal(username)
     return user
 
 
-def get_current_active_user(current_user: UserInDb = Depends(get_user_from_token)) -> Optional[UserInDb]:
+async def get_current_active_user(current_user: UserInDb = Depends(get_user_from_token)) -> Optional[UserInDb]:
     """
     Extracts the current user and checks if the user is enabled
     :return: Current active user
@@ -46,18 +89,89 @@ def get_current_active_user(current_user: UserInDb = Depends(get_user_from_token
     return current_user
 
 
-def common_filter_parameters(skip: int = 0, limit: int = 100) -> dict:
+async def common_filter_parameters(skip: int = 0, limit: int = 100, sort: str = "identifier",
+                                   cursor: Optional[str] = None, q: Optional[str] = None) -> dict:
     """
     Provides common query parameters
     :param skip: How many records should be skipped
     :param limit: The maximum item count (only values between 0 and 1000 are allowed)
+    :param sort: Sort order, one of identifier, -identifier, title or -title ("-" for descending)
+    :param cursor: Continues with the next page, the cursor of the next page is returned in the X-Next-Cursor header
+    (unlike skip, the cost of a page does not depend on the page depth)
+    :param q: Full text search (title and description), the results are ordered by relevance and the sort order.
+    Search results are paginated with skip and limit (cursors are not supported)
     :return: Common query parameters dict
     """
     if skip < 0:
         raise HTTPException(status_code=400, detail=f"Value for skip ({skip}) is invalid")
     if limit < 0 or limit > 1000:
         raise HTTPException(status_code=400, detail=f"Value for limit ({limit}) is invalid")
-    return {
+    if sort not in SORT_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Value for sort ({sort}) is invalid")
+    parameters = {
         "skip": skip,
-        "limit": limit
+        "limit": limit,
+        "order_by": SORT_ORDERS[sort]
     }
+    if q:
+        if cursor is not None:
+            raise HTTPException(status_code=400, detail="Cursor pagination is not supported for search queries")
+        parameters["search"] = q
+    if cursor is not None:
+        pagination = decode_cursor(cursor)
+        if pagination is None or pagination.get("sort") != sort or \
+                not isinstance(pagination.get("after"), list) or len(pagination["after"]) != len(SORT_ORDERS[sort]) or \
+                any(type(value) is not CURSOR_VALUE_TYPES[field.lstrip("-")]
+                    for field, value in zip(SORT_ORDERS[sort], pagination["after"])):
+            raise HTTPException(status_code=400, detail="Value for cursor is invalid")
+        parameters["after"] = pagination["after"]
+    return parameters
+
+
+def check_rate_limit(limiter: RateLimiter, key: str):
+    """
+    Takes a token from the bucket of a key
+    :param limiter: Rate limiter
+    :param key: Bucket key (e.g. client IP)
+    :raises HTTPException: 429 if the bucket is empty, the Retry-After header contains the seconds to wait
+    :return: None
+    """
+    retry_after = limiter.acquire(key)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many requests",
+                            headers={"Retry-After": str(ceil(retry_after))})
+
+
+async def login_rate_limit(request: Request, username: Optional[str] = Form(None)):
+    """
+    Rate limits the login per client IP and per username
+    :param request: Request
+    :param username: Username of the login form
+    :return: None
+    """
+    check_rate_limit(login_ip_limiter, request.client.host)
+    if username:
+        check_rate_limit(login_username_limiter, username.lower())
+
+
+async def signup_rate_limit(request: Request):
+    """
+    Rate limits the signup per client IP
+    :param request: Request
+    :return: None
+    """
+    check_rate_limit(signup_ip_limiter, request.client.host)
+
+
+def get_next_cursor(items: List[BaseModel], commons: dict) -> Optional[str]:
+    """
+    Creates the cursor of the next page
+    :param items: Items of the current page
+    :param commons: Common query parameters
+    :return: Cursor or None if there is no next page
+    """
+    if not commons["limit"] or len(items) < commons["limit"] or "search" in commons:
+        return None
+    order_by = commons["order_by"]
+    sort = first_or_default(key for key, value in SORT_ORDERS.items() if value == order_by)
+    return encode_cursor({"sort": sort, "after": [getattr(items[-1], field.lstrip("-")) for field in order_by]})
@@ -0,0 +1,251 @@
+import logging
+from collections import defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from pymongo import monitoring
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from settings import get_settings
+
+# Registry of all API metrics, exposed in the Prometheus text format on /metrics
+registry = CollectorRegistry()
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Latency of HTTP requests",
+                             ["method", "route", "status"], registry=registry)
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "Number of HTTP requests in progress",
+                             ["method", "route"], registry=registry)
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Size of HTTP response bodies", ["method", "route"],
+                          buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000), registry=registry)
+DB_COMMAND_DURATION = Histogram("mongodb_command_duration_seconds", "Latency of MongoDB commands",
+                                ["route", "repository_method", "command"], registry=registry)
+DB_COMMAND_FAILURES = Counter("mongodb_command_failures", "Number of failed MongoDB commands", ["command"],
+                              registry=registry)
+# Many commands per request indicate N+1 query patterns
+DB_COMMANDS_PER_REQUEST = Histogram("mongodb_commands_per_request", "Number of MongoDB commands per HTTP request",
+                                    ["route"], buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100), registry=registry)
+
+UNKNOWN = "unknown"
+
+
+class CommandRecord(NamedTuple):
+    """
+    MongoDB command that was executed during a request
+    """
+    repository_method: str
+    command: str
+    duration: float
+
+
+class RequestStats:
+    """
+    Statistics of the current request, collected by the middleware and the command listener
+    """
+
+    def __init__(self, route: str):
+        """
+        Initializes the statistics
+        :param route: Route template (e.g. /quizzes/{quiz_id})
+        """
+        self.route = route
+        self.commands: List[CommandRecord] = []
+
+    def breakdown(self) -> Dict[str, Dict[str, float]]:
+        """
+        Aggregates the MongoDB commands by repository method and command name
+        :return: Dict of "repository method/command" and count and total duration in milliseconds
+        """
+        result = defaultdict(lambda: {"count": 0, "duration_ms": 0.0})
+        for record in self.commands:
+            entry = result[f"{record.repository_method}/{record.command}"]
+            entry["count"] += 1
+            entry["duration_ms"] += record.duration * 1000
+        return dict(result)
+
+
+# Context of the current request and repository method (the threadpool copies the context into the worker thread)
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+repository_method: ContextVar[str] = ContextVar("repository_method", default=UNKNOWN)
+
+
+def call_repository_method(name: str, fn: Callable, *args, **kwargs):
+    """
+    Calls a repository method, the MongoDB commands of the call are tagged with the method name
+    :param name: Repository method name (e.g. QuizRepository.get)
+    :param fn: Repository method
+    :param args: Positional arguments
+    :param kwargs: Keyword arguments
+    :return: Result of the repository method
+    """
+    token = repository_method.set(name)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        repository_method.reset(token)
+
+
+def record_command(method: str, command: str, duration: float):
+    """
+    Records the latency of a MongoDB command, tagged by the route of the current request and the repository method
+    :param method: Repository method name
+    :param command: Command name (e.g. find)
+    :param duration: Duration in seconds
+    :return: None
+    """
+    stats = request_stats.get()
+    DB_COMMAND_DURATION.labels(stats.route if stats else UNKNOWN, method, command).observe(duration)
+    if stats is not None:
+        stats.commands.append(CommandRecord(method, command, duration))
+
+
+async def record_async_command(method: str, command: str, awaitable: Awaitable):
+    """
+    Awaits a MongoDB command of the async (motor) driver and records its latency.
+    Motor executes the commands in its own thread pool, which does not copy the context of the request, therefore
+    the commands are recorded here instead of by the command listener (the motor client has no command listener)
+    :param method: Repository method name (e.g. AsyncMongoRepository(Quiz).filter_raw)
+    :param command: Command name (e.g. find)
+    :param awaitable: Motor operation
+    :return: Result of the operation
+    """
+    start = perf_counter()
+    try:
+        return await awaitable
+    except PyMongoError as e:
+        # A duplicate key is a write error of a successful command (like the command listener reports it)
+        if not isinstance(e, DuplicateKeyError):
+            DB_COMMAND_FAILURES.labels(command).inc()
+        raise
+    finally:
+        record_command(method, command, perf_counter() - start)
+
+
+class DatabaseCommandListener(monitoring.CommandListener):
+    """
+    Records the latency of MongoDB commands (of the mongoengine connection), tagged by route and repository method
+    """
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        record_command(repository_method.get(), event.command_name, event.duration_micros / 1_000_000)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        DB_COMMAND_FAILURES.labels(event.command_name).inc()
+        record_command(repository_method.get(), event.command_name, event.duration_micros / 1_000_000)
+
+
+command_listener = DatabaseCommandListener()
+
+
+def get_route_template(scope: Scope) -> str:
+    """
+    Returns the route template of a request, the template is used as metrics label (bounded cardinality)
+    :param scope: ASGI scope
+    :return: Route template or "unmatched"
+    """
+    for route in getattr(scope.get("app"), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware, records the latency, the in-flight requests and the response size per route
+    and logs slow requests with the breakdown of the MongoDB commands
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method, route = scope["method"], get_route_template(scope)
+        stats = RequestStats(route)
+        token = request_stats.set(stats)
+        status, size = 500, 0
+
+        async def send_wrapper(message: Message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = perf_counter() - start
+            in_progress.dec()
+            request_stats.reset(token)
+            REQUEST_DURATION.labels(method, route, str(status)).observe(duration)
+            RESPONSE_SIZE.labels(method, route).observe(size)
+            DB_COMMANDS_PER_REQUEST.labels(route).observe(len(stats.commands))
+            if duration >= get_settings().slow_request_threshold:
+                self.logger.warning("Slow request %s %s (%d): %.1f ms, %d MongoDB commands %s", method, route,
+                                    status, duration * 1000, len(stats.commands), stats.breakdown())
+
+
+class StatsCollector:
+    """
+    Exposes the counters of the caches, rate limiters, executors and single flights
+    (which do not depend on prometheus_client)
+    """
+
+    def __init__(self, caches: Dict[str, object], rate_limiters: Iterable,
+                 executors: Union[Dict[str, object], Callable[[], Dict[str, object]]],
+                 single_flights: Optional[Dict[str, object]] = None):
+        """
+        Initializes the collector
+        :param caches: Caches by name (objects with hits, misses and optionally __len__)
+        :param rate_limiters: Rate limiters (objects with name, allowed and rejected)
+        :param executors: Bounded executors by name (objects with rejected), or a callable that returns them
+        (application scoped executors exist only while the application is started)
+        :param single_flights: Call coalescing by name (objects with calls and collapsed)
+        """
+        self.caches = caches
+        self.rate_limiters = list(rate_limiters)
+        self.executors = executors
+        self.single_flights = single_flights or {}
+
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "Number of cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Number of cache misses", labels=["cache"])
+        items = GaugeMetricFamily("cache_items", "Number of cached items", labels=["cache"])
+        for name, cache in self.caches.items():
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+            if hasattr(cache, "__len__"):
+                items.add_metric([name], len(cache))
+        allowed = CounterMetricFamily("rate_limit_allowed", "Number of allowed requests", labels=["limiter"])
+        rejected = CounterMetricFamily("rate_limit_rejected", "Number of rejected requests", labels=["limiter"])
+        for limiter in self.rate_limiters:
+            allowed.add_metric([limiter.name], limiter.allowed)
+            rejected.add_metric([limiter.name], limiter.rejected)
+        executor_rejected = CounterMetricFamily("executor_rejected", "Number of tasks rejected by saturated executors",
+                                                labels=["executor"])
+        executors = self.executors() if callable(self.executors) else self.executors
+        for name, executor in executors.items():
+            executor_rejected.add_metric([name], executor.rejected)
+        calls = CounterMetricFamily("single_flight_calls", "Number of coalescable calls", labels=["flight"])
+        collapsed = CounterMetricFamily("single_flight_collapsed", "Number of calls that joined a call in flight",
+                                        labels=["flight"])
+        for name, single_flight in self.single_flights.items():
+            calls.add_metric([name], single_flight.calls)
+            collapsed.add_metric([name], single_flight.collapsed)
+        return [hits, misses, items, allowed, rejected, executor_rejected, calls, collapsed]
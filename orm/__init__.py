@@ -1,5 +1,41 @@
-from mongoengine import connect
+from functools import lru_cache
+from typing import List, Optional
+from pymongo import monitoring
+from mongoengine import connect, disconnect
+from mongoengine.connection import DEFAULT_DATABASE_NAME
+
 from settings import get_settings
 
-# Connect to MongoDB
-connect(host=get_settings().mongodb_conn_str)
+
+def connect_database(event_listeners: Optional[List[monitoring.CommandListener]] = None):
+    """
+    Connects mongoengine to MongoDB (the connection pool is owned by the pymongo client)
+    :param event_listeners: Command listeners of the client (e.g. instrumentation.command_listener)
+    :return: pymongo client
+    """
+    return connect(host=get_settings().mongodb_conn_str, event_listeners=event_listeners or [])
+
+
+def disconnect_database():
+    """
+    Closes the mongoengine connection and the motor client (if it was created)
+    :return: None
+    """
+    disconnect()
+    if get_motor_database.cache_info().currsize:
+        get_motor_database().client.close()
+        get_motor_database.cache_clear()
+
+
+@lru_cache()
+def get_motor_database():
+    """
+    Returns the cached async (motor) database, uses the same database as the mongoengine connection
+    :return: Motor database
+    """
+    # Motor is only required by the async repository backend, therefore it is imported lazily
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    # The commands are recorded by the async repositories (see instrumentation.record_async_command)
+    client = AsyncIOMotorClient(get_settings().mongodb_conn_str)
+    return client.get_default_database(DEFAULT_DATABASE_NAME)
@@ -0,0 +1,611 @@
+from abc import ABC, abstractmethod
+from mongoengine import Document, EmbeddedDocument, ListField, EmbeddedDocumentField, NotUniqueError
+from mongoengine.queryset.transform import query as transform_query
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Union, TYPE_CHECKING
+
+import schemas
+import services
+from . import get_motor_database
+from .in_memory import query_models, supports_query
+from .models import Category, Quiz, RevokedToken, User
+from .sequences import BlockSequenceField
+from .repositories import RepositoryBase, RepositoryContainerBase, answer_key_cache, async_quiz_flights, \
+    build_find_arguments, category_cache, CategorySnapshot, convert_son2dict, invalidate_categories, invalidate_quiz, \
+    principal_cache, QUIZ_SUMMARY_PROJECTION
+from schemas import CategoryInDb as CategoryModel, Quiz as QuizModel, UserInDb as UserModel
+from utilities import BoundedExecutor, first_or_default
+from auth.utilities import verify_password_async
+from instrumentation import call_repository_method, record_async_command
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+
+class AsyncRepositoryBase(ABC):
+    """
+    Async base repository class, async counterpart of the RepositoryBase
+    """
+
+    @abstractmethod
+    async def get(self, key):
+        """
+        Gets an entity by id/primary key
+        :param key: Entity primary key
+        :return: Entity object
+        """
+        ...
+
+    @abstractmethod
+    async def filter(self, **kwargs):
+        """
+        Filters an entity
+        :param kwargs: Filter operations
+        :return: List of entities
+        """
+        ...
+
+    @abstractmethod
+    async def count(self, **kwargs) -> int:
+        """
+        Counts the entities that match the filter operations (server side)
+        :param kwargs: Filter operations
+        :return: Number of matching entities
+        """
+        ...
+
+    @abstractmethod
+    async def exists(self, **kwargs) -> bool:
+        """
+        Checks if at least one entity matches the filter operations (without loading the entities)
+        :param kwargs: Filter operations
+        :return: True or False
+        """
+        ...
+
+    @abstractmethod
+    async def persist(self, item):
+        """
+        Saves or updates an entity
+        :param item: Entity to save
+        :return: The saved entity
+        """
+        ...
+
+    @abstractmethod
+    async def insert_unique(self, item):
+        """
+        Inserts an entity, relies on the unique indexes (primary key and unique fields) instead of a prior lookup.
+        The unique indexes are a precondition, the startup fails if one is missing (see resources.AppResources)
+        :param item: Entity to insert
+        :raises NotUniqueError: If an entity with the same primary key or unique field value already exists
+        :return: The inserted entity
+        """
+        ...
+
+    @abstractmethod
+    async def delete(self, item):
+        """
+        Deletes an entity
+        :param item: The entity that should be deleted
+        :return: None
+        """
+        ...
+
+
+async def _assign_sequence_values(database: "AsyncIOMotorDatabase", document: Union[Document, EmbeddedDocument],
+                                  record: Callable[[Awaitable], Awaitable]):
+    """
+    Assigns the missing sequence values of a document and its embedded documents.
+    Accessing an unset SequenceField would generate the value with a blocking call, so this has to happen upfront.
+    :param database: Motor database
+    :param document: Orm model
+    :param record: Awaits and records the counter updates (see instrumentation.record_async_command)
+    :return: None
+    """
+    for name, field in document._fields.items():
+        if isinstance(field, BlockSequenceField) and document._data.get(name) is None:
+            document._data[name] = await field.generate_async(database, record)
+        elif isinstance(field, ListField) and isinstance(field.field, EmbeddedDocumentField):
+            for embedded_document in document._data.get(name) or []:
+                await _assign_sequence_values(database, embedded_document, record)
+
+
+class AsyncMongoRepository(AsyncRepositoryBase, ABC):
+    """
+    Base MongoDB repository class based on the async motor driver
+    """
+
+    def __init__(self, dbmodel: Document, database: Optional["AsyncIOMotorDatabase"] = None):
+        """
+        Async MongoDB base repository
+        :param dbmodel: Orm class type
+        :param database: Motor database (default is the database of the configured connection)
+        """
+        self._dbmodel = dbmodel
+        self._database = database or get_motor_database()
+        self._collection = self._database[dbmodel._get_collection_name()]
+        # Prefix of the repository method names of the recorded commands (e.g. AsyncMongoRepository(Quiz).filter_raw)
+        self._name = f"{type(self).__name__}({dbmodel.__name__})"
+
+    def _recorder(self, method: str, command: str) -> Callable[[Awaitable], Awaitable]:
+        """
+        Creates a function that awaits and records the commands of a repository method
+        :param method: Repository method name (e.g. persist)
+        :param command: Command name (e.g. findAndModify)
+        :return: Recorder, see instrumentation.record_async_command
+        """
+        return lambda operation: record_async_command(f"{self._name}.{method}", command, operation)
+
+    async def get(self, key):
+        return first_or_default(await self.filter(pk=key, limit=1))
+
+    async def filter(self, **kwargs) -> List[Document]:
+        return [self._dbmodel._from_son(son) for son in await self.filter_raw(**kwargs)]
+
+    async def count(self, **kwargs) -> int:
+        return await record_async_command(f"{self._name}.count", "aggregate", self._collection.count_documents(
+            transform_query(self._dbmodel, **kwargs)))
+
+    async def exists(self, **kwargs) -> bool:
+        return await record_async_command(f"{self._name}.exists", "find", self._collection.find_one(
+            transform_query(self._dbmodel, **kwargs), {"_id": 1})) is not None
+
+    async def filter_raw(self, **kwargs) -> List[dict]:
+        """
+        Filters an entity and returns the raw MongoDB documents (no orm models are instantiated)
+        :param kwargs: Filter operations and options, see build_find_arguments
+        :return: List of raw MongoDB documents
+        """
+        cursor = self._collection.find(**build_find_arguments(self._dbmodel, **kwargs))
+        return await record_async_command(f"{self._name}.filter_raw", "find", cursor.to_list(length=None))
+
+    async def persist(self, item: Document) -> Document:
+        await _assign_sequence_values(self._database, item, self._recorder("persist", "findAndModify"))
+        item.validate()
+        # The whole document is replaced, so the local document already reflects the stored one (no reload)
+        await record_async_command(f"{self._name}.persist", "update", self._collection.replace_one(
+            {"_id": item.pk}, item.to_mongo(), upsert=True))
+        return item
+
+    async def insert_unique(self, item: Document) -> Document:
+        await _assign_sequence_values(self._database, item, self._recorder("insert_unique", "findAndModify"))
+        item.validate()
+        try:
+            await record_async_command(f"{self._name}.insert_unique", "insert",
+                                       self._collection.insert_one(item.to_mongo()))
+        except DuplicateKeyError as e:
+            raise NotUniqueError(str(e))
+        return item
+
+    async def delete(self, item: Document):
+        await record_async_command(f"{self._name}.delete", "delete", self._collection.delete_one({"_id": item.pk}))
+
+
+# noinspection PyCallingNonCallable
+class AsyncDomainRepository(AsyncRepositoryBase, ABC):
+    """
+    Handles the interaction with domain models with the database
+    Async counterpart of the DomainRepository
+    """
+    def __init__(self, dbmodel: Document, model: BaseModel):
+        """
+        Initialites an async domain repository
+        :param dbmodel: Orm class type
+        :param model: Pydantic class type
+        """
+        self._dbmodel = dbmodel
+        self._model = model
+        self._repository = AsyncMongoRepository(dbmodel)
+
+    async def get(self, key) -> BaseModel:
+        return first_or_default(await self.filter(pk=key, limit=1))
+
+    async def filter(self, **kwargs) -> List[BaseModel]:
+        return list(map(self._convert_son2domainmodel, await self._repository.filter_raw(**kwargs)))
+
+    async def count(self, **kwargs) -> int:
+        return await self._repository.count(**kwargs)
+
+    async def exists(self, **kwargs) -> bool:
+        return await self._repository.exists(**kwargs)
+
+    def _convert2dbmodel(self, item: BaseModel):
+        """
+        Converts a domain model to a orm model
+        :param item: Pydantic domain model
+        :return: Converted domain model (orm model)
+        """
+        return self._dbmodel(**item.dict())
+
+    def _convert2domainmodel(self, item: Document):
+        """
+        Converts an orm model to a domain model
+        :param item: Orm model
+        :return: Pydantic domain model
+        """
+        return self._convert_son2domainmodel(item.to_mongo())
+
+    def _convert_son2domainmodel(self, son: dict):
+        """
+        Converts a raw MongoDB document to a domain model
+        :param son: Raw MongoDB document
+        :return: Pydantic domain model
+        """
+        return self._model(**convert_son2dict(self._dbmodel, son))
+
+    async def persist(self, item: BaseModel):
+        db_item = await self._repository.persist(self._convert2dbmodel(item))
+        return self._convert2domainmodel(db_item)
+
+    async def insert_unique(self, item: BaseModel):
+        db_item = await self._repository.insert_unique(self._convert2dbmodel(item))
+        return self._convert2domainmodel(db_item)
+
+    async def delete(self, item: BaseModel):
+        await self._repository.delete(self._convert2dbmodel(item))
+
+
+# noinspection PyTypeChecker
+class AsyncUserRepository(AsyncDomainRepository):
+    """
+    Async domain user repository
+    """
+    def __init__(self, password_executor: BoundedExecutor):
+        """
+        Initializes the repository
+        :param password_executor: Executor that verifies the passwords
+        """
+        super().__init__(dbmodel=User, model=UserModel)
+        self._password_executor = password_executor
+        self._revoked_tokens = AsyncMongoRepository(RevokedToken)
+
+    async def authenticate_user(self, email: str, password: str) -> Optional[UserModel]:
+        """
+        Validates user credentials
+        :param email: User email
+        :param password: User plain text password
+        :return:
+        """
+        user: UserModel = await self.get(email)
+        if user is None:
+            return None
+        # bcrypt is CPU bound, it runs in the bounded password executor
+        if not await verify_password_async(self._password_executor, password, user.password_hash):
+            return None
+        return user
+
+    async def revoke_refresh_token(self, jti: str, expires_at: datetime):
+        """
+        Revokes a refresh token, see UserRepository.revoke_refresh_token
+        :param jti: Token ID ("jti" claim)
+        :param expires_at: Expiration of the token (UTC)
+        :return: None
+        """
+        await self._revoked_tokens.persist(RevokedToken(jti=jti, expires_at=expires_at))
+
+    async def is_refresh_token_revoked(self, jti: str) -> bool:
+        """
+        Checks if a refresh token is revoked (primary key lookup)
+        :param jti: Token ID ("jti" claim)
+        :return: True if the token is revoked
+        """
+        return await self._revoked_tokens.exists(pk=jti)
+
+    async def get_principal(self, email: str) -> Optional[UserModel]:
+        """
+        Gets an authenticated user, see UserRepository.get_principal
+        :param email: User email
+        :return: User or None if the user does not exist
+        """
+        user = principal_cache.get(email)
+        if user is None:
+            generation = principal_cache.generation
+            user = await self.get(email)
+            if user is not None:
+                principal_cache.put(email, user, generation=generation)
+        return user
+
+    async def persist(self, item: UserModel) -> UserModel:
+        user = await super().persist(item)
+        principal_cache.invalidate(item.email)
+        return user
+
+    async def insert_unique(self, item: UserModel) -> UserModel:
+        user = await super().insert_unique(item)
+        principal_cache.invalidate(item.email)
+        return user
+
+    async def delete(self, item: UserModel):
+        await super().delete(item)
+        principal_cache.invalidate(item.email)
+
+
+# noinspection PyTypeChecker
+class AsyncCategoryRepository(AsyncDomainRepository):
+    """
+    Async domain category repository
+    """
+    def __init__(self):
+        super().__init__(dbmodel=Category, model=CategoryModel)
+
+    async def get_snapshot(self) -> CategorySnapshot:
+        """
+        Gets the cached snapshot of all categories, see CategoryRepository.get_snapshot
+        :return: Category snapshot
+        """
+        snapshot = category_cache.get()
+        if snapshot is None:
+            generation = category_cache.generation
+            snapshot = CategorySnapshot.create(await super().filter(limit=0))
+            category_cache.put(snapshot, generation=generation)
+        return snapshot
+
+    async def get(self, key) -> Optional[CategoryModel]:
+        return (await self.get_snapshot()).by_identifier.get(key)
+
+    async def get_by_title(self, title: str) -> Optional[CategoryModel]:
+        """
+        Gets a category by title
+        :param title: Category title
+        :return: Category or None if the category does not exist
+        """
+        return (await self.get_snapshot()).by_title.get(title)
+
+    async def filter(self, **kwargs) -> List[CategoryModel]:
+        if not supports_query(**kwargs):
+            return await super().filter(**kwargs)
+        return query_models((await self.get_snapshot()).categories, "identifier", **kwargs)
+
+    async def count(self, **kwargs) -> int:
+        if not supports_query(**kwargs):
+            return await super().count(**kwargs)
+        return len(query_models((await self.get_snapshot()).categories, "identifier", limit=0, **kwargs))
+
+    async def exists(self, **kwargs) -> bool:
+        if not supports_query(**kwargs):
+            return await super().exists(**kwargs)
+        return bool(query_models((await self.get_snapshot()).categories, "identifier", limit=1, **kwargs))
+
+    async def persist(self, item: CategoryModel) -> CategoryModel:
+        category = await super().persist(item)
+        invalidate_categories()
+        return category
+
+    async def insert_unique(self, item: CategoryModel) -> CategoryModel:
+        category = await super().insert_unique(item)
+        invalidate_categories()
+        return category
+
+    async def delete(self, item: CategoryModel):
+        await super().delete(item)
+        invalidate_categories()
+
+
+# noinspection PyTypeChecker
+class AsyncQuizRepository(AsyncDomainRepository):
+    """
+    Async domain quiz repository
+    """
+    def __init__(self):
+        super().__init__(dbmodel=Quiz, model=QuizModel)
+
+    def _convert2dbmodel(self, item: schemas.Quiz):
+        # References are stored as primary keys, so they can be built from the ids without fetching the documents
+        db_model: Quiz = self._dbmodel(**item.dict(exclude={"owner", "categories"}))
+        db_model.owner = User(email=item.owner)
+        db_model.categories = [Category(identifier=category_id) for category_id in item.categories or []]
+        return db_model
+
+    async def get(self, key) -> Optional[schemas.Quiz]:
+        """
+        Gets a quiz, concurrent lookups of the same quiz share one database query and conversion.
+        The returned quiz is shared by the coalesced callers and must not be modified
+        :param key: Quiz ID
+        :return: Quiz or None if the quiz does not exist
+        """
+        return await async_quiz_flights.do(("get", key), super().get, key)
+
+    async def get_answer_key(self, key) -> Optional[services.AnswerKey]:
+        """
+        Gets the compiled answer key of a quiz, see QuizRepository.get_answer_key.
+        Concurrent cache misses of the same quiz compile the answer key once
+        :param key: Quiz ID
+        :return: Answer key or None if the quiz does not exist
+        """
+        answer_key = answer_key_cache.get(key)
+        if answer_key is None:
+            answer_key = await async_quiz_flights.do(("answer_key", key), self._load_answer_key, key)
+        return answer_key
+
+    async def _load_answer_key(self, key) -> Optional[services.AnswerKey]:
+        """
+        Loads, compiles and caches the answer key of a quiz
+        :param key: Quiz ID
+        :return: Answer key or None if the quiz does not exist
+        """
+        generation = answer_key_cache.generation
+        quiz: schemas.Quiz = await self.get(key)
+        if quiz is None:
+            return None
+        answer_key = services.compile_answer_key(quiz)
+        answer_key_cache.put(key, answer_key, generation=generation)
+        return answer_key
+
+    async def get_answer_keys(self, keys: List[int]) -> Dict[int, services.AnswerKey]:
+        """
+        Gets the compiled answer keys of multiple quizzes, see QuizRepository.get_answer_keys
+        :param keys: Quiz IDs
+        :return: Dict of quiz ID and answer key (quizzes that do not exist are not included)
+        """
+        answer_keys = {key: answer_key_cache.get(key) for key in set(keys)}
+        missing_keys = [key for key, answer_key in answer_keys.items() if answer_key is None]
+        if missing_keys:
+            generation = answer_key_cache.generation
+            quiz: schemas.Quiz
+            for quiz in await self.filter(identifier__in=missing_keys, limit=len(missing_keys)):
+                answer_key = services.compile_answer_key(quiz)
+                answer_key_cache.put(quiz.identifier, answer_key, generation=generation)
+                answer_keys[quiz.identifier] = answer_key
+        return {key: answer_key for key, answer_key in answer_keys.items() if answer_key is not None}
+
+    async def filter_summaries(self, **kwargs) -> List[schemas.QuizSummary]:
+        """
+        Filters quizzes and returns the quiz summaries (the questions are not loaded)
+        :param kwargs: Filter operations
+        :return: List of quiz summaries
+        """
+        return [schemas.QuizSummary(**convert_son2dict(self._dbmodel, son), question_count=son["question_count"])
+                for son in await self._repository.filter_raw(**kwargs, projection=QUIZ_SUMMARY_PROJECTION)]
+
+    async def persist(self, item: schemas.Quiz):
+        quiz: schemas.Quiz = await super().persist(item)
+        invalidate_quiz(quiz.identifier)
+        return quiz
+
+    async def delete(self, item: schemas.Quiz):
+        await super().delete(item)
+        invalidate_quiz(item.identifier)
+
+
+class ThreadPoolRepository(AsyncRepositoryBase):
+    """
+    Exposes a (blocking) repository through the async repository interface,
+    every call is executed in the threadpool
+    """
+    def __init__(self, repository: RepositoryBase):
+        """
+        Wraps a sync repository
+        :param repository: Sync repository
+        """
+        self._repository = repository
+
+    async def _run(self, name: str, *args, **kwargs):
+        method = getattr(self._repository, name)
+        # The MongoDB commands are tagged with the repository method (see instrumentation.DatabaseCommandListener)
+        return await run_in_threadpool(call_repository_method, f"{type(self._repository).__name__}.{name}",
+                                       method, *args, **kwargs)
+
+    async def get(self, key):
+        return await self._run("get", key)
+
+    async def filter(self, **kwargs):
+        return await self._run("filter", **kwargs)
+
+    async def count(self, **kwargs) -> int:
+        return await self._run("count", **kwargs)
+
+    async def exists(self, **kwargs) -> bool:
+        return await self._run("exists", **kwargs)
+
+    async def persist(self, item):
+        return await self._run("persist", item)
+
+    async def insert_unique(self, item):
+        return await self._run("insert_unique", item)
+
+    async def delete(self, item):
+        return await self._run("delete", item)
+
+    def __getattr__(self, name):
+        # Repository specific methods (e.g. authenticate_user)
+        attribute = getattr(self._repository, name)
+        if not callable(attribute):
+            return attribute
+
+        async def run(*args, **kwargs):
+            return await self._run(name, *args, **kwargs)
+        return run
+
+
+class ThreadPoolUserRepository(ThreadPoolRepository):
+    """
+    Exposes a (blocking) user repository through the async repository interface,
+    the password verification is executed in the bounded password executor instead of the threadpool
+    """
+    def __init__(self, repository: RepositoryBase, password_executor: BoundedExecutor):
+        """
+        Wraps a sync user repository
+        :param repository: Sync user repository
+        :param password_executor: Executor that verifies the passwords
+        """
+        super().__init__(repository)
+        self._password_executor = password_executor
+
+    async def authenticate_user(self, email: str, password: str) -> Optional[UserModel]:
+        """
+        Validates user credentials
+        :param email: User email
+        :param password: User plain text password
+        :return: User or None if the credentials are invalid
+        """
+        user: UserModel = await self.get(email)
+        if user is None:
+            return None
+        if not await verify_password_async(self._password_executor, password, user.password_hash):
+            return None
+        return user
+
+
+class ThreadPoolQuizRepository(ThreadPoolRepository):
+    """
+    Exposes a (blocking) quiz repository through the async repository interface,
+    concurrent lookups of the same quiz are coalesced before they occupy threadpool workers
+    """
+    async def get(self, key):
+        return await async_quiz_flights.do(("get", key), self._run, "get", key)
+
+    async def get_answer_key(self, key) -> Optional[services.AnswerKey]:
+        """
+        Gets the compiled answer key of a quiz, see QuizRepository.get_answer_key.
+        Cached answer keys are returned without a threadpool worker
+        :param key: Quiz ID
+        :return: Answer key or None if the quiz does not exist
+        """
+        answer_key = answer_key_cache.get(key)
+        if answer_key is None:
+            answer_key = await async_quiz_flights.do(("answer_key", key), self._run, "get_answer_key", key)
+        return answer_key
+
+
+class AsyncRepositoryContainerBase(ABC):
+    """
+    Async repository container, holds references to all the available async repositories
+    """
+    def __init__(self,
+                 category_repository: AsyncRepositoryBase,
+                 quiz_repository: AsyncRepositoryBase,
+                 user_repository: AsyncRepositoryBase):
+        self.category = category_repository
+        self.quiz = quiz_repository
+        self.user = user_repository
+
+
+class AsyncRepositoryContainer(AsyncRepositoryContainerBase):
+    def __init__(self, password_executor: BoundedExecutor):
+        """
+        Creates the async (motor) repositories
+        :param password_executor: Executor that verifies the passwords
+        """
+        super().__init__(
+            category_repository=AsyncCategoryRepository(),
+            quiz_repository=AsyncQuizRepository(),
+            user_repository=AsyncUserRepository(password_executor)
+        )
+
+
+class ThreadPoolRepositoryContainer(AsyncRepositoryContainerBase):
+    def __init__(self, container: RepositoryContainerBase, password_executor: BoundedExecutor):
+        """
+        Exposes the repositories of a sync repository container as async repositories
+        :param container: Sync repository container
+        :param password_executor: Executor that verifies the passwords
+        """
+        super().__init__(
+            category_repository=ThreadPoolRepository(container.category),
+            quiz_repository=ThreadPoolQuizRepository(container.quiz),
+            user_repository=ThreadPoolUserRepository(container.user, password_executor)
+        )
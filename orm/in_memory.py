@@ -0,0 +1,124 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Options of the repository filter (see build_find_arguments) and the subset that can be evaluated in memory
+OPTIONS = {"skip", "limit", "projection", "order_by", "after", "search"}
+SUPPORTED_OPTIONS = {"skip", "limit", "order_by", "after"}
+# Filter operators that can be evaluated in memory (None is equality)
+SUPPORTED_OPERATORS = {None, "in", "icontains"}
+
+
+def split_filter_key(key: str) -> Tuple[str, Optional[str]]:
+    """
+    Splits a mongoengine style filter key (e.g. title__icontains) into field name and operator
+    :param key: Filter key
+    :return: Field name and operator (None for equality)
+    """
+    field_name, _, operator = key.partition("__")
+    return field_name, operator or None
+
+
+def supports_query(**kwargs) -> bool:
+    """
+    Checks if the repository filter arguments can be evaluated in memory
+    :param kwargs: Filter operations and options, see build_find_arguments
+    :return: True if query_models supports all arguments
+    """
+    return all(key in SUPPORTED_OPTIONS if key in OPTIONS else split_filter_key(key)[1] in SUPPORTED_OPERATORS
+               for key in kwargs)
+
+
+def matches(value: Any, operator: Optional[str], operand: Any) -> bool:
+    """
+    Evaluates a filter operator with the MongoDB semantics, list values match if one of the items matches
+    :param value: Field value
+    :param operator: Operator (None for equality)
+    :param operand: Filter value
+    :return: True if the value matches
+    """
+    if isinstance(value, list) and not isinstance(operand, list):
+        return any(matches(item, operator, operand) for item in value)
+    if operator == "in":
+        return any(matches(value, None, item) for item in operand)
+    if operator == "icontains":
+        return value is not None and str(operand).lower() in str(value).lower()
+    return value == operand
+
+
+def parse_filters(primary_key: str, **kwargs) -> List[Tuple[str, Optional[str], Any]]:
+    """
+    Parses mongoengine style filter operations (without options)
+    :param primary_key: Field name of the primary key (pk filters are mapped to it)
+    :param kwargs: Filter operations (e.g. title__icontains="quiz")
+    :return: List of field name, operator and operand
+    """
+    filters = []
+    for key, operand in kwargs.items():
+        field_name, operator = split_filter_key(key)
+        filters.append((primary_key if field_name == "pk" else field_name, operator, operand))
+    return filters
+
+
+def matches_filters(item, filters: List[Tuple[str, Optional[str], Any]]) -> bool:
+    """
+    Checks if a model matches all filters
+    :param item: Model
+    :param filters: Parsed filters, see parse_filters
+    :return: True if all filters match
+    """
+    return all(matches(getattr(item, field_name), operator, operand) for field_name, operator, operand in filters)
+
+
+def text_score(item, search: str, weights: Dict[str, float]) -> float:
+    """
+    Simplified full text search score (whole words, no stemming and no stop words)
+    :param item: Model
+    :param search: Search terms
+    :param weights: Weights of the text fields (e.g. title 10, description 2)
+    :return: Relevance score, 0 if no term matches
+    """
+    terms = search.lower().split()
+    score = 0
+    for field_name, weight in weights.items():
+        words = (getattr(item, field_name) or "").lower().split()
+        score += weight * sum(term in words for term in terms)
+    return score
+
+
+def sort_key(value: Any) -> tuple:
+    """
+    Sort key of a field value, None is ordered before all other values (like MongoDB)
+    :param value: Field value
+    :return: Sort key
+    """
+    return (0, 0) if value is None else (1, value)
+
+
+def _is_after(item, sort: List[Tuple[str, bool]], after: list) -> bool:
+    for (field_name, descending), value in zip(sort, after):
+        item_key, after_key = sort_key(getattr(item, field_name)), sort_key(value)
+        if item_key != after_key:
+            return item_key < after_key if descending else item_key > after_key
+    return False
+
+
+def query_models(items: Iterable, primary_key: str, **kwargs) -> list:
+    """
+    Evaluates repository filter arguments on in-memory models, see supports_query for the supported arguments
+    :param items: Models (e.g. pydantic domain models)
+    :param primary_key: Field name of the primary key (pk filters and sort orders are mapped to it)
+    :param kwargs: Filter operations and options, see build_find_arguments
+    :return: Matching models
+    """
+    limit, skip = kwargs.pop("limit", 100), kwargs.pop("skip", 0)
+    order_by, after = kwargs.pop("order_by", None), kwargs.pop("after", None)
+    filters = parse_filters(primary_key, **kwargs)
+    rows = [item for item in items if matches_filters(item, filters)]
+
+    if order_by:
+        sort = [(primary_key if field.lstrip("-") == "pk" else field.lstrip("-"), field.startswith("-"))
+                for field in order_by]
+        for field_name, descending in reversed(sort):
+            rows.sort(key=lambda row: sort_key(getattr(row, field_name)), reverse=descending)
+        if after is not None:
+            rows = [row for row in rows if _is_after(row, sort, after)]
+    return rows[skip:skip + limit] if limit else rows[skip:]
@@ -0,0 +1,227 @@
+"""
+Index management of the MongoDB collections.
+The indexes are declared in the meta of the orm models, this module creates missing indexes, reports missing and
+extra indexes and explains the winning plans of the query shapes that are used by the API.
+
+Usage: python -m orm.indexes [--check] [--explain]
+"""
+import argparse
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, Type
+from mongoengine import Document
+
+from . import connect_database
+from .models import Category, Quiz, RevokedToken, User
+from .repositories import build_find_arguments
+
+# Documents whose indexes are managed
+DOCUMENTS: List[Type[Document]] = [User, RevokedToken, Category, Quiz]
+
+IndexKey = List[tuple]
+
+
+class IndexSpec(NamedTuple):
+    """
+    Index key and the options that change the behaviour of an index (two indexes with the same key but different
+    options are different indexes, e.g. a non-unique index does not prevent duplicates)
+    """
+    key: IndexKey
+    unique: bool = False
+    expire_after_seconds: Optional[int] = None
+    weights: Optional[Dict[str, int]] = None
+
+    def __str__(self):
+        options = {"unique": self.unique, "expireAfterSeconds": self.expire_after_seconds, "weights": self.weights}
+        return " ".join([str(self.key)] + [f"{name}={value}" for name, value in options.items() if value])
+
+
+class QueryShape(NamedTuple):
+    """
+    Query shape of an API endpoint, the values are placeholders (the plan only depends on the shape)
+    """
+    name: str
+    dbmodel: Type[Document]
+    query: Dict[str, Any]
+
+
+class IndexReport(NamedTuple):
+    """
+    Result of the index check of a collection
+    """
+    collection: str
+    missing: List[IndexSpec]
+    extra: List[IndexSpec]
+    created: bool
+
+
+class PlanReport(NamedTuple):
+    """
+    Winning plan of a query shape
+    """
+    name: str
+    stages: List[str]
+
+    @property
+    def collection_scan(self) -> bool:
+        """
+        :return: True if the winning plan scans the whole collection
+        """
+        return "COLLSCAN" in self.stages
+
+
+# Query shapes of read_quizzes and read_categories (sort orders see dependencies.SORT_ORDERS)
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape("quizzes", Quiz, {"order_by": ["identifier"]}),
+    QueryShape("quizzes by title", Quiz, {"order_by": ["title", "identifier"]}),
+    QueryShape("quizzes by owner", Quiz, {"owner": "owner@example.com", "order_by": ["identifier"]}),
+    QueryShape("quizzes by categories", Quiz, {"categories__in": [1, 2], "order_by": ["identifier"]}),
+    QueryShape("quizzes search", Quiz, {"search": "quiz", "order_by": ["identifier"]}),
+    QueryShape("quizzes title contains", Quiz, {"title__icontains": "quiz", "order_by": ["title", "identifier"]}),
+    QueryShape("categories", Category, {"order_by": ["identifier"]}),
+    QueryShape("categories by title", Category, {"order_by": ["title", "identifier"]}),
+    QueryShape("categories search", Category, {"search": "category", "order_by": ["identifier"]}),
+]
+
+
+def _normalize_index_key(key: IndexKey) -> IndexKey:
+    # The field order of a text index is irrelevant (MongoDB returns the fields in the order of the weights)
+    if any(direction == "text" for _, direction in key):
+        return sorted(key)
+    return list(key)
+
+
+def get_declared_indexes(dbmodel: Type[Document]) -> List[IndexSpec]:
+    """
+    Returns the indexes that are declared in the meta (and by unique fields) of a document
+    :param dbmodel: Orm class type
+    :return: Index specs, including the index of the primary key
+    """
+    indexes = [IndexSpec(key=[("_id", 1)])]
+    for spec in dbmodel._meta["index_specs"]:
+        key = _normalize_index_key(spec["fields"])
+        weights = None
+        if any(direction == "text" for _, direction in key):
+            # MongoDB weights the fields of a text index with 1 by default
+            weights = {field: 1 for field, _ in key}
+            weights.update(spec.get("weights", {}))
+        indexes.append(IndexSpec(key=key, unique=bool(spec.get("unique", False)),
+                                 expire_after_seconds=spec.get("expireAfterSeconds"), weights=weights))
+    return indexes
+
+
+def get_existing_indexes(dbmodel: Type[Document]) -> List[IndexSpec]:
+    """
+    Returns the existing indexes of the collection of a document
+    :param dbmodel: Orm class type
+    :return: Index specs
+    """
+    indexes = []
+    for info in dbmodel._get_collection().index_information().values():
+        key = list(info["key"])
+        weights = None
+        if key[0][0] == "_fts":
+            weights = dict(info.get("weights", {}))
+            key = [(field, "text") for field in weights]
+        indexes.append(IndexSpec(key=_normalize_index_key(key), unique=bool(info.get("unique", False)),
+                                 expire_after_seconds=info.get("expireAfterSeconds"), weights=weights))
+    return indexes
+
+
+def compare_indexes(dbmodel: Type[Document]) -> Dict[str, List[IndexSpec]]:
+    """
+    Compares the declared indexes of a document with the existing indexes of the collection,
+    the keys and the options (unique, expireAfterSeconds and the weights of text indexes) have to match
+    :param dbmodel: Orm class type
+    :return: Dict with the missing and extra index specs
+    """
+    required = get_declared_indexes(dbmodel)
+    existing = get_existing_indexes(dbmodel)
+    return {
+        "missing": [key for key in required if key not in existing],
+        "extra": [key for key in existing if key not in required]
+    }
+
+
+def check_indexes(documents: Optional[List[Type[Document]]] = None, create: bool = True) -> List[IndexReport]:
+    """
+    Checks the indexes of the documents and optionally creates the missing indexes.
+    The creation fails (OperationFailure) if an index with the same key but other options exists, such an index has to
+    be dropped manually
+    :param documents: Orm class types (default are all managed documents)
+    :param create: If true, missing indexes are created
+    :return: Index report per collection (missing are the indexes that were missing before the creation)
+    """
+    reports = []
+    for dbmodel in documents or DOCUMENTS:
+        result = compare_indexes(dbmodel)
+        created = create and bool(result["missing"])
+        if created:
+            dbmodel.ensure_indexes()
+        reports.append(IndexReport(collection=dbmodel._get_collection_name(),
+                                   missing=result["missing"],
+                                   extra=result["extra"],
+                                   created=created))
+    return reports
+
+
+def _collect_stages(plan: dict) -> List[str]:
+    stages = [plan["stage"]] if "stage" in plan else []
+    if "inputStage" in plan:
+        stages.extend(_collect_stages(plan["inputStage"]))
+    for input_stage in plan.get("inputStages", []):
+        stages.extend(_collect_stages(input_stage))
+    return stages
+
+
+def explain_query_shape(shape: QueryShape) -> PlanReport:
+    """
+    Explains the winning plan of a query shape
+    :param shape: Query shape
+    :return: Plan report, contains the stages of the winning plan
+    """
+    find_arguments = build_find_arguments(shape.dbmodel, **shape.query)
+    explanation = shape.dbmodel._get_collection().find(**find_arguments).explain()
+    return PlanReport(name=shape.name, stages=_collect_stages(explanation["queryPlanner"]["winningPlan"]))
+
+
+def explain_query_shapes(shapes: Optional[List[QueryShape]] = None) -> List[PlanReport]:
+    """
+    Explains the winning plans of the query shapes
+    :param shapes: Query shapes (default are the query shapes of the API)
+    :return: Plan report per query shape
+    """
+    return [explain_query_shape(shape) for shape in shapes or QUERY_SHAPES]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point
+    :param argv: Command line arguments
+    :return: Exit code, 1 if indexes are missing (--check) or a query shape uses a collection scan
+    """
+    parser = argparse.ArgumentParser(description="Creates and verifies the MongoDB indexes")
+    parser.add_argument("--check", action="store_true", help="Only report missing indexes, do not create them")
+    parser.add_argument("--explain", action="store_true", help="Explain the winning plan of each query shape")
+    args = parser.parse_args(argv)
+    connect_database()
+
+    exit_code = 0
+    for report in check_indexes(create=not args.check):
+        status = "created" if report.created else "missing"
+        for key in report.missing:
+            print(f"{report.collection}: {status} index {key}")
+        for key in report.extra:
+            print(f"{report.collection}: extra index {key}")
+        if report.missing and not report.created:
+            exit_code = 1
+
+    if args.explain:
+        for plan in explain_query_shapes():
+            print(f"{plan.name}: {' -> '.join(plan.stages)}")
+            if plan.collection_scan:
+                exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
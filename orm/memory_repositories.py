@@ -0,0 +1,451 @@
+import json
+import os
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import datetime
+from itertools import islice
+from threading import RLock
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Type, Union
+from mongoengine import Document, EmbeddedDocument, EmbeddedDocumentField, ListField, NotUniqueError
+from pydantic import BaseModel
+from pydantic.json import pydantic_encoder
+
+import schemas
+from .in_memory import matches_filters, parse_filters, query_models, supports_query, text_score
+from .models import Category, Quiz, User
+from .sequences import BlockSequenceField
+from .repositories import CategoryRepository, DomainRepository, QuizRepository, RepositoryContainerBase, \
+    UserRepository
+from schemas import CategoryInDb as CategoryModel, Quiz as QuizModel, UserInDb as UserModel
+
+
+class MemoryCollection:
+    """
+    Thread-safe in-memory collection of domain models.
+    The primary keys are kept sorted and the indexed fields have hash indexes (list fields are indexed by their
+    items, like MongoDB multikey indexes), so lookups and pages in primary key order do not scan the collection.
+    """
+
+    def __init__(self, primary_key: str, indexed_fields: Iterable[str] = (), unique_fields: Iterable[str] = (),
+                 text_weights: Optional[Dict[str, float]] = None):
+        """
+        Initializes an empty collection
+        :param primary_key: Field name of the primary key
+        :param indexed_fields: Field names of the hash indexes
+        :param unique_fields: Field names of the unique indexes (in addition to the primary key)
+        :param text_weights: Weights of the text search fields (e.g. title 10, description 2)
+        """
+        self.primary_key = primary_key
+        self.unique_fields = tuple(unique_fields)
+        self.text_weights = text_weights or {}
+        self._items: Dict[Any, BaseModel] = {}
+        self._keys: List = []  # Sorted primary keys
+        self._indexes: Dict[str, Dict[Any, Set]] = {field_name: defaultdict(set)
+                                                    for field_name in {*indexed_fields, *self.unique_fields}}
+        self._lock = RLock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key) -> Optional[BaseModel]:
+        """
+        Gets a model by primary key
+        :param key: Primary key
+        :return: Model or None if the key does not exist
+        """
+        return self._items.get(key)
+
+    def filter(self, **kwargs) -> List[BaseModel]:
+        """
+        Filters the models. Equality and in filters on the primary key and indexed fields are answered by the indexes,
+        results in primary key order are paginated on the sorted primary keys.
+        :param kwargs: Filter operations and options, see build_find_arguments
+        (the projection is ignored, the complete models are returned)
+        :raises ValueError: If a filter operator is not supported
+        :return: Matching models
+        """
+        limit, skip = kwargs.pop("limit", 100), kwargs.pop("skip", 0)
+        order_by, after, search = kwargs.pop("order_by", None), kwargs.pop("after", None), kwargs.pop("search", None)
+        kwargs.pop("projection", None)
+        if not supports_query(**kwargs):
+            raise ValueError(f"Unsupported filter operations: {', '.join(kwargs)}")
+        filters = parse_filters(self.primary_key, **kwargs)
+        order_by = order_by or [self.primary_key]
+        with self._lock:
+            keys = self._find_keys(filters)
+            if search:
+                # The order by fields are tie-breakers of the relevance (like the MongoDB text search)
+                scores = {}
+                for item in self._select(keys):
+                    score = text_score(item, search, self.text_weights)
+                    if score > 0 and matches_filters(item, filters):
+                        scores[getattr(item, self.primary_key)] = score
+                rows = query_models(map(self._items.get, scores), self.primary_key, order_by=order_by, limit=0)
+                rows.sort(key=lambda row: scores[getattr(row, self.primary_key)], reverse=True)
+                return rows[skip:skip + limit] if limit else rows[skip:]
+            if [field.lstrip("-") for field in order_by] not in (["pk"], [self.primary_key]):
+                return query_models(self._select(keys), self.primary_key, order_by=order_by, after=after,
+                                    skip=skip, limit=limit, **kwargs)
+            ordered_keys = self._ordered_keys(keys, order_by[0].startswith("-"), after[0] if after else None)
+            rows = (item for item in map(self._items.get, ordered_keys) if matches_filters(item, filters))
+            return list(islice(rows, skip, skip + limit if limit else None))
+
+    def count(self, **kwargs) -> int:
+        """
+        Counts the models that match the filter operations
+        :param kwargs: Filter operations
+        :return: Number of matching models
+        """
+        if not kwargs:
+            return len(self._items)
+        return len(self.filter(**kwargs, limit=0))
+
+    def exists(self, **kwargs) -> bool:
+        """
+        Checks if at least one model matches the filter operations
+        :param kwargs: Filter operations
+        :return: True or False
+        """
+        return bool(self.filter(**kwargs, limit=1))
+
+    def put(self, item: BaseModel, insert: bool = False):
+        """
+        Inserts or replaces a model
+        :param item: Model
+        :param insert: Only inserts, an existing primary key is a duplicate
+        :raises NotUniqueError: If the primary key (only for inserts) or a unique field value already exists
+        :return: None
+        """
+        key = getattr(item, self.primary_key)
+        with self._lock:
+            if insert and key in self._items:
+                raise NotUniqueError(f"Duplicate value for {self.primary_key}")
+            for field_name in self.unique_fields:
+                if any(other != key for other in self._indexes[field_name].get(getattr(item, field_name), ())):
+                    raise NotUniqueError(f"Duplicate value for {field_name}")
+            previous = self._items.get(key)
+            if previous is None:
+                insort(self._keys, key)
+            else:
+                self._unindex(key, previous)
+            self._items[key] = item
+            self._index(key, item)
+
+    def remove(self, key):
+        """
+        Removes a model
+        :param key: Primary key
+        :return: None
+        """
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self._unindex(key, item)
+                del self._keys[bisect_left(self._keys, key)]
+
+    def documents(self) -> List[dict]:
+        """
+        :return: All models as dicts, in primary key order
+        """
+        with self._lock:
+            return [self._items[key].dict() for key in self._keys]
+
+    @staticmethod
+    def _index_values(value) -> list:
+        return value if isinstance(value, list) else [value]
+
+    def _index(self, key, item: BaseModel):
+        for field_name, index in self._indexes.items():
+            for value in self._index_values(getattr(item, field_name)):
+                index[value].add(key)
+
+    def _unindex(self, key, item: BaseModel):
+        for field_name, index in self._indexes.items():
+            for value in self._index_values(getattr(item, field_name)):
+                keys = index.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[value]
+
+    def _find_keys(self, filters) -> Optional[Set]:
+        """
+        Looks up the primary keys of the equality and in filters on the primary key and the indexed fields
+        :param filters: Parsed filters, see parse_filters
+        :return: Candidate primary keys (a superset of the matching keys) or None if no filter uses an index
+        """
+        keys = None
+        for field_name, operator, operand in filters:
+            if operator not in (None, "in") or (operator is None and isinstance(operand, list)):
+                continue
+            values = operand if operator == "in" else [operand]
+            if field_name == self.primary_key:
+                found = {value for value in values if value in self._items}
+            elif field_name in self._indexes:
+                index = self._indexes[field_name]
+                found = set().union(*(index.get(value, ()) for value in values))
+            else:
+                continue
+            keys = found if keys is None else keys & found
+        return keys
+
+    def _select(self, keys: Optional[Set]) -> List[BaseModel]:
+        return [self._items[key] for key in (self._keys if keys is None else sorted(keys))]
+
+    def _ordered_keys(self, keys: Optional[Set], descending: bool, after) -> Iterator:
+        """
+        Iterates the primary keys in order, starting after a key (keyset pagination)
+        :param keys: Candidate primary keys or None for all keys
+        :param descending: Descending order
+        :param after: Primary key of the last item of the previous page or None
+        :return: Iterator of primary keys
+        """
+        if keys is not None:
+            if after is not None:
+                keys = [key for key in keys if (key < after if descending else key > after)]
+            return iter(sorted(keys, reverse=descending))
+        start, end = 0, len(self._keys)
+        if after is not None:
+            if descending:
+                end = bisect_left(self._keys, after)
+            else:
+                start = bisect_right(self._keys, after)
+        positions = range(end - 1, start - 1, -1) if descending else range(start, end)
+        return (self._keys[position] for position in positions)
+
+
+def create_collection(dbmodel: Type[Document]) -> MemoryCollection:
+    """
+    Creates an in-memory collection with the indexes of an orm model: the single field indexes become hash indexes
+    (unique indexes are enforced) and the weights of the text index are used by the text search
+    :param dbmodel: Orm class type
+    :return: Empty collection
+    """
+    field_names = {field.db_field: name for name, field in dbmodel._fields.items()}
+    indexed_fields, unique_fields, text_weights = [], [], {}
+    for spec in dbmodel._meta.get("index_specs", []):
+        fields = spec["fields"]
+        if all(direction == "text" for _, direction in fields):
+            weights = spec.get("weights", {})
+            text_weights = {field_names.get(field, field): weights.get(field, 1) for field, _ in fields}
+        elif len(fields) == 1:
+            field_name = field_names.get(fields[0][0], fields[0][0])
+            (unique_fields if spec.get("unique") else indexed_fields).append(field_name)
+    return MemoryCollection(dbmodel._meta["id_field"], indexed_fields, unique_fields, text_weights)
+
+
+class MemoryDatabase:
+    """
+    In-memory database (collections, sequences and revoked refresh tokens),
+    which can be saved to and loaded from a snapshot file
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None):
+        """
+        Initializes an empty database
+        :param snapshot_path: Path of the snapshot file (JSON)
+        """
+        self.snapshot_path = snapshot_path
+        self.revoked_tokens: Dict[str, datetime] = {}  # jti -> expiration
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._models: Dict[str, Type[BaseModel]] = {}
+        self._documents: Dict[str, List[dict]] = {}  # Loaded documents of collections that are not created yet
+        self._sequences: Dict[str, int] = defaultdict(int)
+        self._lock = RLock()
+
+    def get_collection(self, dbmodel: Type[Document], model: Type[BaseModel]) -> MemoryCollection:
+        """
+        Gets the collection of an orm model, the collection is created on the first access
+        :param dbmodel: Orm class type
+        :param model: Pydantic class type of the stored models
+        :return: Collection
+        """
+        name = dbmodel._get_collection_name()
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._collections[name] = create_collection(dbmodel)
+                self._models[name] = model
+                for document in self._documents.pop(name, []):
+                    collection.put(model.parse_obj(document))
+            return collection
+
+    def next_sequence_value(self, sequence_id: str) -> int:
+        """
+        Generates the next value of a sequence
+        :param sequence_id: Sequence ID (e.g. quiz.identifier)
+        :return: Sequence value
+        """
+        with self._lock:
+            self._sequences[sequence_id] += 1
+            return self._sequences[sequence_id]
+
+    def observe_sequence_value(self, sequence_id: str, value: int):
+        """
+        Advances a sequence past an explicitly assigned value, so generated values never collide with it
+        :param sequence_id: Sequence ID
+        :param value: Assigned value
+        :return: None
+        """
+        with self._lock:
+            if value > self._sequences[sequence_id]:
+                self._sequences[sequence_id] = value
+
+    def save(self):
+        """
+        Writes a snapshot of the database, the previous snapshot is replaced atomically
+        :return: None
+        """
+        now = datetime.utcnow()
+        with self._lock:
+            snapshot = {
+                "sequences": dict(self._sequences),
+                "revoked_tokens": {jti: expires_at for jti, expires_at in self.revoked_tokens.items()
+                                   if expires_at > now},
+                "collections": {**self._documents, **{name: collection.documents()
+                                                      for name, collection in self._collections.items()}}
+            }
+        temporary_path = f"{self.snapshot_path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(snapshot, file, default=pydantic_encoder)
+        os.replace(temporary_path, self.snapshot_path)
+
+    def load(self) -> bool:
+        """
+        Loads the snapshot of the database (if the snapshot file exists)
+        :return: True if a snapshot was loaded
+        """
+        if not os.path.exists(self.snapshot_path):
+            return False
+        with open(self.snapshot_path) as file:
+            snapshot = json.load(file)
+        with self._lock:
+            self._sequences.update(snapshot["sequences"])
+            self.revoked_tokens.update({jti: datetime.fromisoformat(expires_at)
+                                        for jti, expires_at in snapshot["revoked_tokens"].items()})
+            for name, documents in snapshot["collections"].items():
+                if name not in self._collections:
+                    self._documents[name] = documents
+                    continue
+                for document in documents:
+                    self._collections[name].put(self._models[name].parse_obj(document))
+        return True
+
+
+class MemoryRepository(DomainRepository):
+    """
+    Domain repository that stores the domain models in an in-memory collection instead of MongoDB.
+    The stored models are shared and must not be modified (persist stores a converted copy)
+    """
+    def __init__(self, dbmodel: Type[Document], model: Type[BaseModel], database: MemoryDatabase):
+        """
+        Initializes an in-memory domain repository
+        :param dbmodel: Orm class type (defines the collection, the indexes and the sequences)
+        :param model: Pydantic class type
+        :param database: In-memory database
+        """
+        super().__init__(dbmodel=dbmodel, model=model)
+        self._database = database
+        self._collection = database.get_collection(dbmodel, model)
+
+    def get(self, key) -> Optional[BaseModel]:
+        return self._collection.get(key)
+
+    def filter(self, **kwargs) -> List[BaseModel]:
+        return self._collection.filter(**kwargs)
+
+    def count(self, **kwargs) -> int:
+        return self._collection.count(**kwargs)
+
+    def exists(self, **kwargs) -> bool:
+        return self._collection.exists(**kwargs)
+
+    def _assign_sequence_values(self, dbmodel: Type[Union[Document, EmbeddedDocument]], item: BaseModel):
+        """
+        Assigns the missing sequence values of a domain model and its embedded models (the sequence fields of the
+        orm model), explicitly assigned values advance the sequences
+        :param dbmodel: Orm class type
+        :param item: Pydantic domain model
+        :return: None
+        """
+        for name, field in dbmodel._fields.items():
+            if isinstance(field, BlockSequenceField) and hasattr(item, name):
+                value = getattr(item, name)
+                if value is None:
+                    setattr(item, name, self._database.next_sequence_value(field.get_sequence_id()))
+                else:
+                    self._database.observe_sequence_value(field.get_sequence_id(), value)
+            elif isinstance(field, ListField) and isinstance(field.field, EmbeddedDocumentField):
+                for embedded_item in getattr(item, name, None) or []:
+                    self._assign_sequence_values(field.field.document_type, embedded_item)
+
+    def _convert2storedmodel(self, item: BaseModel) -> BaseModel:
+        """
+        Converts an item (e.g. an upsert model without identifier) to a new domain model and assigns the sequences
+        :param item: Pydantic model
+        :return: Domain model that can be stored (not shared with the caller)
+        """
+        stored_item = self._model(**item.dict())
+        self._assign_sequence_values(self._dbmodel, stored_item)
+        return stored_item
+
+    def persist(self, item: BaseModel) -> BaseModel:
+        item = self._convert2storedmodel(item)
+        self._collection.put(item)
+        return item
+
+    def insert_unique(self, item: BaseModel) -> BaseModel:
+        item = self._convert2storedmodel(item)
+        self._collection.put(item, insert=True)
+        return item
+
+    def delete(self, item: BaseModel):
+        self._collection.remove(getattr(item, self._collection.primary_key))
+
+
+# The cache handling of the domain repositories is kept, the storage methods are resolved from the MemoryRepository
+class MemoryUserRepository(UserRepository, MemoryRepository):
+    """
+    In-memory user repository
+    """
+    def __init__(self, database: MemoryDatabase):
+        MemoryRepository.__init__(self, dbmodel=User, model=UserModel, database=database)
+
+    def revoke_refresh_token(self, jti: str, expires_at: datetime):
+        self._database.revoked_tokens[jti] = expires_at
+
+    def is_refresh_token_revoked(self, jti: str) -> bool:
+        return jti in self._database.revoked_tokens
+
+
+class MemoryCategoryRepository(CategoryRepository, MemoryRepository):
+    """
+    In-memory category repository
+    """
+    def __init__(self, database: MemoryDatabase):
+        MemoryRepository.__init__(self, dbmodel=Category, model=CategoryModel, database=database)
+
+
+class MemoryQuizRepository(QuizRepository, MemoryRepository):
+    """
+    In-memory quiz repository
+    """
+    def __init__(self, database: MemoryDatabase):
+        MemoryRepository.__init__(self, dbmodel=Quiz, model=QuizModel, database=database)
+
+    def filter_summaries(self, **kwargs) -> List[schemas.QuizSummary]:
+        return [schemas.QuizSummary(**quiz.dict(exclude={"questions"}), question_count=len(quiz.questions))
+                for quiz in self.filter(**kwargs)]
+
+
+class MemoryRepositoryContainer(RepositoryContainerBase):
+    def __init__(self, database: MemoryDatabase):
+        """
+        Creates the in-memory repositories
+        :param database: In-memory database
+        """
+        super().__init__(
+            category_repository=MemoryCategoryRepository(database),
+            quiz_repository=MemoryQuizRepository(database),
+            user_repository=MemoryUserRepository(database)
+        )
@@ -1,5 +1,14 @@
 from mongoengine import Document, EmbeddedDocument, EmbeddedDocumentField, StringField, BooleanField, \
-    SequenceField, ListField, ReferenceField, EmailField, DO_NOTHING as DELETION_RULE_DO_NOTHING
+    ListField, ReferenceField, EmailField, DateTimeField, DO_NOTHING as DELETION_RULE_DO_NOTHING
+
+from .sequences import BlockSequenceField
+
+# Text index for the full text search, matches in the title are ranked higher than matches in the description
+TEXT_INDEX = {
+    "fields": ["$title", "$description"],
+    "default_language": "english",
+    "weights": {"title": 10, "description": 2}
+}
 
 
 class User(Document):
@@ -12,21 +21,46 @@ class User(Document):
     password_hash = StringField(required=True)
     disabled = BooleanField(default=True)
 
+    meta = {
+        "auto_create_index": False
+    }
+
+
+class RevokedToken(Document):
+    """
+    MongoDB revoked refresh token document, MongoDB removes the document once the token is expired
+    """
+    jti = StringField(primary_key=True)
+    expires_at = DateTimeField(required=True)
+
+    meta = {
+        "auto_create_index": False,
+        "indexes": [
+            {"fields": ["expires_at"], "expireAfterSeconds": 0}
+        ]
+    }
+
 
 class Category(Document):
     """
     MongoDB Category document
     """
-    identifier = SequenceField(primary_key=True)
+    identifier = BlockSequenceField(primary_key=True)
     title = StringField(unique=True, min_length=3, max_length=75)
     description = StringField(max_length=255)
 
+    meta = {
+        # Indexes are created by the startup index check (see orm.indexes), not on the first collection access
+        "auto_create_index": False,
+        "indexes": [TEXT_INDEX]
+    }
+
 
 class Answer(EmbeddedDocument):
     """
     MongoDB embedded Answer document
     """
-    identifier = SequenceField(primary_key=True)
+    identifier = BlockSequenceField(primary_key=True)
     answer_text = StringField(required=True, max_length=255)
     is_correct = BooleanField()
 
@@ -35,7 +69,7 @@ class Question(EmbeddedDocument):
     """
     MongoDB embedded Question document
     """
-    identifier = SequenceField(primary_key=True)
+    identifier = BlockSequenceField(primary_key=True)
     title = StringField(required=True, min_length=3, max_length=500)
 
     answers = ListField(EmbeddedDocumentField(Answer))
@@ -45,10 +79,23 @@ class Quiz(Document):
     """
     MongoDB Quiz document
     """
-    identifier = SequenceField(primary_key=True)
+    identifier = BlockSequenceField(primary_key=True)
     title = StringField(required=True, min_length=3, max_length=75)
     description = StringField(required=False, max_length=255)
 
     owner = ReferenceField(User)
     questions = ListField(EmbeddedDocumentField(Question))
     categories = ListField(ReferenceField(Category, reverse_delete_rule=DELETION_RULE_DO_NOTHING))
+
+    meta = {
+        "auto_create_index": False,
+        "indexes": [
+            # owner_email filter
+            "owner",
+            # categories filter (multikey index, supports $in)
+            "categories",
+            # title sort orders (the identifier is the tie-breaker)
+            ("title", "identifier"),
+            TEXT_INDEX
+        ]
+    }
@@ -1,14 +1,160 @@
 from abc import ABC, abstractmethod
-from mongoengine import Document
+from bson import DBRef
+from mongoengine import Document, EmbeddedDocument, EmbeddedDocumentField, ListField, NotUniqueError
+from mongoengine.queryset.transform import query as transform_query
 from pydantic import BaseModel
-from typing import List, Optional
-import json
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple, Type, Union
 
 import schemas
-from .models import Category, Quiz, User
+import services
+from .in_memory import query_models, supports_query
+from .models import Category, Quiz, RevokedToken, User
 from schemas import CategoryInDb as CategoryModel, Quiz as QuizModel, UserInDb as UserModel
-from utilities import first_or_default
+from settings import get_settings
+from utilities import AsyncSingleFlight, first_or_default, LRUCache, SnapshotCache
 from auth.utilities import verify_password
+from response_cache import category_response_cache, quiz_list_response_cache, quiz_response_cache
+
+# Process wide cache of compiled answer keys (quiz identifier -> answer key), weighted by the answer count
+answer_key_cache = LRUCache(maxsize=get_settings().answer_key_cache_size,
+                            getsizeof=lambda answer_key: max(1, sum(map(len, answer_key.questions.values()))),
+                            ttl=get_settings().answer_key_cache_ttl)
+
+
+class CategorySnapshot(NamedTuple):
+    """
+    Snapshot of all categories, indexed by identifier and title
+    """
+    categories: List[CategoryModel]
+    by_identifier: Dict[int, CategoryModel]
+    by_title: Dict[str, CategoryModel]
+
+    @classmethod
+    def create(cls, categories: List[CategoryModel]) -> "CategorySnapshot":
+        """
+        Creates a snapshot
+        :param categories: All categories
+        :return: Category snapshot
+        """
+        return cls(categories=categories,
+                   by_identifier={category.identifier: category for category in categories},
+                   by_title={category.title: category for category in categories})
+
+
+# Process wide cache of all categories (categories are a small and rarely changing set)
+category_cache = SnapshotCache(ttl=get_settings().category_cache_ttl)
+
+# Process wide cache of authenticated users (email -> user), invalidated when a user is written
+principal_cache = LRUCache(maxsize=get_settings().principal_cache_size, ttl=get_settings().principal_cache_ttl)
+
+# Process wide coalescing of concurrent quiz lookups (e.g. all participants load the same quiz when an exam starts),
+# the lookups are coalesced on the event loop before they occupy threadpool workers (see ThreadPoolQuizRepository)
+async_quiz_flights = AsyncSingleFlight()
+
+
+# Field of the text search relevance score in search results
+TEXT_SCORE_FIELD = "_text_score"
+
+# Projection of the quiz summary, the questions are not loaded, just counted (requires MongoDB 4.4+)
+QUIZ_SUMMARY_PROJECTION = {
+    "title": 1,
+    "description": 1,
+    "owner": 1,
+    "categories": 1,
+    "question_count": {"$size": {"$ifNull": ["$questions", []]}}
+}
+
+
+def build_sort(dbmodel: Type[Document], order_by: List[str]) -> List[Tuple[str, int]]:
+    """
+    Translates mongoengine style order by fields (e.g. ["-title", "identifier"]) into a pymongo sort specification
+    :param dbmodel: Orm class type
+    :param order_by: Field names, descending fields are prefixed with "-"
+    :return: List of database field name and sort direction
+    """
+    sort = []
+    for field_name in order_by:
+        name = field_name.lstrip("-")
+        name = dbmodel._meta["id_field"] if name == "pk" else name
+        sort.append((dbmodel._db_field_map.get(name, name), DESCENDING if field_name.startswith("-") else ASCENDING))
+    return sort
+
+
+def build_keyset_query(sort: List[Tuple[str, int]], after: list) -> dict:
+    """
+    Builds the keyset pagination query, which returns all documents that come after the provided sort values.
+    Unlike skip, the query can use the index of the sort fields, so the cost does not depend on the page depth.
+    :param sort: Sort specification (should end with a unique field like the primary key)
+    :param after: Sort values of the last document of the previous page
+    :return: Raw MongoDB query
+    """
+    clauses = []
+    for idx, (field, direction) in enumerate(sort):
+        clause = {previous_field: value for (previous_field, _), value in zip(sort[:idx], after)}
+        clause[field] = {"$gt" if direction == ASCENDING else "$lt": after[idx]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def build_find_arguments(dbmodel: Type[Document], **kwargs) -> dict:
+    """
+    Translates the repository filter arguments into pymongo find arguments
+    :param dbmodel: Orm class type
+    :param kwargs: Mongoengine style filter operations (e.g. title__icontains) and the options
+    skip, limit, projection (raw MongoDB projection, only for raw documents, e.g. filter_raw), order_by (field names),
+    after (keyset pagination, sort values of the last document of the previous page)
+    and search (full text search, the results are ordered by relevance)
+    :return: pymongo find arguments
+    """
+    limit, skip, projection = kwargs.pop("limit", 100), kwargs.pop("skip", 0), kwargs.pop("projection", None)
+    order_by, after, search = kwargs.pop("order_by", None), kwargs.pop("after", None), kwargs.pop("search", None)
+    sort = build_sort(dbmodel, order_by) if order_by else None
+    raw_query = {}
+    if after is not None:
+        raw_query.update(build_keyset_query(sort, after))
+    if search:
+        # Uses the text index of the collection, the order by fields are tie-breakers
+        raw_query["$text"] = {"$search": search}
+        projection = {**(projection or {}), TEXT_SCORE_FIELD: {"$meta": "textScore"}}
+        sort = [(TEXT_SCORE_FIELD, {"$meta": "textScore"})] + (sort or [])
+    if raw_query:
+        kwargs["__raw__"] = raw_query
+    return {
+        "filter": transform_query(dbmodel, **kwargs),
+        "projection": projection,
+        "sort": sort,
+        "skip": skip,
+        "limit": limit
+    }
+
+
+def convert_son2dict(dbmodel: Type[Union[Document, EmbeddedDocument]], son: dict) -> dict:
+    """
+    Converts a raw MongoDB document (e.g. from as_pymongo) to a dict in the format of the orm class fields,
+    without instantiating the orm model. References are returned as primary keys.
+    :param dbmodel: Orm class type
+    :param son: Raw MongoDB document
+    :return: Dict in the format of the orm class fields
+    """
+    data = {}
+    for db_field, value in son.items():
+        field_name = dbmodel._reverse_db_field_map.get(db_field)
+        if field_name is None:
+            continue
+        field = dbmodel._fields[field_name]
+        if isinstance(field, ListField) and isinstance(field.field, EmbeddedDocumentField):
+            value = [convert_son2dict(field.field.document_type, x) for x in value]
+        elif isinstance(field, EmbeddedDocumentField):
+            value = convert_son2dict(field.document_type, value)
+        elif isinstance(value, DBRef):
+            value = value.id
+        elif isinstance(value, list):
+            value = [x.id if isinstance(x, DBRef) else x for x in value]
+        data[field_name] = value
+    return data
 
 
 class RepositoryBase(ABC):
@@ -34,6 +180,24 @@ class RepositoryBase(ABC):
         """
         ...
 
+    @abstractmethod
+    def count(self, **kwargs) -> int:
+        """
+        Counts the entities that match the filter operations (server side)
+        :param kwargs: Filter operations
+        :return: Number of matching entities
+        """
+        ...
+
+    @abstractmethod
+    def exists(self, **kwargs) -> bool:
+        """
+        Checks if at least one entity matches the filter operations (without loading the entities)
+        :param kwargs: Filter operations
+        :return: True or False
+        """
+        ...
+
     @abstractmethod
     def persist(self, item):
         """
@@ -43,6 +207,17 @@ class RepositoryBase(ABC):
         """
         ...
 
+    @abstractmethod
+    def insert_unique(self, item):
+        """
+        Inserts an entity, relies on the unique indexes (primary key and unique fields) instead of a prior lookup.
+        The unique indexes are a precondition, the startup fails if one is missing (see resources.AppResources)
+        :param item: Entity to insert
+        :raises NotUniqueError: If an entity with the same primary key or unique field value already exists
+        :return: The inserted entity
+        """
+        ...
+
     @abstractmethod
     def delete(self, item):
         """
@@ -66,20 +241,46 @@ class MongoRepository(RepositoryBase, ABC):
         self._dbmodel = dbmodel
 
     def get(self, key):
-        return self.filter(pk=key).first()
+        return first_or_default(self.filter(pk=key, limit=1))
 
-    def filter(self, **kwargs):
-        limit, skip, only = kwargs.pop("limit", 100), kwargs.pop("skip", 0), kwargs.pop("only", None)
-        rows = self._dbmodel.objects(**kwargs).skip(skip).limit(limit)
-        if only is not None:
-            # Issue: Pydantic validates fields -> so if the selected fields do not meet the validation requirements
-            # the creation of the domain model fails
-            rows.only(*only)
-        return rows
+    def filter(self, **kwargs) -> List[Document]:
+        return [self._dbmodel._from_son(son) for son in self.filter_raw(**kwargs)]
+
+    def count(self, **kwargs) -> int:
+        return self._dbmodel.objects(**kwargs).count()
+
+    def exists(self, **kwargs) -> bool:
+        # Limit 1 query, that only returns the primary key
+        return self._dbmodel.objects(**kwargs).only(self._dbmodel._meta["id_field"]).as_pymongo().first() is not None
+
+    def filter_raw(self, **kwargs):
+        """
+        Filters an entity and returns the raw MongoDB documents (no orm models are instantiated)
+        :param kwargs: Filter operations and options, see build_find_arguments
+        :return: Iterable of raw MongoDB documents
+        """
+        return self._dbmodel._get_collection().find(**build_find_arguments(self._dbmodel, **kwargs))
 
     def persist(self, item: Document) -> Document:
-        item.save()
-        item.reload()
+        item.validate()
+        son = item.to_mongo()
+        collection = self._dbmodel._get_collection()
+        if "_id" not in son:
+            item.pk = collection.insert_one(son).inserted_id
+            return item
+        # The whole document is replaced (or inserted), so the local document already reflects the stored one.
+        # This is a single round trip (save would try a replace and then an insert, plus a reload)
+        collection.replace_one({"_id": son["_id"]}, son, upsert=True)
+        return item
+
+    def insert_unique(self, item: Document) -> Document:
+        item.validate()
+        son = item.to_mongo()
+        try:
+            inserted_id = self._dbmodel._get_collection().insert_one(son).inserted_id
+        except DuplicateKeyError as e:
+            raise NotUniqueError(str(e))
+        item.pk = inserted_id
         return item
 
     def delete(self, item: Document):
@@ -103,10 +304,16 @@ class DomainRepository(RepositoryBase, ABC):
         self._repository = MongoRepository(dbmodel)
 
     def get(self, key) -> BaseModel:
-        return first_or_default(self.filter(pk=key))
+        return first_or_default(self.filter(pk=key, limit=1))
 
     def filter(self, **kwargs) -> List[BaseModel]:
-        return list(map(lambda x: self._convert2domainmodel(x), self._repository.filter(**kwargs)))
+        return list(map(self._convert_son2domainmodel, self._repository.filter_raw(**kwargs)))
+
+    def count(self, **kwargs) -> int:
+        return self._repository.count(**kwargs)
+
+    def exists(self, **kwargs) -> bool:
+        return self._repository.exists(**kwargs)
 
     def _convert2dbmodel(self, item: BaseModel):
         """
@@ -122,13 +329,25 @@ class DomainRepository(RepositoryBase, ABC):
         :param item: Orm model
         :return: Pydantic domain model
         """
-        return self._model.from_orm(item)
+        return self._convert_son2domainmodel(item.to_mongo())
+
+    def _convert_son2domainmodel(self, son: dict):
+        """
+        Converts a raw MongoDB document to a domain model (no orm model and no json round trip is required)
+        :param son: Raw MongoDB document
+        :return: Pydantic domain model
+        """
+        return self._model(**convert_son2dict(self._dbmodel, son))
 
     def persist(self, item: BaseModel):
         db_item = self._repository.persist(self._convert2dbmodel(item))
         domain_model = self._convert2domainmodel(db_item)
         return domain_model
 
+    def insert_unique(self, item: BaseModel):
+        db_item = self._repository.insert_unique(self._convert2dbmodel(item))
+        return self._convert2domainmodel(db_item)
+
     def delete(self, item: BaseModel):
         db_item: Document = self._dbmodel(**item.dict())
         db_item.delete()
@@ -141,6 +360,7 @@ class UserRepository(DomainRepository):
     """
     def __init__(self):
         super(UserRepository, self).__init__(dbmodel=User, model=UserModel)
+        self._revoked_tokens = MongoRepository(RevokedToken)
 
     def authenticate_user(self, email: str, password: str) -> Optional[UserModel]:
         """
@@ -156,6 +376,61 @@ class UserRepository(DomainRepository):
             return None
         return user
 
+    def revoke_refresh_token(self, jti: str, expires_at: datetime):
+        """
+        Revokes a refresh token, the revocation is kept until the token is expired
+        :param jti: Token ID ("jti" claim)
+        :param expires_at: Expiration of the token (UTC)
+        :return: None
+        """
+        self._revoked_tokens.persist(RevokedToken(jti=jti, expires_at=expires_at))
+
+    def is_refresh_token_revoked(self, jti: str) -> bool:
+        """
+        Checks if a refresh token is revoked (primary key lookup)
+        :param jti: Token ID ("jti" claim)
+        :return: True if the token is revoked
+        """
+        return self._revoked_tokens.exists(pk=jti)
+
+    def get_principal(self, email: str) -> Optional[UserModel]:
+        """
+        Gets an authenticated user, users are cached until they are updated or deleted (or the cache expires).
+        The cached users are shared and must not be modified
+        :param email: User email
+        :return: User or None if the user does not exist
+        """
+        user = principal_cache.get(email)
+        if user is None:
+            generation = principal_cache.generation
+            user = self.get(email)
+            if user is not None:
+                principal_cache.put(email, user, generation=generation)
+        return user
+
+    def persist(self, item: UserModel) -> UserModel:
+        user = super().persist(item)
+        principal_cache.invalidate(item.email)
+        return user
+
+    def insert_unique(self, item: UserModel) -> UserModel:
+        user = super().insert_unique(item)
+        principal_cache.invalidate(item.email)
+        return user
+
+    def delete(self, item: UserModel):
+        super().delete(item)
+        principal_cache.invalidate(item.email)
+
+
+def invalidate_categories():
+    """
+    Removes the cached categories and category responses
+    :return: None
+    """
+    category_cache.invalidate()
+    category_response_cache.clear()
+
 
 # noinspection PyTypeChecker
 class CategoryRepository(DomainRepository):
@@ -165,6 +440,81 @@ class CategoryRepository(DomainRepository):
     def __init__(self):
         super().__init__(dbmodel=Category, model=CategoryModel)
 
+    def _load_categories(self) -> List[CategoryModel]:
+        """
+        Loads all categories from the database
+        :return: All categories
+        """
+        return super().filter(limit=0)
+
+    def get_snapshot(self) -> CategorySnapshot:
+        """
+        Gets the cached snapshot of all categories, the snapshot is loaded if it is not cached or expired.
+        The cached categories are shared and must not be modified
+        :return: Category snapshot
+        """
+        snapshot = category_cache.get()
+        if snapshot is None:
+            generation = category_cache.generation
+            snapshot = CategorySnapshot.create(self._load_categories())
+            category_cache.put(snapshot, generation=generation)
+        return snapshot
+
+    def get(self, key) -> Optional[CategoryModel]:
+        return self.get_snapshot().by_identifier.get(key)
+
+    def get_by_title(self, title: str) -> Optional[CategoryModel]:
+        """
+        Gets a category by title
+        :param title: Category title
+        :return: Category or None if the category does not exist
+        """
+        return self.get_snapshot().by_title.get(title)
+
+    def filter(self, **kwargs) -> List[CategoryModel]:
+        # Text search is executed by MongoDB, everything else is evaluated on the snapshot
+        if not supports_query(**kwargs):
+            return super().filter(**kwargs)
+        return query_models(self.get_snapshot().categories, "identifier", **kwargs)
+
+    def count(self, **kwargs) -> int:
+        if not supports_query(**kwargs):
+            return super().count(**kwargs)
+        return len(query_models(self.get_snapshot().categories, "identifier", limit=0, **kwargs))
+
+    def exists(self, **kwargs) -> bool:
+        if not supports_query(**kwargs):
+            return super().exists(**kwargs)
+        return bool(query_models(self.get_snapshot().categories, "identifier", limit=1, **kwargs))
+
+    def persist(self, item: CategoryModel) -> CategoryModel:
+        category = super().persist(item)
+        invalidate_categories()
+        return category
+
+    def insert_unique(self, item: CategoryModel) -> CategoryModel:
+        category = super().insert_unique(item)
+        invalidate_categories()
+        return category
+
+    def delete(self, item: CategoryModel):
+        super().delete(item)
+        invalidate_categories()
+
+
+def invalidate_quiz(key):
+    """
+    Removes the cached answer key and responses of a quiz and detaches the lookups in flight
+    (they may return the old quiz)
+    :param key: Quiz ID
+    :return: None
+    """
+    answer_key_cache.invalidate(key)
+    quiz_response_cache.invalidate(key)
+    quiz_list_response_cache.clear()
+    async_quiz_flights.forget(("get", key))
+    async_quiz_flights.forget(("answer_key", key))
+
 
 # noinspection PyTypeChecker
 class QuizRepository(DomainRepository):
@@ -177,17 +527,70 @@ class QuizRepository(DomainRepository):
     def _convert2dbmodel(self, item: schemas.Quiz):
         # db_model: Quiz = self._dbmodel(**item.dict()) unable to resolve owner (= current user)
         db_model: Quiz = self._dbmodel(**item.dict(exclude={"owner", "categories"}))
-        db_model.owner = User.objects(pk=item.owner).first()
-        db_model.categories = [] if item.categories is None or len(item.categories) == 0 else list(
-            map(lambda category_id: Category.objects(pk=category_id).first(), item.categories))
+        # References are stored as primary keys, so they can be built from the ids without fetching the documents
+        db_model.owner = User(email=item.owner)
+        db_model.categories = [Category(identifier=category_id) for category_id in item.categories or []]
         return db_model
 
-    def _convert2domainmodel(self, item: Quiz):
-        # MongoDB Document to_json returns just the primary key of referenced documents (e.g owner)
-        # use_db_field returns a json in the format of the python document class fields
-        # (without this parameter to_json retruns an _id field instead of an identifier field)
-        data: dict = json.loads(item.to_json(use_db_field=False))
-        return self._model(**data)
+    def get_answer_key(self, key) -> Optional[services.AnswerKey]:
+        """
+        Gets the compiled answer key of a quiz, answer keys are cached until the quiz is updated or deleted
+        :param key: Quiz ID
+        :return: Answer key or None if the quiz does not exist
+        """
+        answer_key = answer_key_cache.get(key)
+        if answer_key is None:
+            answer_key = self._load_answer_key(key)
+        return answer_key
+
+    def _load_answer_key(self, key) -> Optional[services.AnswerKey]:
+        """
+        Loads, compiles and caches the answer key of a quiz
+        :param key: Quiz ID
+        :return: Answer key or None if the quiz does not exist
+        """
+        generation = answer_key_cache.generation
+        quiz: schemas.Quiz = self.get(key)
+        if quiz is None:
+            return None
+        answer_key = services.compile_answer_key(quiz)
+        answer_key_cache.put(key, answer_key, generation=generation)
+        return answer_key
+
+    def get_answer_keys(self, keys: List[int]) -> Dict[int, services.AnswerKey]:
+        """
+        Gets the compiled answer keys of multiple quizzes, all quizzes that are not cached are loaded with one query
+        :param keys: Quiz IDs
+        :return: Dict of quiz ID and answer key (quizzes that do not exist are not included)
+        """
+        answer_keys = {key: answer_key_cache.get(key) for key in set(keys)}
+        missing_keys = [key for key, answer_key in answer_keys.items() if answer_key is None]
+        if missing_keys:
+            generation = answer_key_cache.generation
+            quiz: schemas.Quiz
+            for quiz in self.filter(identifier__in=missing_keys, limit=len(missing_keys)):
+                answer_key = services.compile_answer_key(quiz)
+                answer_key_cache.put(quiz.identifier, answer_key, generation=generation)
+                answer_keys[quiz.identifier] = answer_key
+        return {key: answer_key for key, answer_key in answer_keys.items() if answer_key is not None}
+
+    def filter_summaries(self, **kwargs) -> List[schemas.QuizSummary]:
+        """
+        Filters quizzes and returns the quiz summaries (the questions are not loaded)
+        :param kwargs: Filter operations
+        :return: List of quiz summaries
+        """
+        return [schemas.QuizSummary(**convert_son2dict(self._dbmodel, son), question_count=son["question_count"])
+                for son in self._repository.filter_raw(**kwargs, projection=QUIZ_SUMMARY_PROJECTION)]
+
+    def persist(self, item: schemas.Quiz):
+        quiz: schemas.Quiz = super().persist(item)
+        invalidate_quiz(quiz.identifier)
+        return quiz
+
+    def delete(self, item: schemas.Quiz):
+        super().delete(item)
+        invalidate_quiz(item.identifier)
 
 
 class RepositoryContainerBase(ABC):
@@ -0,0 +1,115 @@
+from collections import deque
+from threading import Lock
+from typing import Awaitable, Callable, Dict, Deque, Optional, TYPE_CHECKING
+from mongoengine import SequenceField
+from mongoengine.connection import get_db
+from pymongo import ReturnDocument
+
+from settings import get_settings
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+
+class SequenceAllocator:
+    """
+    Thread-safe in-memory store of reserved sequence value blocks
+    """
+
+    def __init__(self, block_size: int):
+        """
+        Initializes the allocator
+        :param block_size: Number of sequence values that are reserved with one counter update
+        """
+        self.block_size = block_size
+        self._blocks: Dict[str, Deque[range]] = {}
+        self._lock = Lock()
+
+    def take(self, sequence_id: str) -> Optional[int]:
+        """
+        Takes the next free value of a sequence
+        :param sequence_id: Sequence ID (counter document ID)
+        :return: Sequence value or None if no reserved values are left
+        """
+        with self._lock:
+            blocks = self._blocks.get(sequence_id)
+            while blocks:
+                block = blocks[0]
+                if len(block) > 0:
+                    blocks[0] = block[1:]
+                    return block[0]
+                blocks.popleft()
+            return None
+
+    def add_block(self, sequence_id: str, last_value: int):
+        """
+        Adds a reserved block of sequence values
+        :param sequence_id: Sequence ID (counter document ID)
+        :param last_value: Last value of the block (counter value after the reservation)
+        :return: None
+        """
+        with self._lock:
+            self._blocks.setdefault(sequence_id, deque()).append(
+                range(last_value - self.block_size + 1, last_value + 1))
+
+    def clear(self):
+        """
+        Discards all reserved blocks (the discarded values are never used)
+        :return: None
+        """
+        with self._lock:
+            self._blocks.clear()
+
+
+sequence_allocator = SequenceAllocator(block_size=get_settings().sequence_block_size)
+
+
+class BlockSequenceField(SequenceField):
+    """
+    Sequence field that reserves blocks of values with a single counter update and hands them out from memory.
+    The same counter documents as the SequenceField are used, so existing identifiers stay compatible.
+    Reservations are atomic increments, therefore multiple workers never get the same value
+    (identifiers are unique, but not strictly ascending in the order of creation).
+    """
+
+    def _reserve_block_update(self) -> dict:
+        return {
+            "filter": {"_id": self.get_sequence_id()},
+            "update": {"$inc": {"next": sequence_allocator.block_size}},
+            "return_document": ReturnDocument.AFTER,
+            "upsert": True
+        }
+
+    def get_sequence_id(self) -> str:
+        """
+        Returns the ID of the counter document
+        :return: Sequence ID
+        """
+        return f"{self.get_sequence_name()}.{self.name}"
+
+    def generate(self):
+        sequence_id = self.get_sequence_id()
+        value = sequence_allocator.take(sequence_id)
+        while value is None:
+            collection = get_db(alias=self.db_alias)[self.collection_name]
+            counter = collection.find_one_and_update(**self._reserve_block_update())
+            sequence_allocator.add_block(sequence_id, counter["next"])
+            value = sequence_allocator.take(sequence_id)
+        return self.value_decorator(value)
+
+    async def generate_async(self, database: "AsyncIOMotorDatabase",
+                             record: Optional[Callable[[Awaitable], Awaitable]] = None):
+        """
+        Async counterpart of generate, reserves blocks with the motor driver
+        :param database: Motor database
+        :param record: Awaits the counter update (e.g. records its latency), default is to await it directly
+        :return: Next sequence value
+        """
+        sequence_id = self.get_sequence_id()
+        value = sequence_allocator.take(sequence_id)
+        while value is None:
+            update = database[self.collection_name].find_one_and_update(**self._reserve_block_update())
+            counter = await (record(update) if record is not None else update)
+            sequence_allocator.add_block(sequence_id, counter["next"])
+            value = sequence_allocator.take(sequence_id)
+        return self.value_decorator(value)
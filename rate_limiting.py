@@ -0,0 +1,87 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Optional
+
+
+class RateLimitStore(ABC):
+    """
+    Storage of token buckets, a shared store (e.g. Redis) limits the requests across multiple workers
+    """
+
+    @abstractmethod
+    def consume(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        """
+        Takes tokens from a bucket, a bucket starts full and is refilled continuously
+        :param key: Bucket key
+        :param rate: Refill rate in tokens per second
+        :param capacity: Maximum number of tokens in the bucket (burst size)
+        :param cost: Number of tokens that should be taken
+        :return: 0 if the tokens were taken, otherwise the seconds until enough tokens are available
+        """
+        ...
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """
+    Thread-safe in-process token bucket store, the least recently used buckets are evicted if the store is full
+    (an evicted bucket starts full again)
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        """
+        Initializes the store
+        :param maxsize: Maximum number of buckets
+        """
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # key -> (tokens, updated at)
+        self._lock = Lock()
+
+    def consume(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        now = monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            retry_after = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                retry_after = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter, every key (e.g. client IP or username) has its own bucket
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float, store: Optional[RateLimitStore] = None):
+        """
+        Initializes the rate limiter
+        :param name: Name of the limiter (prefix of the bucket keys and metrics label)
+        :param rate: Allowed requests per second (long term)
+        :param capacity: Allowed burst size
+        :param store: Token bucket store (default is an in-process store)
+        """
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.allowed, self.rejected = 0, 0
+        self._store = store or MemoryRateLimitStore()
+
+    def acquire(self, key: str) -> float:
+        """
+        Takes a token from the bucket of a key
+        :param key: Bucket key
+        :return: 0 if the request is allowed, otherwise the seconds until the next request is allowed
+        """
+        retry_after = self._store.consume(f"{self.name}:{key}", self.rate, self.capacity)
+        if retry_after:
+            self.rejected += 1
+        else:
+            self.allowed += 1
+        return retry_after
@@ -0,0 +1,155 @@
+import logging
+from typing import Dict, Optional
+from mongoengine.connection import get_connection
+from starlette.concurrency import run_in_threadpool
+
+from auth import access_token_cache, create_password_executor
+from instrumentation import command_listener
+from orm import connect_database, disconnect_database, get_motor_database
+from orm.async_repositories import AsyncRepositoryContainerBase, AsyncRepositoryContainer, \
+    ThreadPoolRepositoryContainer
+from orm.indexes import check_indexes
+from orm.memory_repositories import MemoryDatabase, MemoryRepositoryContainer
+from orm.repositories import answer_key_cache, category_cache, principal_cache, RepositoryContainer
+from response_cache import category_response_cache, quiz_list_response_cache, quiz_response_cache
+from settings import get_settings
+from utilities import BoundedExecutor
+
+
+class AppResources:
+    """
+    Application scoped resources (database connections, repository container, caches and executors),
+    created once on startup and closed on shutdown
+    """
+
+    def __init__(self):
+        self._repository_container: Optional[AsyncRepositoryContainerBase] = None
+        self._password_executor: Optional[BoundedExecutor] = None
+        self.memory_database: Optional[MemoryDatabase] = None
+
+    @property
+    def repository_container(self) -> AsyncRepositoryContainerBase:
+        """
+        :return: Repository container
+        """
+        if self._repository_container is None:
+            raise RuntimeError("The application resources are not started")
+        return self._repository_container
+
+    @property
+    def password_executor(self) -> BoundedExecutor:
+        """
+        :return: Executor that hashes and verifies the passwords
+        """
+        if self._password_executor is None:
+            raise RuntimeError("The application resources are not started")
+        return self._password_executor
+
+    @property
+    def executors(self) -> Dict[str, BoundedExecutor]:
+        """
+        :return: Started executors by name (for the metrics)
+        """
+        return {"password": self._password_executor} if self._password_executor is not None else {}
+
+    def create_repository_container(self) -> AsyncRepositoryContainerBase:
+        """
+        Creates the repository container of the configured repository backend.
+        Either the async (motor) repositories or the sync (mongoengine or in-memory) repositories, which are executed
+        in the threadpool, are used.
+        :return: Repository container
+        """
+        backend = get_settings().repository_backend
+        if backend == "motor":
+            return AsyncRepositoryContainer(self.password_executor)
+        if backend == "memory":
+            return ThreadPoolRepositoryContainer(MemoryRepositoryContainer(self.memory_database),
+                                                 self.password_executor)
+        return ThreadPoolRepositoryContainer(RepositoryContainer(), self.password_executor)
+
+    async def startup(self):
+        """
+        Connects to MongoDB, creates the missing indexes, creates the repository container and warms it up.
+        The memory backend loads its snapshot instead (MongoDB is not used).
+        :return: None
+        """
+        settings = get_settings()
+        # The caches are process wide, entries of a previous run may be stale (e.g. another database or snapshot)
+        self.clear_caches()
+        self._password_executor = create_password_executor()
+        if settings.repository_backend == "memory":
+            self.memory_database = MemoryDatabase(settings.memory_snapshot_path)
+            if settings.memory_snapshot_path:
+                await run_in_threadpool(self.memory_database.load)
+            self._repository_container = self.create_repository_container()
+            return
+        connect_database(event_listeners=[command_listener])
+        await run_in_threadpool(self.create_indexes, settings.create_indexes_on_startup)
+        self._repository_container = self.create_repository_container()
+        await self.warm_up()
+
+    @staticmethod
+    def clear_caches():
+        """
+        Clears the process wide caches
+        :return: None
+        """
+        for cache in (answer_key_cache, principal_cache, access_token_cache, quiz_response_cache,
+                      quiz_list_response_cache, category_response_cache):
+            cache.clear()
+        category_cache.invalidate()
+
+    @staticmethod
+    def create_indexes(create: bool = True):
+        """
+        Creates the missing indexes of the orm models and reports indexes that are not declared.
+        Unique indexes are required even if the creation is disabled, the duplicate checks rely on them
+        (e.g. insert_unique of the categories and users)
+        :param create: If false, the missing indexes are only reported
+        :raises RuntimeError: If a unique index is missing
+        :return: None
+        """
+        logger = logging.getLogger(__name__)
+        missing_unique = []
+        for report in check_indexes(create=create):
+            for spec in report.missing:
+                if report.created:
+                    logger.info("Created index %s on %s", spec, report.collection)
+                else:
+                    logger.warning("Index %s on %s is missing", spec, report.collection)
+                    if spec.unique:
+                        missing_unique.append(f"{report.collection} {spec}")
+            for spec in report.extra:
+                logger.warning("Index %s on %s is not declared in the orm models", spec, report.collection)
+        if missing_unique:
+            raise RuntimeError(f"Unique indexes are missing ({', '.join(missing_unique)}), create them with "
+                               f"python -m orm.indexes")
+
+    async def warm_up(self):
+        """
+        Establishes the database connections and preloads the caches
+        :return: None
+        """
+        await run_in_threadpool(get_connection().admin.command, "ping")
+        if get_settings().repository_backend == "motor":
+            await get_motor_database().client.admin.command("ping")
+        if get_settings().preload_caches_on_startup:
+            await self.repository_container.category.get_snapshot()
+
+    async def shutdown(self):
+        """
+        Closes the database connections (or saves the snapshot of the memory backend) and stops the executors
+        :return: None
+        """
+        self._repository_container = None
+        if self._password_executor is not None:
+            self._password_executor.shutdown(wait=False)
+            self._password_executor = None
+        if self.memory_database is None:
+            disconnect_database()
+        elif self.memory_database.snapshot_path:
+            await run_in_threadpool(self.memory_database.save)
+        self.memory_database = None
+
+
+resources = AppResources()
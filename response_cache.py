@@ -0,0 +1,97 @@
+import json
+from hashlib import blake2b
+from typing import Any, Awaitable, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from starlette.requests import Request
+from starlette.responses import Response
+
+from settings import get_settings
+from utilities import LRUCache
+
+
+class CachedResponse(NamedTuple):
+    """
+    Serialized JSON response body with a strong ETag
+    """
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+
+    @classmethod
+    def create(cls, content: Any, headers: Optional[Dict[str, str]] = None) -> "CachedResponse":
+        """
+        Serializes the response content (like the FastAPI JSON response), the ETag is the hash of the body.
+        The hash of the serialized document is its version, so all workers return the same ETag for the same data
+        :param content: Response content (e.g. pydantic models)
+        :param headers: Additional response headers (e.g. X-Next-Cursor)
+        :return: Cached response
+        """
+        body = json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None,
+                          separators=(",", ":")).encode("utf-8")
+        return cls(body=body, etag=f'"{blake2b(body, digest_size=16).hexdigest()}"', headers=headers or {})
+
+    def to_response(self, request: Request) -> Response:
+        """
+        Creates the response of a request, conditional requests with a matching ETag are answered with 304
+        :param request: Request (If-None-Match header)
+        :return: Response
+        """
+        # no-cache: clients and CDNs may store the response, but have to revalidate it with If-None-Match
+        headers = {**self.headers, "ETag": self.etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Evaluates an If-None-Match header (uses the weak comparison, see RFC 7232)
+    :param if_none_match: Header value (list of entity tags or *)
+    :param etag: Current entity tag
+    :return: True if the client has the current representation
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def _create_cache() -> LRUCache:
+    settings = get_settings()
+    return LRUCache(maxsize=settings.response_cache_size, getsizeof=lambda response: len(response.body),
+                    ttl=settings.response_cache_ttl)
+
+
+# Process wide caches of serialized responses, invalidated when quizzes or categories are written (see
+# orm.repositories.invalidate_quiz and invalidate_categories), the size is measured in bytes
+quiz_response_cache = _create_cache()  # Quiz ID -> response
+quiz_list_response_cache = _create_cache()  # Query -> response, cleared on every quiz write
+category_response_cache = _create_cache()  # Category ID or query -> response, cleared on every category write
+
+
+def get_query_key(request: Request) -> Tuple[Tuple[str, str], ...]:
+    """
+    Cache key of a query, independent of the parameter order
+    :param request: Request
+    :return: Sorted query parameters
+    """
+    return tuple(sorted(request.query_params.multi_items()))
+
+
+async def get_cached_response(request: Request, cache: LRUCache, key: Hashable,
+                              load: Callable[[], Awaitable[Tuple[Any, Optional[Dict[str, str]]]]]) -> Response:
+    """
+    Returns the cached response of a key, the response is loaded, serialized and cached if it is not cached
+    :param request: Request
+    :param cache: Response cache
+    :param key: Cache key
+    :param load: Loads the response content and headers (exceptions, e.g. 404, are not cached)
+    :return: Response (304 if the client has the current representation)
+    """
+    cached: Optional[CachedResponse] = cache.get(key)
+    if cached is None:
+        generation = cache.generation
+        content, headers = await load()
+        cached = CachedResponse.create(content, headers)
+        cache.put(key, cached, generation=generation)
+    return cached.to_response(request)
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from mongoengine import NotUniqueError
 from typing import List
 
-from dependencies import get_repository_container, common_filter_parameters, get_current_active_user
-from orm.repositories import RepositoryContainerBase
+from dependencies import get_repository_container, common_filter_parameters, get_current_active_user, \
+    get_next_cursor
+from orm.async_repositories import AsyncRepositoryContainerBase
+from response_cache import category_response_cache, get_cached_response, get_query_key
 import schemas
 
 router = APIRouter(
@@ -12,9 +15,9 @@ router = APIRouter(
 
 
 @router.post("/", response_model=schemas.CategoryInDb)
-def create_category(category: schemas.CategoryUpsert,
-                    current_user: schemas.UserInDb = Depends(get_current_active_user),
-                    db: RepositoryContainerBase = Depends(get_repository_container)):
+async def create_category(category: schemas.CategoryUpsert,
+                          current_user: schemas.UserInDb = Depends(get_current_active_user),
+                          db: AsyncRepositoryContainerBase = Depends(get_repository_container)):
     """
     Endpoint for creating a category entity.
     :param category: Category data
@@ -22,15 +25,17 @@ def create_category(category: schemas.CategoryUpsert,
     :param db: Repository container
     :return: Returns the created category
     """
-    if len(db.category.filter(title=category.title)) == 0:
-        return db.category.persist(category)
-    raise HTTPException(status_code=400, detail="Category already exists")
+    # The title is unique, an existing category is detected by the insert itself
+    try:
+        return await db.category.insert_unique(category)
+    except NotUniqueError:
+        raise HTTPException(status_code=400, detail="Category already exists")
 
 
 @router.delete("/{category_id}")
-def delete_category(category_id: int,
-                    current_user: schemas.UserInDb = Depends(get_current_active_user),
-                    db: RepositoryContainerBase = Depends(get_repository_container)):
+async def delete_category(category_id: int,
+                          current_user: schemas.UserInDb = Depends(get_current_active_user),
+                          db: AsyncRepositoryContainerBase = Depends(get_repository_container)):
     """
     Deletes an unused category
     :param category_id: ID of the to be deleted category
@@ -38,29 +43,28 @@ def delete_category(category_id: int,
     :param db: Repository container
     :return: 200 if OK
     """
-    category_del = db.category.get(category_id)
+    category_del = await db.category.get(category_id)
     if category_del is None:
         raise HTTPException(status_code=404, detail="Category does not exists")
 
-    # quizzes = db.quiz.filter(categories=category_id, only=["identifier"])
-
-    quizzes = db.quiz.filter(categories__in=[category_id])
-    if len(quizzes) > 0:
+    if await db.quiz.exists(categories=category_id):
         raise HTTPException(status_code=400, detail="Category is in use, unable to delete category")
-    db.category.delete(category_del)
+    await db.category.delete(category_del)
     return 200
 
 
 @router.get("/", response_model=List[schemas.CategoryInDb])
-def read_categories(title: str = None, description: str = None, commons=Depends(common_filter_parameters),
-                    db: RepositoryContainerBase = Depends(get_repository_container)):
+async def read_categories(title: str = None, description: str = None, commons=Depends(common_filter_parameters),
+                          request: Request = None,
+                          db: AsyncRepositoryContainerBase = Depends(get_repository_container)) -> Response:
     """
     Endpoint for quering categories
     :param title: Returns all categories that contain the search value in the title
     :param description: Returns all categories that contain the search value in the description
-    :param commons: Common filter parameters
+    :param commons: Common filter parameters (q searches the title and description with the text index)
+    :param request: Request (conditional requests with If-None-Match are answered with 304 Not Modified)
     :param db:Repository Container
-    :return: List of retrieved categories
+    :return: List of retrieved categories, the cursor of the next page is returned in the X-Next-Cursor header
     """
     db_query_params = dict(commons)
 
@@ -70,18 +74,29 @@ def read_categories(title: str = None, description: str = None, commons=Depends(
     if description:
         db_query_params["description__icontains"] = description
 
-    return db.category.filter(**db_query_params)
+    async def load():
+        categories = await db.category.filter(**db_query_params)
+        next_cursor = get_next_cursor(categories, commons)
+        return categories, {"X-Next-Cursor": next_cursor} if next_cursor else None
+
+    # The category IDs and the queries share the cache, the responses are cleared on every category write
+    return await get_cached_response(request, category_response_cache, ("query", get_query_key(request)), load)
 
 
 @router.get("/{category_id}", response_model=schemas.CategoryInDb)
-def read_category(category_id: int, db: RepositoryContainerBase = Depends(get_repository_container)):
+async def read_category(category_id: int, request: Request,
+                        db: AsyncRepositoryContainerBase = Depends(get_repository_container)) -> Response:
     """
     Gets a category by ID
     :param category_id: Category ID
+    :param request: Request (conditional requests with If-None-Match are answered with 304 Not Modified)
     :param db: Repository Container
     :return: Category
     """
-    category = db.category.get(category_id)
-    if category is None:
-        raise HTTPException(status_code=404, detail="Category does not exists")
-    return category
+    async def load():
+        category = await db.category.get(category_id)
+        if category is None:
+            raise HTTPException(status_code=404, detail="Category does not exists")
+        return category, None
+
+    return await get_cached_response(request, category_response_cache, ("category", category_id), load)
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from auth import access_token_cache
+from dependencies import rate_limiters
+from instrumentation import registry, StatsCollector
+from orm.repositories import answer_key_cache, async_quiz_flights, category_cache, principal_cache
+from resources import resources
+from response_cache import category_response_cache, quiz_list_response_cache, quiz_response_cache
+
+router = APIRouter(
+    tags=["metrics"]
+)
+
+registry.register(StatsCollector(caches={"answer_key": answer_key_cache,
+                                         "category": category_cache,
+                                         "principal": principal_cache,
+                                         "access_token": access_token_cache,
+                                         "quiz_response": quiz_response_cache,
+                                         "quiz_list_response": quiz_list_response_cache,
+                                         "category_response": category_response_cache},
+                                 rate_limiters=rate_limiters,
+                                 executors=lambda: resources.executors,
+                                 single_flights={"quiz": async_quiz_flights}))
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Exposes the API metrics in the Prometheus text format
+    :return: Metrics
+    """
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
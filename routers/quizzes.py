@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import List, Optional, Union
 
-from dependencies import get_repository_container, get_current_active_user, common_filter_parameters
-from orm.repositories import RepositoryContainerBase
+from dependencies import get_repository_container, get_current_active_user, common_filter_parameters, \
+    get_next_cursor
+from orm.async_repositories import AsyncRepositoryContainerBase
+from response_cache import get_cached_response, get_query_key, quiz_list_response_cache, quiz_response_cache
 import services
 import schemas
 
@@ -12,34 +14,46 @@ router = APIRouter(
 )
 
 
-def check_if_categories_exists(db: RepositoryContainerBase, category_ids: List[int]):
+async def check_if_categories_exists(db: AsyncRepositoryContainerBase, category_ids: List[int]):
     """
     Checks if a list of categories exists. Raises an HTTP exeption if one of the provided ID's does not exist
     :param db: Repository container
     :param category_ids: List of categories ID's
     :return: None
     """
+    if not category_ids or await db.category.count(identifier__in=category_ids) == len(set(category_ids)):
+        return
+    # At least one category does not exist
+    categories = await db.category.filter(identifier__in=category_ids, limit=len(category_ids))
+    existing_category_ids = {category.identifier for category in categories}
     for category_id in category_ids:
-        if db.category.get(category_id) is None:
+        if category_id not in existing_category_ids:
             raise HTTPException(status_code=404, detail=f"Category with {category_id} does not exists")
 
 
-@router.get("/", response_model=List[schemas.Quiz])
-def read_quizzes(title: str = None,
-                 description: str = None,
-                 owner_email: str = None,
-                 categories: List[int] = Query(None),
-                 commons=Depends(common_filter_parameters),
-                 db: RepositoryContainerBase = Depends(get_repository_container)):
+# The summary comes first, a quiz summary would also be a valid quiz (without questions)
+@router.get("/", response_model=Union[List[schemas.QuizSummary], List[schemas.Quiz]])
+async def read_quizzes(title: str = None,
+                       description: str = None,
+                       owner_email: str = None,
+                       categories: List[int] = Query(None),
+                       view: schemas.QuizView = schemas.QuizView.full,
+                       commons=Depends(common_filter_parameters),
+                       request: Request = None,
+                       db: AsyncRepositoryContainerBase = Depends(get_repository_container)) -> Response:
     """
     Endpoint for quering quizzes
     :param title: Returns all quizzes that contain the search value in the title
     :param description: Returns all quizzes that contain the search value in the description
     :param owner_email: Returns all quizess which are owned by the provided user
     :param categories: List of categories -> returns all
+    :param view: "full" returns the complete quizzes, "summary" returns the quizzes without questions
+    (just the question count)
     :param commons: Returns all quizzes that contain one or more of the provided category IDs.
+    Common filter parameters (q searches the title and description with the text index)
+    :param request: Request (conditional requests with If-None-Match are answered with 304 Not Modified)
     :param db: Repository Container
-    :return: List of retrieved categories
+    :return: List of retrieved quizzes, the cursor of the next page is returned in the X-Next-Cursor header
     """
     db_query_params = dict(commons)
 
@@ -52,27 +66,40 @@ def read_quizzes(title: str = None,
     if owner_email:
         db_query_params["owner"] = owner_email
 
-    return db.quiz.filter(**db_query_params)
+    async def load():
+        if view == schemas.QuizView.summary:
+            quizzes = await db.quiz.filter_summaries(**db_query_params)
+        else:
+            quizzes = await db.quiz.filter(**db_query_params)
+        next_cursor = get_next_cursor(quizzes, commons)
+        return quizzes, {"X-Next-Cursor": next_cursor} if next_cursor else None
+
+    return await get_cached_response(request, quiz_list_response_cache, get_query_key(request), load)
 
 
 @router.get("/{quiz_id}", response_model=schemas.Quiz)
-def read_quiz(quiz_id: int, db: RepositoryContainerBase = Depends(get_repository_container)):
+async def read_quiz(quiz_id: int, request: Request,
+                    db: AsyncRepositoryContainerBase = Depends(get_repository_container)) -> Response:
     """
     Gets a quiz by id
     :param quiz_id: Quiz ID
+    :param request: Request (conditional requests with If-None-Match are answered with 304 Not Modified)
     :param db: Repository Container
     :return: Quiz
     """
-    quiz = db.quiz.get(quiz_id)
-    if quiz is None:
-        raise HTTPException(status_code=404, detail="Quiz does not exists")
-    return quiz
+    async def load():
+        quiz = await db.quiz.get(quiz_id)
+        if quiz is None:
+            raise HTTPException(status_code=404, detail="Quiz does not exists")
+        return quiz, None
+
+    return await get_cached_response(request, quiz_response_cache, quiz_id, load)
 
 
 @router.post("/", response_model=schemas.Quiz)
-def create_quiz(quiz: schemas.QuizUpsert,
-                current_user: schemas.UserInDb = Depends(get_current_active_user),
-                db: RepositoryContainerBase = Depends(get_repository_container)):
+async def create_quiz(quiz: schemas.QuizUpsert,
+                      current_user: schemas.UserInDb = Depends(get_current_active_user),
+                      db: AsyncRepositoryContainerBase = Depends(get_repository_container)):
     """
     Creates a quiz
     :param quiz: Quiz data
@@ -80,16 +107,16 @@ def create_quiz(quiz: schemas.QuizUpsert,
     :param db: Repository Container
     :return: Returns the created quiz
     """
-    check_if_categories_exists(db, quiz.categories)
+    await check_if_categories_exists(db, quiz.categories)
     db_quiz = schemas.Quiz(**quiz.dict(), owner=current_user.email)
-    return db.quiz.persist(db_quiz)
+    return await db.quiz.persist(db_quiz)
 
 
 @router.put("/{quiz_id}", response_model=schemas.Quiz)
-def update_quiz(quiz_id: int,
-                quiz_update: schemas.QuizUpsert,
-                current_user: schemas.UserInDb = Depends(get_current_active_user),
-                db: RepositoryContainerBase = Depends(get_repository_container)):
+async def update_quiz(quiz_id: int,
+                      quiz_update: schemas.QuizUpsert,
+                      current_user: schemas.UserInDb = Depends(get_current_active_user),
+                      db: AsyncRepositoryContainerBase = Depends(get_repository_container)):
     """
     Updates/ Overwrites a quiz by ID
     :param quiz_id: Quiz ID
@@ -98,12 +125,12 @@ def update_quiz(quiz_id: int,
     :param db: Container Repository
     :return: Returns the updated quiz
     """
-    quiz: schemas.Quiz = db.quiz.get(quiz_id)
+    quiz: schemas.Quiz = await db.quiz.get(quiz_id)
     if quiz is None:
         raise HTTPException(status_code=404, detail="Quiz does not exists")
     if quiz.owner != current_user.email:
         raise HTTPException(status_code=401)
-    check_if_categories_exists(db, quiz.categories)
+    await check_if_categories_exists(db, quiz_update.categories)
     # Does not work, creates an object of type QuizUpsert and not of type Quiz
     # update_dict = quiz_update.dict()
     # quiz_updated: schemas.Quiz = quiz.copy(update=update_dict, deep=True)
@@ -111,34 +138,68 @@ def update_quiz(quiz_id: int,
     db_quiz_update = schemas.Quiz(**quiz_update.dict(), owner=current_user.email)
     db_quiz_update.identifier = quiz.identifier
 
-    return db.quiz.persist(db_quiz_update)
+    return await db.quiz.persist(db_quiz_update)
 
 
 @router.post("/validate", response_model=schemas.QuizValidationResult)
-def validate_quiz(quiz_submit: schemas.QuizSubmit,
-                  db: RepositoryContainerBase = Depends(get_repository_container)):
+async def validate_quiz(quiz_submit: schemas.QuizSubmit,
+                        db: AsyncRepositoryContainerBase = Depends(get_repository_container)):
     """
     Validates a quiz and returns the reached points
     :param quiz_submit: Quiz submit data
     :param db: Repository Container
     :return: Quiz validation result (total points and reached points)
     """
-    # noinspection PyTypeChecker
-    quiz: schemas.Quiz = db.quiz.get(quiz_submit.identifier)
-    if quiz is None:
+    # The compiled answer key is cached, so no quiz has to be loaded for grading
+    answer_key: services.AnswerKey = await db.quiz.get_answer_key(quiz_submit.identifier)
+    if answer_key is None:
         raise HTTPException(status_code=404, detail="Quiz does not exists")
 
-    validation_result = services.validate_quiz(quiz, quiz_submit)
+    validation_result = services.grade_quiz(answer_key, quiz_submit)
     if validation_result is None:
         raise HTTPException(status_code=400)
 
     return validation_result
 
 
+@router.post("/validate/batch", response_model=List[schemas.QuizBatchValidationResult])
+async def validate_quizzes(quiz_submits: List[schemas.QuizSubmit],
+                           db: AsyncRepositoryContainerBase = Depends(get_repository_container)):
+    """
+    Validates multiple quiz submits (of one or more quizzes) at once.
+    Errors are reported per submit (404 if the quiz does not exist, 400 if the submit is invalid),
+    instead of failing the whole batch.
+    :param quiz_submits: List of quiz submit data (only values between 0 and 1000 are allowed)
+    :param db: Repository Container
+    :return: List of validation results, in the order of the submits
+    """
+    if len(quiz_submits) > 1000:
+        raise HTTPException(status_code=400, detail=f"Batch size ({len(quiz_submits)}) is invalid")
+
+    # All quizzes that are not cached are loaded with a single query
+    answer_keys = await db.quiz.get_answer_keys([quiz_submit.identifier for quiz_submit in quiz_submits])
+
+    validation_results = []
+    for quiz_submit in quiz_submits:
+        answer_key = answer_keys.get(quiz_submit.identifier)
+        if answer_key is None:
+            validation_results.append(schemas.QuizBatchValidationResult(
+                identifier=quiz_submit.identifier, status_code=404, detail="Quiz does not exists"))
+            continue
+        validation_result = services.grade_quiz(answer_key, quiz_submit)
+        if validation_result is None:
+            validation_results.append(schemas.QuizBatchValidationResult(
+                identifier=quiz_submit.identifier, status_code=400, detail="Quiz submit is invalid"))
+            continue
+        validation_results.append(schemas.QuizBatchValidationResult(
+            identifier=quiz_submit.identifier, status_code=200, result=validation_result))
+    return validation_results
+
+
 @router.delete("/{quiz_id}")
-def delete_quiz(quiz_id: int,
-                current_user: schemas.UserInDb = Depends(get_current_active_user),
-                db: RepositoryContainerBase = Depends(get_repository_container)):
+async def delete_quiz(quiz_id: int,
+                      current_user: schemas.UserInDb = Depends(get_current_active_user),
+                      db: AsyncRepositoryContainerBase = Depends(get_repository_container)):
     """
     Deletes a quiz by ID. A user has to be the owner of the quiz, otherwise this endpoint returns a 401 code
     :param quiz_id: Quiz ID
@@ -146,10 +207,10 @@ def delete_quiz(quiz_id: int,
     :param current_user: Current User
     :return: 200 if OK
     """
-    quiz_del = db.quiz.get(quiz_id)
+    quiz_del = await db.quiz.get(quiz_id)
     if quiz_del is None:
         raise HTTPException(status_code=404, detail="Quiz does not exists")
     if quiz_del.owner != current_user.email:
         raise HTTPException(status_code=401)
-    db.quiz.delete(quiz_del)
+    await db.quiz.delete(quiz_del)
     return 200
@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Form, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
+from mongoengine import NotUniqueError
 
 import schemas
 from settings import get_settings
-from dependencies import get_repository_container, get_current_active_user
-from orm.repositories import RepositoryContainerBase
+from dependencies import get_repository_container, get_current_active_user, get_password_executor, login_rate_limit, \
+    signup_rate_limit
+from orm.async_repositories import AsyncRepositoryContainerBase
 from auth import credentials_exception
-from auth.utilities import create_access_token
+from utilities import BoundedExecutor
+from auth.utilities import create_access_token, create_refresh_token, get_claims_from_refresh_token, \
+    get_password_hash_async
 
 router = APIRouter(
     prefix="/users",
@@ -14,43 +19,94 @@ router = APIRouter(
 )
 
 
-@router.post("/token", response_model=schemas.Token)
-def token(db: RepositoryContainerBase = Depends(get_repository_container),
-          form_data: OAuth2PasswordRequestForm = Depends(OAuth2PasswordRequestForm)):
+@router.post("/token", response_model=schemas.Token, dependencies=[Depends(login_rate_limit)])
+async def token(db: AsyncRepositoryContainerBase = Depends(get_repository_container),
+                form_data: OAuth2PasswordRequestForm = Depends(OAuth2PasswordRequestForm)):
     """
     OAUTH2 token endpoint
     :param db: Repository Container
     :param form_data: OAUTH2 form data (contains username & password)
-    :return: JWT token
+    :return: JWT token and refresh token
     """
-    user: schemas.UserInDb = db.user.authenticate_user(form_data.username, form_data.password)
+    user: schemas.UserInDb = await db.user.authenticate_user(form_data.username, form_data.password)
     if not user:
         raise credentials_exception
     settings = get_settings()
+    access_token = create_access_token(data={"sub": user.email},
+                                       secret_key=settings.auth_secret_key,
+                                       algorithm=settings.auth_algorithm)
+    refresh_token = create_refresh_token(subject=user.email,
+                                         secret_key=settings.auth_secret_key,
+                                         algorithm=settings.auth_algorithm,
+                                         expires_delta=timedelta(days=settings.refresh_token_expire_days))
+    return schemas.Token(access_token=access_token, token_type="bearer", refresh_token=refresh_token)
+
+
+@router.post("/token/refresh", response_model=schemas.Token)
+async def refresh(grant_type: str = Form(..., regex="^refresh_token$"),
+                  refresh_token: str = Form(...),
+                  db: AsyncRepositoryContainerBase = Depends(get_repository_container)):
+    """
+    OAUTH2 refresh token grant, issues a new access token without a password verification
+    :param grant_type: Must be "refresh_token"
+    :param refresh_token: Refresh token of the token endpoint
+    :param db: Repository Container
+    :return: JWT token
+    """
+    settings = get_settings()
+    claims = get_claims_from_refresh_token(token=refresh_token,
+                                           secret_key=settings.auth_secret_key,
+                                           algorithm=settings.auth_algorithm)
+    if await db.user.is_refresh_token_revoked(claims["jti"]):
+        raise credentials_exception
+    user: schemas.UserInDb = await db.user.get_principal(claims["sub"])
+    if not user or user.disabled:
+        raise credentials_exception
     access_token = create_access_token(data={"sub": user.email},
                                        secret_key=settings.auth_secret_key,
                                        algorithm=settings.auth_algorithm)
     return schemas.Token(access_token=access_token, token_type="bearer")
 
 
-@router.post("/signup", response_model=schemas.User)
-def signup(user_signup: schemas.UserUpsert, db: RepositoryContainerBase = Depends(get_repository_container)):
+@router.post("/token/revoke")
+async def revoke(token: str = Form(...), db: AsyncRepositoryContainerBase = Depends(get_repository_container)):
+    """
+    Revokes a refresh token
+    :param token: Refresh token
+    :param db: Repository Container
+    :return: 200 if OK
+    """
+    settings = get_settings()
+    claims = get_claims_from_refresh_token(token=token,
+                                           secret_key=settings.auth_secret_key,
+                                           algorithm=settings.auth_algorithm)
+    await db.user.revoke_refresh_token(claims["jti"], datetime.utcfromtimestamp(claims["exp"]))
+    return 200
+
+
+@router.post("/signup", response_model=schemas.User, dependencies=[Depends(signup_rate_limit)])
+async def signup(user_signup: schemas.UserUpsert,
+                 db: AsyncRepositoryContainerBase = Depends(get_repository_container),
+                 password_executor: BoundedExecutor = Depends(get_password_executor)):
     """
     Endpoint for user signup/registration
     :param user_signup: User signup data
     :param db: Repository Container
+    :param password_executor: Executor that hashes the password
     :return: Returns the created user
     """
-    if db.user.get(user_signup.email) is not None:
-        raise HTTPException(status_code=400, detail="User already exists")
     user = schemas.UserInDb(**user_signup.dict(exclude={"password"}),
                             disabled=False,
-                            password_hash=user_signup.password)
-    return db.user.persist(user)
+                            password_hash=await get_password_hash_async(password_executor, user_signup.password))
+    # The email is the primary key, an existing user is detected by the insert itself
+    try:
+        return await db.user.insert_unique(user)
+    except NotUniqueError:
+        raise HTTPException(status_code=400, detail="User already exists")
 
 
 @router.get("/me", response_model=schemas.User)
-def get_current_user(current_user: schemas.UserInDb = Depends(get_current_active_user)):
+async def get_current_user(current_user: schemas.UserInDb = Depends(get_current_active_user)):
     """
     Gets the user information of the current logged-in user
     :param current_user: Current user
@@ -1,9 +1,8 @@
+from enum import Enum
 from typing import List, Optional
 from pydantic import BaseModel, validator, ValidationError
 import re
 
-from auth.utilities import get_password_hash
-
 
 # User models
 class User(BaseModel):
@@ -43,7 +42,7 @@ class UserUpsert(User):
         """
         Pydantic Validation -> checks if a password meets the security compliances (like password length etc.)
         :param v: Plaintext password
-        :return: Returns the hashed password
+        :return: Returns the password (the password is hashed by the signup)
         """
         if not v:
             return None
@@ -56,12 +55,13 @@ class UserUpsert(User):
             raise ValidationError("Password should contain upper case letters")
         if re.search(r"[ !#$%&'()*+,-./[\\\]^_`{|}~" + r'"]', v) is None:
             raise ValidationError("Password should contain symbols")
-        return get_password_hash(v)
+        return v
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
 
 class TokenData(Token):
@@ -173,6 +173,17 @@ class Quiz(QuizBase):
         orm_mode = True
 
 
+class QuizSummary(QuizBase):
+    identifier: Optional[int]
+    owner: str
+    question_count: int
+
+
+class QuizView(str, Enum):
+    full = "full"
+    summary = "summary"
+
+
 # Quiz Submit Models
 class AnswerSubmit(BaseModel):
     identifier: int
@@ -192,3 +203,10 @@ class QuizSubmit(BaseModel):
 class QuizValidationResult(BaseModel):
     total_points: int
     points: int
+
+
+class QuizBatchValidationResult(BaseModel):
+    identifier: int
+    status_code: int
+    detail: Optional[str] = None
+    result: Optional[QuizValidationResult] = None
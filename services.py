@@ -1,7 +1,64 @@
-from schemas import Quiz, QuizSubmit, QuestionSubmit, AnswerSubmit, QuizValidationResult
+from typing import Dict, NamedTuple, Optional
 
+from schemas import Quiz, QuizSubmit, QuizValidationResult
 
-def validate_quiz(quiz: Quiz, quiz_submit: QuizSubmit) -> [QuizValidationResult, None]:
+
+class AnswerKey(NamedTuple):
+    """
+    Compiled answer key of a quiz, contains everything that is required for grading a quiz submit
+    """
+    identifier: int
+    total_points: int
+    # Question ID -> (Answer ID -> is correct), in the order of the quiz
+    questions: Dict[int, Dict[int, bool]]
+
+
+def compile_answer_key(quiz: Quiz) -> AnswerKey:
+    """
+    Compiles the answer key of a quiz, the answer key can be reused for grading any number of quiz submits
+    :param quiz: The quiz data
+    :return: Answer key
+    """
+    questions = {question.identifier: {answer.identifier: answer.is_correct for answer in question.answers}
+                 for question in quiz.questions}
+    total_points = sum(sum(answers.values()) for answers in questions.values())
+    return AnswerKey(identifier=quiz.identifier, total_points=total_points, questions=questions)
+
+
+def grade_quiz(answer_key: AnswerKey, quiz_submit: QuizSubmit) -> Optional[QuizValidationResult]:
+    """
+    Grades a quiz submit with a compiled answer key and returns the total and reached points.
+    If one answer is incorrect, the user gets 0 reached points, this is to prevent that a user checks all answers
+    :param answer_key: Compiled answer key of the quiz
+    :param quiz_submit: The submitted quiz data
+    :return: Validation result or None if a question or an answer was not submitted
+    """
+    # Index the submit once, if an identifier was submitted more than once the first occurence counts
+    submitted_questions = {}
+    for question_submit in quiz_submit.questions:
+        submitted_questions.setdefault(question_submit.identifier, question_submit)
+
+    points = 0
+    for question_id, answers in answer_key.questions.items():
+        question_submit = submitted_questions.get(question_id)
+        if question_submit is None:
+            return None
+        submitted_answers = {}
+        for answer_submit in question_submit.answers:
+            submitted_answers.setdefault(answer_submit.identifier, answer_submit.is_correct)
+
+        for answer_id, is_correct in answers.items():
+            checked = submitted_answers.get(answer_id)
+            if checked is None:
+                return None
+            # If an answer is checked which is not correct, give 0 points
+            if checked and not is_correct:
+                return QuizValidationResult(total_points=answer_key.total_points, points=0)
+            points += 1 if checked else 0
+    return QuizValidationResult(total_points=answer_key.total_points, points=points)
+
+
+def validate_quiz(quiz: Quiz, quiz_submit: QuizSubmit) -> Optional[QuizValidationResult]:
     """
     Validates a quiz and returns the total and reached points.
     If one answer is incorrect, the user gets 0 reached points, this is to prevent that a user checks all answers
@@ -9,20 +66,4 @@ def validate_quiz(quiz: Quiz, quiz_submit: QuizSubmit) -> [QuizValidationResult,
     :param quiz_submit: The submitted quit data
     :return: Validation result, contains the total and the reached points
     """
-    try:
-        total_points, points = 0, 0
-        for question in quiz.questions:
-            total_points += sum([1 for x in question.answers if x.is_correct])
-            question_submit: QuestionSubmit = [x for x in quiz_submit.questions if question.identifier == x.identifier][
-                0]
-            for answer in question.answers:
-                answer_submit: AnswerSubmit = [x for x in question_submit.answers if answer.identifier == x.identifier][
-                    0]
-                # If an answer is checked which is not correct, give 0 points
-                if answer_submit.is_correct and not answer.is_correct:
-                    return QuizValidationResult(total_points=total_points, points=0)
-
-                points += 1 if answer.is_correct and answer_submit.is_correct else 0
-        return QuizValidationResult(total_points=total_points, points=points)
-    except IndexError:
-        return None
+    return grade_quiz(compile_answer_key(quiz), quiz_submit)
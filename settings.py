@@ -1,5 +1,6 @@
 from pydantic import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 
 class ApiSettings(BaseSettings):
@@ -9,6 +10,45 @@ class ApiSettings(BaseSettings):
     auth_secret_key: str
     auth_algorithm: str
     mongodb_conn_str: str
+    # "mongoengine" runs the blocking repositories in the threadpool, "motor" uses the async repositories,
+    # "memory" keeps all data in memory (no MongoDB required, e.g. for demos and benchmarks)
+    repository_backend: str = "mongoengine"
+    # Snapshot file of the memory backend, loaded on startup and written on shutdown (no persistence if not set)
+    memory_snapshot_path: Optional[str] = None
+    # Compiled answer keys are cached per process, the size is measured in answers. A quiz update only invalidates the
+    # cache of the worker that handled it, the time to live bounds how long other workers validate with the old answers
+    answer_key_cache_size: int = 250_000
+    answer_key_cache_ttl: float = 60
+    # All categories are cached per process, the time to live bounds the staleness between multiple workers
+    category_cache_ttl: float = 60
+    # Verified access tokens and authenticated users are cached per process, the time to live bounds how long a
+    # disabled user stays authenticated on other workers (a token is never cached beyond its expiration)
+    principal_cache_size: int = 10_000
+    principal_cache_ttl: float = 30
+    # bcrypt runs in a dedicated executor, requests are rejected with 503 once all workers are busy and the queue
+    # is full
+    password_hash_workers: int = 2
+    password_hash_queue_size: int = 32
+    # Token bucket rate limits of the token and signup endpoints (requests per second and burst size)
+    rate_limit_ip_rate: float = 1
+    rate_limit_ip_burst: int = 20
+    rate_limit_username_rate: float = 0.1
+    rate_limit_username_burst: int = 5
+    # Number of identifiers that are reserved per counter update
+    sequence_block_size: int = 100
+    # Lifetime of refresh tokens (new access tokens can be requested without a password until then)
+    refresh_token_expire_days: int = 30
+    # Creates missing indexes on startup, see orm.indexes. If disabled, the startup still fails if a unique index is
+    # missing (the duplicate checks rely on the unique indexes)
+    create_indexes_on_startup: bool = True
+    # Loads the category cache on startup
+    preload_caches_on_startup: bool = True
+    # Serialized quiz and category responses are cached per process (size in bytes per cache), the time to live
+    # bounds the staleness between multiple workers
+    response_cache_size: int = 50_000_000
+    response_cache_ttl: float = 60
+    # Requests that take longer (seconds) are logged with the breakdown of their MongoDB commands
+    slow_request_threshold: float = 1.0
 
     class Config:
         env_file = ".env"
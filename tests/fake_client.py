@@ -1,11 +1,15 @@
 from fastapi.testclient import TestClient
 
 from app import app
-from dependencies import get_repository_container
-from .fake_orm_dependicies import get_fake_repository_container
+from dependencies import get_password_executor, get_repository_container, login_rate_limit, signup_rate_limit
+from .fake_orm_dependicies import get_fake_async_repository_container, fake_password_executor
 
 # Dependicy injection -> inject fake database repository container
-app.dependency_overrides[get_repository_container] = get_fake_repository_container
+app.dependency_overrides[get_repository_container] = get_fake_async_repository_container
+app.dependency_overrides[get_password_executor] = lambda: fake_password_executor
+# All test requests come from the same client, the rate limits are tested explicitly
+app.dependency_overrides[login_rate_limit] = lambda: None
+app.dependency_overrides[signup_rate_limit] = lambda: None
 
 # creates a client object with no authentication headers
 client = TestClient(app)
@@ -1,13 +1,21 @@
+from mongoengine import NotUniqueError
 from pydantic import BaseModel
-from typing import List
+from typing import List, Tuple
 from abc import ABC
 from random import randrange
 
-from orm.repositories import RepositoryBase, UserRepository, QuizRepository, CategoryRepository, RepositoryContainerBase
+from orm.repositories import DomainRepository, UserRepository, QuizRepository, CategoryRepository, \
+    RepositoryContainerBase, invalidate_quiz, principal_cache
+from auth import create_password_executor
+from orm.async_repositories import ThreadPoolRepositoryContainer
 from utilities import first_or_default
 import schemas
 
 
+# The application scoped password executor is created on startup, which the test client does not run
+fake_password_executor = create_password_executor()
+
+
 def id_generator():
     """
     Genereates random database ids (normally this would be handled by the database)
@@ -16,16 +24,21 @@ def id_generator():
     return randrange(1000, 100_000_000)
 
 
-class FakeRepository(RepositoryBase, ABC):
+class FakeRepository(DomainRepository, ABC):
     """
-    Fake in-memory database repository base class
+    Fake in-memory database repository base class, replaces the database access of a domain repository
+    (the fake is placed after the domain repository in the bases, if the domain logic of the reads is tested)
     """
 
+    _primary_key: str = "identifier"
+    _unique_fields: Tuple[str, ...] = ()
+
     def __init__(self):
         self._db_storage: List[BaseModel] = []
 
     def filter(self, **kwargs):
-        limit, skip, only = kwargs.pop("limit", 100), kwargs.pop("skip", 0), kwargs.pop("only", None)
+        limit, skip = kwargs.pop("limit", 100), kwargs.pop("skip", 0)
+        order_by, after, search = kwargs.pop("order_by", None), kwargs.pop("after", None), kwargs.pop("search", None)
 
         # Remove MongoEngine specific query operators
         # If testing for specific operator is required, extract the operator and
@@ -43,38 +56,97 @@ class FakeRepository(RepositoryBase, ABC):
         for k in del_keys:  # Remove all filtering operations from kwargs
             del kwargs[k]
 
-        rows = [x for x in self._db_storage[skip: limit] if all(getattr(x, k) == v for k, v in kwargs.items())]
+        # Equality on list fields matches if the list contains the value (like MongoDB)
+        rows = [x for x in self._db_storage if all(
+            v in getattr(x, k) if isinstance(getattr(x, k), list) and not isinstance(v, list) else getattr(x, k) == v
+            for k, v in kwargs.items())]
 
-        # Perform Mongoengine "in" operator
+        # Perform Mongoengine "in" operator (list fields match if they contain one of the values)
         for in_op in in_operators:
             k, v = in_op
             if isinstance(v, list):
-                rows = [row for row in rows if any(item in getattr(row, k) for item in v)]
+                rows = [row for row in rows if any(
+                    item in getattr(row, k) if isinstance(getattr(row, k), list) else item == getattr(row, k)
+                    for item in v)]
         # Perform Mongoengine "icontains" operator
         for icontains_op in icontains_operators:
             k, v = icontains_op
             if isinstance(v, str):
                 rows = [row for row in rows if v.lower() in getattr(row, k).lower()]
 
-        return rows
+        # Perform Mongoengine "order_by" and keyset pagination
+        if order_by:
+            sort = [(field.lstrip("-"), field.startswith("-")) for field in order_by]
+            for field, descending in reversed(sort):
+                rows = sorted(rows, key=lambda row: getattr(row, field), reverse=descending)
+            if after is not None:
+                rows = [row for row in rows if self._is_after(row, sort, after)]
+
+        # Perform a (simplified) MongoDB text search, ordered by relevance
+        if search:
+            rows = [row for row in rows if self._text_score(row, search) > 0]
+            rows = sorted(rows, key=lambda row: self._text_score(row, search), reverse=True)
+
+        return rows[skip: skip + limit] if limit else rows[skip:]
+
+    @staticmethod
+    def _text_score(row: BaseModel, search: str) -> int:
+        terms = search.lower().split()
+        weights = {"title": 10, "description": 2}
+        return sum(weight * sum(term in (getattr(row, field) or "").lower().split() for term in terms)
+                   for field, weight in weights.items())
+
+    @staticmethod
+    def _is_after(row: BaseModel, sort: List[Tuple[str, bool]], after: list) -> bool:
+        for (field, descending), value in zip(sort, after):
+            row_value = getattr(row, field)
+            if row_value != value:
+                return row_value < value if descending else row_value > value
+        return False
+
+    def count(self, **kwargs) -> int:
+        return len(self.filter(**kwargs, limit=len(self._db_storage)))
+
+    def exists(self, **kwargs) -> bool:
+        return self.count(**kwargs) > 0
 
     def persist(self, item: BaseModel):
-        update = False
+        # Replaces the item with the same primary key (like the upsert of the database)
+        key = getattr(item, self._primary_key)
         for idx, list_item in enumerate(self._db_storage):
-            if list_item == item:
+            if getattr(list_item, self._primary_key) == key:
                 self._db_storage[idx] = item
-                update = True
-        if not update:
-            self._db_storage.append(item)
+                return item
+        self._db_storage.append(item)
+        return item
+
+    def insert_unique(self, item: BaseModel):
+        # Simulates the unique indexes of the database
+        for field in self._unique_fields:
+            if any(getattr(x, field) == getattr(item, field) for x in self._db_storage):
+                raise NotUniqueError(f"Duplicate value for {field}")
+        self._db_storage.append(item)
         return item
 
     def delete(self, item: BaseModel):
         self._db_storage.remove(item)
 
 
-class FakeCategoryRepository(FakeRepository, CategoryRepository):
-    def get(self, key):
-        return first_or_default(self.filter(identifier=key))
+class FakeCategoryRepository(CategoryRepository, FakeRepository):
+    """
+    Fake category repository, only the storage is faked (the reads use the category snapshot and the writes
+    invalidate it, see CategoryRepository)
+    """
+    _unique_fields = ("title",)
+
+    def __init__(self):
+        FakeRepository.__init__(self)
+
+    def insert_unique(self, item):
+        # The identifier is generated by the database
+        category = schemas.CategoryInDb(**item.dict())
+        category.identifier = category.identifier or id_generator()
+        return super(FakeCategoryRepository, self).insert_unique(category)
 
 
 class FakeQuizRepository(FakeRepository, QuizRepository):
@@ -91,13 +163,50 @@ class FakeQuizRepository(FakeRepository, QuizRepository):
             q.identifier = q.identifier or id_generator()
             for a in q.answers:
                 a.identifier = a.identifier or id_generator()
-        return super(FakeQuizRepository, self).persist(item)
+        super(FakeQuizRepository, self).persist(item)
+        invalidate_quiz(item.identifier)
+        return item
+
+    def delete(self, item: schemas.Quiz):
+        super(FakeQuizRepository, self).delete(item)
+        invalidate_quiz(item.identifier)
+
+    def filter_summaries(self, **kwargs):
+        return [schemas.QuizSummary(**quiz.dict(exclude={"questions"}), question_count=len(quiz.questions))
+                for quiz in self.filter(**kwargs)]
 
 
 class FakeUserRepository(FakeRepository, UserRepository):
+    _primary_key = "email"
+    _unique_fields = ("email",)
+
+    def __init__(self):
+        super(FakeUserRepository, self).__init__()
+        self._revoked_tokens = {}
+
     def get(self, key):
         return first_or_default(self.filter(email=key))
 
+    def persist(self, item: schemas.UserInDb):
+        super(FakeUserRepository, self).persist(item)
+        principal_cache.invalidate(item.email)
+        return item
+
+    def insert_unique(self, item):
+        user = super(FakeUserRepository, self).insert_unique(item)
+        principal_cache.invalidate(item.email)
+        return user
+
+    def delete(self, item: schemas.UserInDb):
+        super(FakeUserRepository, self).delete(item)
+        principal_cache.invalidate(item.email)
+
+    def revoke_refresh_token(self, jti: str, expires_at):
+        self._revoked_tokens[jti] = expires_at
+
+    def is_refresh_token_revoked(self, jti: str) -> bool:
+        return jti in self._revoked_tokens
+
 
 # Add some fake data
 
@@ -208,3 +317,11 @@ def get_fake_repository_container():
     :return: Fake repository container
     """
     return FakeRepositoryContainer()
+
+
+def get_fake_async_repository_container():
+    """
+    Fake dependicy injection method, exposes the fake repository container through the async repository interface
+    :return: Async fake repository container
+    """
+    return ThreadPoolRepositoryContainer(get_fake_repository_container(), fake_password_executor)
@@ -0,0 +1,21 @@
+import unittest
+from parameterized import parameterized
+
+from benchmarks.suite import compare_results, percentile
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    @parameterized.expand([
+        [0.5, 5],
+        [0.95, 10],
+        [0, 1]
+    ])
+    def test_percentile(self, ratio: float, expected: int):
+        assert percentile(list(range(1, 11)), ratio) == expected
+
+    def test_compare_results(self):
+        baseline = {"fast": {"p50_ms": 1.0}, "slow": {"p50_ms": 1.0}}
+        results = {"fast": {"p50_ms": 1.2}, "slow": {"p50_ms": 1.5}, "new": {"p50_ms": 9.0}}
+        regressions = compare_results(results, baseline, threshold=0.25)
+        assert len(regressions) == 1 and regressions[0].startswith("slow:")
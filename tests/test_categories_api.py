@@ -2,7 +2,10 @@ import unittest
 from parameterized import parameterized
 
 import schemas
-from .fake_client import client, get_fake_repository_container, get_auth_client
+from orm.repositories import category_cache
+from utilities import encode_cursor
+from .fake_client import client, get_auth_client
+from .fake_orm_dependicies import get_fake_repository_container
 
 
 class TestCategoriesApi(unittest.TestCase):
@@ -42,7 +45,28 @@ class TestCategoriesApi(unittest.TestCase):
 
         if response.status_code == 200:
             db = get_fake_repository_container()
-            db.category.delete(category)
+            db.category.delete(db.category.get_by_title(category.title))
+
+    def test_create_and_delete_category_fresh_reads(self):
+        auth_client = get_auth_client("john.doe@gmail.com", "test1234")
+
+        def get_titles():
+            response = client.get(f"{self.base_endpoint_name}/", params={"limit": 1000})
+            assert response.status_code == 200
+            return [category["title"] for category in response.json()]
+
+        assert "Fresh" not in get_titles()
+        response = auth_client.post(f"{self.base_endpoint_name}/", json={"title": "Fresh"})
+        assert response.status_code == 200
+        category_id = response.json()["identifier"]
+        assert "Fresh" in get_titles()
+        # The reads are served from the category snapshot, the create invalidated it
+        assert category_cache.get().by_identifier[category_id].title == "Fresh"
+        assert client.get(f"{self.base_endpoint_name}/{category_id}").json()["title"] == "Fresh"
+
+        assert auth_client.delete(f"{self.base_endpoint_name}/{category_id}").status_code == 200
+        assert "Fresh" not in get_titles()
+        assert client.get(f"{self.base_endpoint_name}/{category_id}").status_code == 404
 
     @parameterized.expand([
         ["john.doe@gmail.com", "test1234", 2, 400],
@@ -53,3 +77,55 @@ class TestCategoriesApi(unittest.TestCase):
         auth_client = get_auth_client(username, password)
         respone = auth_client.delete(f"{self.base_endpoint_name}/{category_id}")
         assert respone.status_code == status_code
+
+    @parameterized.expand([
+        ["identifier"],
+        ["-identifier"],
+        ["title"],
+        ["-title"]
+    ])
+    def test_get_categories_cursor(self, sort: str):
+        all_categories = client.get(f"{self.base_endpoint_name}/", params={"sort": sort}).json()
+        categories, params = [], {"limit": 1, "sort": sort}
+        while True:
+            response = client.get(f"{self.base_endpoint_name}/", params=params)
+            assert response.status_code == 200
+            categories.extend(response.json())
+            if "X-Next-Cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["X-Next-Cursor"]
+        assert categories == all_categories
+
+    @parameterized.expand([
+        [{"cursor": "invalid"}, 400],
+        [{"sort": "description"}, 400],
+        [{"cursor": encode_cursor({"sort": "identifier", "after": [1]})}, 200],
+        [{"cursor": encode_cursor({"sort": "identifier", "after": ["x"]})}, 400],
+        [{"cursor": encode_cursor({"sort": "identifier", "after": [None]})}, 400],
+        [{"cursor": encode_cursor({"sort": "identifier", "after": [True]})}, 400],
+        [{"cursor": encode_cursor({"sort": "identifier", "after": [{"$gt": 0}]})}, 400],
+        [{"sort": "title", "cursor": encode_cursor({"sort": "title", "after": ["Fun", 1]})}, 200],
+        [{"sort": "title", "cursor": encode_cursor({"sort": "title", "after": [1, 1]})}, 400],
+        [{"sort": "-title", "cursor": encode_cursor({"sort": "-title", "after": [{"$ne": ""}, 1]})}, 400]
+    ])
+    def test_get_categories_invalid_pagination(self, params: dict, status_code: int):
+        response = client.get(f"{self.base_endpoint_name}/", params=params)
+        assert response.status_code == status_code
+
+    @parameterized.expand([
+        [{"q": "programming"}, [2]],
+        [{"q": "FUN programming"}, [1, 2]],
+        [{"q": "unknown"}, []]
+    ])
+    def test_search_categories(self, query_params: dict, category_ids: list):
+        response = client.get(f"{self.base_endpoint_name}", params=query_params)
+        assert response.status_code == 200
+        assert sorted([x["identifier"] for x in response.json()]) == category_ids
+
+    def test_get_category_etag(self):
+        response = client.get(f"{self.base_endpoint_name}/1")
+        assert response.status_code == 200
+        response = client.get(f"{self.base_endpoint_name}/1", headers={"If-None-Match": response.headers["ETag"]})
+        assert response.status_code == 304
+        response = client.get(f"{self.base_endpoint_name}/1", headers={"If-None-Match": '"outdated"'})
+        assert response.status_code == 200 and response.json()["title"] == "Fun"
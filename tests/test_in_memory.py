@@ -0,0 +1,37 @@
+import unittest
+from parameterized import parameterized
+
+import schemas
+from orm.in_memory import query_models, supports_query
+
+categories = [
+    schemas.CategoryInDb(identifier=1, title="Fun", description="A funny category"),
+    schemas.CategoryInDb(identifier=2, title="Programming", description=None),
+    schemas.CategoryInDb(identifier=3, title="Art", description="Category about art"),
+]
+
+
+class TestInMemory(unittest.TestCase):
+
+    @parameterized.expand([
+        [{}, [1, 2, 3]],
+        [{"pk": 2}, [2]],
+        [{"identifier__in": [1, 3, 4]}, [1, 3]],
+        [{"description__icontains": "CATEGORY"}, [1, 3]],
+        [{"order_by": ["title"]}, [3, 1, 2]],
+        [{"order_by": ["-description"]}, [3, 1, 2]],
+        [{"order_by": ["title"], "after": ["Fun"]}, [2]],
+        [{"order_by": ["-pk"], "after": [3], "limit": 1}, [2]],
+        [{"skip": 1, "limit": 0}, [2, 3]]
+    ])
+    def test_query_models(self, query: dict, identifiers: list):
+        assert [category.identifier for category in query_models(categories, "identifier", **query)] == identifiers
+
+    @parameterized.expand([
+        [{"identifier__in": [1], "order_by": ["identifier"], "limit": 10}, True],
+        [{"search": "fun"}, False],
+        [{"projection": {"title": 1}}, False],
+        [{"title__startswith": "F"}, False]
+    ])
+    def test_supports_query(self, query: dict, supported: bool):
+        assert supports_query(**query) == supported
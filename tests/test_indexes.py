@@ -0,0 +1,62 @@
+import unittest
+from unittest import mock
+
+from orm.indexes import IndexSpec, QueryShape, check_indexes, explain_query_shape
+from orm.models import Category
+
+
+class TestIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = mock.MagicMock()
+        self.collection.index_information.return_value = {
+            "_id_": {"key": [("_id", 1)]},
+            "title_1": {"key": [("title", 1)], "unique": True},
+            "title_text_description_text": {"key": [("_fts", "text"), ("_ftsx", 1)],
+                                            "weights": {"description": 2, "title": 10}},
+        }
+
+    def test_check_indexes_complete(self):
+        with mock.patch.object(Category, "_get_collection", return_value=self.collection), \
+                mock.patch.object(Category, "ensure_indexes") as ensure_indexes:
+            report, = check_indexes([Category])
+        assert report.missing == [] and report.extra == [] and not report.created
+        ensure_indexes.assert_not_called()
+
+    def test_check_indexes_missing_and_extra(self):
+        del self.collection.index_information.return_value["title_1"]
+        self.collection.index_information.return_value["description_1"] = {"key": [("description", 1)]}
+        with mock.patch.object(Category, "_get_collection", return_value=self.collection), \
+                mock.patch.object(Category, "ensure_indexes") as ensure_indexes:
+            report, = check_indexes([Category])
+        assert report.missing == [IndexSpec(key=[("title", 1)], unique=True)]
+        assert report.extra == [IndexSpec(key=[("description", 1)])]
+        assert report.created
+        ensure_indexes.assert_called_once()
+
+    def test_check_indexes_options(self):
+        # Same keys, but the title index does not prevent duplicates and the text index ranks the fields equally
+        index_information = self.collection.index_information.return_value
+        index_information["title_1"] = {"key": [("title", 1)]}
+        index_information["title_text_description_text"]["weights"] = {"description": 1, "title": 1}
+        with mock.patch.object(Category, "_get_collection", return_value=self.collection):
+            report, = check_indexes([Category], create=False)
+        assert report.missing == [
+            IndexSpec(key=[("description", "text"), ("title", "text")], weights={"title": 10, "description": 2}),
+            IndexSpec(key=[("title", 1)], unique=True)
+        ]
+        assert report.extra == [IndexSpec(key=[("title", 1)]),
+                                IndexSpec(key=[("description", "text"), ("title", "text")],
+                                          weights={"description": 1, "title": 1})]
+        assert not report.created
+        assert str(report.missing[1]) == "[('title', 1)] unique=True"
+
+    def test_explain_query_shape(self):
+        self.collection.find.return_value.explain.return_value = {"queryPlanner": {"winningPlan": {
+            "stage": "LIMIT", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}}
+        with mock.patch.object(Category, "_get_collection", return_value=self.collection):
+            plan = explain_query_shape(QueryShape("categories by title", Category, {"order_by": ["title"]}))
+        assert plan.stages == ["LIMIT", "FETCH", "IXSCAN"]
+        assert not plan.collection_scan
+        self.collection.find.assert_called_once_with(filter={}, projection=None, sort=[("title", 1)], skip=0,
+                                                     limit=100)
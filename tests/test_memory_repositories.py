@@ -0,0 +1,184 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from mongoengine import NotUniqueError
+from parameterized import parameterized
+
+import schemas
+from dependencies import get_repository_container
+from orm.async_repositories import ThreadPoolRepositoryContainer
+from orm.memory_repositories import MemoryDatabase, MemoryRepositoryContainer
+from orm.repositories import answer_key_cache, category_cache, principal_cache
+from resources import AppResources
+from response_cache import category_response_cache, quiz_list_response_cache, quiz_response_cache
+from .fake_client import app, client
+from .fake_orm_dependicies import fake_password_executor
+
+
+def create_quiz(title: str, owner: str, categories: list) -> schemas.Quiz:
+    return schemas.Quiz(title=title, description=f"Description of {title}", owner=owner, categories=categories,
+                        questions=[schemas.Question(title="Question", answers=[
+                            schemas.Answer(answer_text="Yes", is_correct=True),
+                            schemas.Answer(answer_text="No", is_correct=False)
+                        ])])
+
+
+class TestMemoryRepositories(unittest.TestCase):
+
+    def setUp(self):
+        # The caches are process wide, the identifiers of other tests must not be served from them
+        answer_key_cache.clear()
+        principal_cache.clear()
+        category_cache.invalidate()
+        self.database = MemoryDatabase()
+        self.container = MemoryRepositoryContainer(self.database)
+        for title in ("Fun", "Programming", "Art"):
+            self.container.category.persist(schemas.CategoryInDb(title=title, description=f"{title} category"))
+        for idx in range(1, 11):
+            self.container.quiz.persist(create_quiz(f"Quiz {11 - idx}", f"user{idx % 2}@example.com",
+                                                    [idx % 3 + 1]))
+
+    def tearDown(self):
+        answer_key_cache.clear()
+        principal_cache.clear()
+        category_cache.invalidate()
+
+    @parameterized.expand([
+        [{}, list(range(1, 11))],
+        [{"owner": "user1@example.com"}, [1, 3, 5, 7, 9]],
+        [{"categories__in": [1, 3], "owner": "user0@example.com"}, [2, 6, 8]],
+        [{"pk": 4}, [4]],
+        [{"identifier__in": [4, 2, 99]}, [2, 4]],
+        [{"title__icontains": "QUIZ 1"}, [1, 10]],
+        [{"order_by": ["-identifier"], "limit": 3}, [10, 9, 8]],
+        [{"order_by": ["identifier"], "after": [7]}, [8, 9, 10]],
+        [{"order_by": ["-identifier"], "after": [3], "owner": "user0@example.com"}, [2]],
+        [{"order_by": ["identifier"], "skip": 2, "limit": 2, "categories": 2}, [7, 10]],
+        [{"order_by": ["title", "identifier"], "limit": 3}, [10, 1, 9]],
+        [{"order_by": ["title", "identifier"], "after": ["Quiz 2", 9], "limit": 2}, [8, 7]],
+        [{"search": "quiz 3", "limit": 2}, [8, 1]],
+        [{"search": "art"}, []]
+    ])
+    def test_filter(self, query: dict, identifiers: list):
+        assert [quiz.identifier for quiz in self.container.quiz.filter(**query)] == identifiers
+
+    def test_count_and_exists(self):
+        assert self.container.quiz.count() == 10
+        assert self.container.quiz.count(owner="user0@example.com") == 5
+        assert self.container.quiz.exists(categories=3)
+        assert not self.container.quiz.exists(categories=4)
+        with self.assertRaises(ValueError):
+            self.container.quiz.count(title__startswith="Quiz")
+
+    def test_persist_updates_indexes(self):
+        quiz = self.container.quiz.get(1)
+        updated = self.container.quiz.persist(quiz.copy(update={"owner": "user2@example.com", "categories": [3]}))
+        assert self.container.quiz.get(1) is updated
+        assert self.container.quiz.count() == 10
+        assert 1 not in [quiz.identifier for quiz in self.container.quiz.filter(owner="user1@example.com")]
+        assert [quiz.identifier for quiz in self.container.quiz.filter(owner="user2@example.com")] == [1]
+        assert [quiz.identifier for quiz in self.container.quiz.filter(categories__in=[2, 3], limit=3)] == [1, 2, 4]
+
+    def test_delete(self):
+        self.container.quiz.delete(self.container.quiz.get(5))
+        assert self.container.quiz.get(5) is None
+        assert [quiz.identifier for quiz in self.container.quiz.filter(owner="user1@example.com")] == [1, 3, 7, 9]
+        assert [quiz.identifier for quiz in self.container.quiz.filter(order_by=["identifier"], after=[4],
+                                                                       limit=2)] == [6, 7]
+
+    def test_sequences(self):
+        quiz = self.container.quiz.get(2)
+        assert [question.identifier for question in quiz.questions] == [2]
+        assert [answer.identifier for answer in quiz.questions[0].answers] == [3, 4]
+        self.container.quiz.persist(create_quiz("Quiz 50", "user0@example.com", []).copy(update={"identifier": 50}))
+        assert self.container.quiz.persist(create_quiz("Quiz 51", "user0@example.com", [])).identifier == 51
+
+    def test_unique_fields(self):
+        with self.assertRaises(NotUniqueError):
+            self.container.category.insert_unique(schemas.CategoryInDb(title="Fun"))
+        with self.assertRaises(NotUniqueError):
+            self.container.category.persist(schemas.CategoryInDb(identifier=2, title="Fun"))
+        category = self.container.category.persist(schemas.CategoryInDb(identifier=2, title="Coding"))
+        assert self.container.category.get_by_title("Coding") == category
+        assert self.container.category.get_by_title("Programming") is None
+
+    def test_snapshot(self):
+        user = schemas.UserInDb(email="john.doe@gmail.com", first_name="John", last_name="Doe", disabled=False,
+                                password_hash="hash")
+        self.container.user.insert_unique(user)
+        self.container.user.revoke_refresh_token("jti", datetime.utcnow() + timedelta(days=1))
+        with tempfile.TemporaryDirectory() as directory:
+            self.database.snapshot_path = os.path.join(directory, "snapshot.json")
+            self.database.save()
+            database = MemoryDatabase(self.database.snapshot_path)
+            assert database.load()
+        container = MemoryRepositoryContainer(database)
+        assert container.user.get("john.doe@gmail.com") == user
+        assert container.user.is_refresh_token_revoked("jti")
+        assert container.quiz.get(3) == self.container.quiz.get(3)
+        assert [quiz.identifier for quiz in container.quiz.filter(owner="user1@example.com", limit=2)] == [1, 3]
+        assert container.quiz.persist(create_quiz("New", "user0@example.com", [1])).identifier == 11
+
+    def test_resources(self):
+        app_resources = AppResources()
+        settings = mock.Mock(repository_backend="memory", memory_snapshot_path=None)
+        with mock.patch("resources.get_settings", return_value=settings), \
+                mock.patch("resources.connect_database") as connect_database, \
+                mock.patch("resources.disconnect_database") as disconnect_database:
+            asyncio.run(app_resources.startup())
+            user = asyncio.run(app_resources.repository_container.user.get("john.doe@gmail.com"))
+            asyncio.run(app_resources.shutdown())
+        assert user is None
+        connect_database.assert_not_called()
+        disconnect_database.assert_not_called()
+
+
+class TestMemoryBackendApi(unittest.TestCase):
+
+    def setUp(self):
+        self.clear_caches()
+        self.container = ThreadPoolRepositoryContainer(MemoryRepositoryContainer(MemoryDatabase()),
+                                                       fake_password_executor)
+        self.previous_override = app.dependency_overrides[get_repository_container]
+        app.dependency_overrides[get_repository_container] = lambda: self.container
+
+    def tearDown(self):
+        app.dependency_overrides[get_repository_container] = self.previous_override
+        self.clear_caches()
+
+    @staticmethod
+    def clear_caches():
+        answer_key_cache.clear()
+        principal_cache.clear()
+        category_cache.invalidate()
+        for response_cache in (quiz_response_cache, quiz_list_response_cache, category_response_cache):
+            response_cache.clear()
+
+    def test_signup_and_create(self):
+        response = client.post("/users/signup", json={"email": "jane.doe@gmail.com", "first_name": "Jane",
+                                                      "last_name": "Doe", "password": "Memory2022!"})
+        assert response.status_code == 200
+        response = client.post("/users/token", data={"username": "jane.doe@gmail.com", "password": "Memory2022!"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = client.post("/categories/", json={"title": "Memory", "description": "In-memory category"},
+                               headers=headers)
+        assert response.status_code == 200
+        category_id = response.json()["identifier"]
+        assert category_id == 1
+        assert client.post("/categories/", json={"title": "Memory"}, headers=headers).status_code == 400
+
+        response = client.post("/quizzes/", headers=headers, json={
+            "title": "Memory Quiz", "description": "Stored in memory", "categories": [category_id],
+            "questions": [{"title": "Is MongoDB required?", "answers": [
+                {"answer_text": "No", "is_correct": True}, {"answer_text": "Yes", "is_correct": False}]}]})
+        assert response.status_code == 200
+        quiz = response.json()
+        assert quiz["identifier"] == 1 and quiz["owner"] == "jane.doe@gmail.com"
+        assert [answer["identifier"] for answer in quiz["questions"][0]["answers"]] == [1, 2]
+        assert client.get("/quizzes/1").json() == quiz
+        assert [item["identifier"] for item in client.get("/quizzes/", params={"categories": category_id}).json()] \
+            == [1]
@@ -0,0 +1,95 @@
+import asyncio
+import unittest
+from unittest import mock
+from pymongo.errors import AutoReconnect
+
+from instrumentation import call_repository_method, command_listener, registry, request_stats, RequestStats
+from orm.async_repositories import AsyncMongoRepository
+from orm.models import Category, Quiz
+from orm.sequences import sequence_allocator
+from .fake_client import client
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_metrics_endpoint(self):
+        assert client.get("/quizzes/1").status_code == 200
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert 'http_request_duration_seconds_count{method="GET",route="/quizzes/{quiz_id}",status="200"}' \
+               in response.text
+        assert 'http_requests_in_progress{method="GET",route="/metrics"} 1.0' in response.text
+        assert 'cache_hits_total{cache="answer_key"}' in response.text
+        assert 'rate_limit_rejected_total{limiter="login_ip"}' in response.text
+        assert 'single_flight_calls_total{flight="quiz"}' in response.text
+
+    def test_command_listener(self):
+        stats = RequestStats("/quizzes/")
+        token = request_stats.set(stats)
+        try:
+            event = mock.Mock(command_name="find", duration_micros=1500)
+            command_listener.succeeded(event)
+            call_repository_method("QuizRepository.filter", command_listener.succeeded, event)
+        finally:
+            request_stats.reset(token)
+        assert stats.breakdown() == {"unknown/find": {"count": 1, "duration_ms": 1.5},
+                                     "QuizRepository.filter/find": {"count": 1, "duration_ms": 1.5}}
+
+    def test_async_repository_commands(self):
+        database = mock.MagicMock()
+        collection = database.__getitem__.return_value
+        collection.find.return_value.to_list = mock.AsyncMock(return_value=[])
+        collection.count_documents = mock.AsyncMock(return_value=3)
+        collection.delete_one = mock.AsyncMock(side_effect=AutoReconnect())
+        repository = AsyncMongoRepository(Quiz, database)
+        failures = registry.get_sample_value("mongodb_command_failures_total", {"command": "delete"}) or 0
+
+        async def run():
+            token = request_stats.set(stats)
+            try:
+                assert await repository.get(1) is None
+                assert await repository.count(owner="john.doe@gmail.com") == 3
+                with self.assertRaises(AutoReconnect):
+                    await repository.delete(Quiz(identifier=1))
+            finally:
+                request_stats.reset(token)
+
+        # Motor does not copy the context of the request into its threads, the repository records the commands
+        stats = RequestStats("/quizzes/{quiz_id}")
+        asyncio.run(run())
+        assert [(record.repository_method, record.command) for record in stats.commands] == [
+            ("AsyncMongoRepository(Quiz).filter_raw", "find"),
+            ("AsyncMongoRepository(Quiz).count", "aggregate"),
+            ("AsyncMongoRepository(Quiz).delete", "delete")
+        ]
+        assert registry.get_sample_value("mongodb_command_failures_total", {"command": "delete"}) == failures + 1
+        assert registry.get_sample_value("mongodb_command_duration_seconds_count", {
+            "route": "/quizzes/{quiz_id}", "repository_method": "AsyncMongoRepository(Quiz).filter_raw",
+            "command": "find"}) >= 1
+
+    def test_async_sequence_commands(self):
+        database = mock.MagicMock()
+        collection = database.__getitem__.return_value
+        collection.find_one_and_update = mock.AsyncMock(return_value={"next": 100})
+        collection.insert_one = mock.AsyncMock()
+        repository = AsyncMongoRepository(Category, database)
+        stats = RequestStats("/categories/")
+
+        async def run():
+            token = request_stats.set(stats)
+            try:
+                return await repository.insert_unique(Category(title="Fun"))
+            finally:
+                request_stats.reset(token)
+
+        sequence_allocator.clear()
+        with mock.patch.object(sequence_allocator, "block_size", 100):
+            category = asyncio.run(run())
+        sequence_allocator.clear()
+        # The counter round trip is recorded by the repository method that needed the identifier
+        assert category.identifier == 1
+        assert [(record.repository_method, record.command) for record in stats.commands] == [
+            ("AsyncMongoRepository(Category).insert_unique", "findAndModify"),
+            ("AsyncMongoRepository(Category).insert_unique", "insert")
+        ]
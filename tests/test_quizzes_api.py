@@ -22,7 +22,9 @@ class TestQuizzesApi(unittest.TestCase):
         assert response.status_code == status_code
 
     @parameterized.expand([
-        [{"title": "Lang"}, 1, 200]
+        [{"title": "Lang"}, 1, 200],
+        [{"title": "Lang", "view": "summary"}, 1, 200],
+        [{"view": "invalid"}, None, 422]
     ])
     def test_read_quizzes(self, query_params: dict, item_count: int, status_code: int):
         response = client.get(f"{self.base_endpoint_name}", params=query_params)
@@ -73,6 +75,15 @@ class TestQuizzesApi(unittest.TestCase):
                     schemas.AnswerUpsert(answer_text="Amsterdam", is_correct=False),
                 ]
             )]
+        )],
+        # Category 1001 does not exist
+        ["john.doe@gmail.com", "test1234", 404, schemas.QuizUpsert(
+            title="Country Quiz",
+            categories=[1, 1001],
+            questions=[schemas.QuestionUpsert(
+                title="What is the capital city of Austria?",
+                answers=[schemas.AnswerUpsert(answer_text="Vienna", is_correct=True)]
+            )]
         )]
     ])
     def test_create_quiz(self, username: str, password: str, status_code: int, quiz_create: schemas.QuizUpsert):
@@ -143,3 +154,77 @@ class TestQuizzesApi(unittest.TestCase):
         response = auth_client.delete(f"{self.base_endpoint_name}/{quiz_id}")
 
         assert response.status_code == status_code
+
+    def test_read_quizzes_summary(self):
+        response = client.get(f"{self.base_endpoint_name}", params={"title": "Quiz 1", "view": "summary"})
+        assert response.status_code == 200
+        quiz_summary = [x for x in response.json() if x["identifier"] == 1][0]
+        assert quiz_summary == {"identifier": 1, "title": "Quiz 1", "description": None, "categories": [2],
+                                "owner": "john.doe@gmail.com", "question_count": 1}
+
+    def test_validate_quizzes(self):
+        quiz_submits = [
+            # Valid submit
+            schemas.QuizSubmit(identifier=1, questions=[
+                schemas.QuestionSubmit(identifier=1, answers=[
+                    schemas.AnswerSubmit(identifier=1, is_correct=True),
+                    schemas.AnswerSubmit(identifier=2, is_correct=True),
+                    schemas.AnswerSubmit(identifier=3, is_correct=False),
+                    schemas.AnswerSubmit(identifier=4, is_correct=False)
+                ])]),
+            # Quiz does not exist
+            schemas.QuizSubmit(identifier=100, questions=[]),
+            # Answers are missing
+            schemas.QuizSubmit(identifier=2, questions=[schemas.QuestionSubmit(identifier=2, answers=[])])
+        ]
+        response = client.post(f"{self.base_endpoint_name}/validate/batch",
+                               json=[quiz_submit.dict() for quiz_submit in quiz_submits])
+        assert response.status_code == 200
+        validation_results = [schemas.QuizBatchValidationResult(**x) for x in response.json()]
+        assert [x.identifier for x in validation_results] == [1, 100, 2]
+        assert [x.status_code for x in validation_results] == [200, 404, 400]
+        assert validation_results[0].result == schemas.QuizValidationResult(total_points=3, points=2)
+
+    @parameterized.expand([
+        [{"q": "language"}, [2]],
+        [{"q": "quiz"}, [1, 2]],
+        [{"q": "LANGUAGE"}, [2]],
+        [{"q": "quiz", "title": "Lang"}, [2]],
+        [{"q": "unknown"}, []]
+    ])
+    def test_search_quizzes(self, query_params: dict, quiz_ids: list):
+        response = client.get(f"{self.base_endpoint_name}", params=query_params)
+        assert response.status_code == 200
+        assert sorted([x["identifier"] for x in response.json()]) == quiz_ids
+
+    def test_search_quizzes_cursor(self):
+        response = client.get(f"{self.base_endpoint_name}", params={"q": "quiz", "cursor": "abc"})
+        assert response.status_code == 400
+
+    def test_get_quiz_etag(self):
+        response = client.get(f"{self.base_endpoint_name}/2")
+        etag = response.headers["ETag"]
+        assert response.status_code == 200 and etag.startswith('"')
+        response = client.get(f"{self.base_endpoint_name}/2", headers={"If-None-Match": f'"other", W/{etag}'})
+        assert response.status_code == 304
+        assert response.content == b"" and response.headers["ETag"] == etag
+
+        # Writes invalidate the cached response
+        db = get_fake_repository_container()
+        quiz = db.quiz.get(2)
+        db.quiz.persist(quiz.copy(update={"title": "Language Quiz 2"}))
+        try:
+            response = client.get(f"{self.base_endpoint_name}/2", headers={"If-None-Match": etag})
+            assert response.status_code == 200
+            assert response.json()["title"] == "Language Quiz 2"
+            assert response.headers["ETag"] != etag
+        finally:
+            db.quiz.persist(quiz)
+
+    def test_read_quizzes_etag(self):
+        params = {"title": "Quiz", "limit": 1}
+        response = client.get(f"{self.base_endpoint_name}", params=params)
+        assert response.status_code == 200 and "X-Next-Cursor" in response.headers
+        response = client.get(f"{self.base_endpoint_name}", params=params,
+                              headers={"If-None-Match": response.headers["ETag"]})
+        assert response.status_code == 304 and "X-Next-Cursor" in response.headers
@@ -0,0 +1,25 @@
+import unittest
+from unittest import mock
+
+from rate_limiting import MemoryRateLimitStore, RateLimiter
+
+
+class TestRateLimiting(unittest.TestCase):
+
+    def test_token_bucket(self):
+        limiter = RateLimiter("test", rate=2, capacity=3)
+        with mock.patch("rate_limiting.monotonic", return_value=100.0):
+            assert [limiter.acquire("1.2.3.4") for _ in range(3)] == [0, 0, 0]
+            assert limiter.acquire("1.2.3.4") == 0.5
+            # Every key has its own bucket
+            assert limiter.acquire("5.6.7.8") == 0
+        with mock.patch("rate_limiting.monotonic", return_value=100.5):
+            assert limiter.acquire("1.2.3.4") == 0
+        assert (limiter.allowed, limiter.rejected) == (5, 1)
+
+    def test_memory_store_eviction(self):
+        store = MemoryRateLimitStore(maxsize=1)
+        assert store.consume("a", rate=1, capacity=1) == 0
+        assert store.consume("b", rate=1, capacity=1) == 0
+        # The bucket of "a" was evicted and starts full again
+        assert store.consume("a", rate=1, capacity=1) == 0
@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+from time import sleep
+from unittest import mock
+from mongoengine import NotUniqueError
+from pymongo.errors import DuplicateKeyError
+
+import schemas
+import services
+from orm.models import Category, User
+from orm.async_repositories import ThreadPoolQuizRepository
+from orm.repositories import CategoryRepository, QuizRepository, UserRepository, answer_key_cache, \
+    async_quiz_flights, category_cache
+
+
+class TestRepositories(unittest.TestCase):
+
+    def test_persist_single_round_trip(self):
+        collection = mock.MagicMock()
+        with mock.patch.object(User, "_get_collection", return_value=collection):
+            user = UserRepository().persist(schemas.UserInDb(email="john.wick@gmail.com",
+                                                             first_name="John",
+                                                             last_name="Wick",
+                                                             disabled=False,
+                                                             password_hash="hash"))
+        assert user.email == "john.wick@gmail.com"
+        assert collection.method_calls == [mock.call.replace_one(
+            {"_id": "john.wick@gmail.com"}, mock.ANY, upsert=True)]
+
+    def test_persist_existing_identifier(self):
+        collection = mock.MagicMock()
+        with mock.patch.object(Category, "_get_collection", return_value=collection):
+            category = CategoryRepository().persist(schemas.CategoryInDb(identifier=5, title="Fun"))
+        assert category == schemas.CategoryInDb(identifier=5, title="Fun")
+        collection.replace_one.assert_called_once_with({"_id": 5}, {"_id": 5, "title": "Fun"}, upsert=True)
+
+    def test_insert_unique_duplicate(self):
+        collection = mock.MagicMock()
+        collection.insert_one.side_effect = DuplicateKeyError("E11000 duplicate key error")
+        with mock.patch.object(Category, "_get_collection", return_value=collection):
+            with self.assertRaises(NotUniqueError):
+                CategoryRepository().insert_unique(schemas.CategoryInDb(identifier=5, title="Fun"))
+        collection.insert_one.assert_called_once()
+
+    def test_category_cache(self):
+        collection = mock.MagicMock()
+        collection.find.return_value = [{"_id": 1, "title": "Fun"}, {"_id": 2, "title": "Programming"}]
+        category_cache.invalidate()
+        with mock.patch.object(Category, "_get_collection", return_value=collection):
+            repository = CategoryRepository()
+            assert repository.get(2).title == "Programming"
+            assert repository.get_by_title("Fun").identifier == 1
+            assert repository.count(identifier__in=[1, 2, 3]) == 2
+            assert [category.identifier for category in repository.filter(order_by=["-title"])] == [2, 1]
+            assert collection.find.call_count == 1
+            repository.persist(schemas.CategoryInDb(identifier=3, title="Art"))
+            repository.get(3)
+        assert collection.find.call_count == 2
+
+    def test_thread_pool_quiz_repository(self):
+        sync_repository = mock.create_autospec(QuizRepository, instance=True)
+        sync_repository.get.side_effect = lambda key: sleep(0.01) or {"identifier": key}
+        repository = ThreadPoolQuizRepository(sync_repository)
+        answer_key = services.AnswerKey(identifier=7, total_points=1, questions={1: {1: True, 2: False}})
+        answer_key_cache.put(7, answer_key)
+        calls, collapsed = async_quiz_flights.calls, async_quiz_flights.collapsed
+
+        async def run():
+            return await asyncio.gather(*(repository.get(1) for _ in range(3)))
+
+        try:
+            first, second, third = asyncio.run(run())
+            # A cached answer key is returned without a threadpool worker and without coalescing
+            with mock.patch("orm.async_repositories.run_in_threadpool") as run_in_threadpool:
+                assert asyncio.run(repository.get_answer_key(7)) is answer_key
+            run_in_threadpool.assert_not_called()
+        finally:
+            answer_key_cache.invalidate(7)
+        assert first is second is third
+        sync_repository.get.assert_called_once_with(1)
+        assert (async_quiz_flights.calls - calls, async_quiz_flights.collapsed - collapsed) == (3, 2)
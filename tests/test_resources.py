@@ -0,0 +1,83 @@
+import asyncio
+import unittest
+from unittest import mock
+from parameterized import parameterized
+
+from auth.utilities import get_password_hash_async, verify_password_async
+from instrumentation import command_listener
+from orm.indexes import IndexReport, IndexSpec
+from orm.repositories import principal_cache
+from resources import AppResources
+from .fake_orm_dependicies import get_fake_async_repository_container
+
+
+class TestResources(unittest.TestCase):
+
+    def test_lifecycle(self):
+        app_resources = AppResources()
+        container = get_fake_async_repository_container()
+        with mock.patch("resources.connect_database") as connect_database, \
+                mock.patch("resources.disconnect_database") as disconnect_database, \
+                mock.patch("resources.get_connection") as get_connection, \
+                mock.patch("resources.check_indexes", return_value=[]) as check_indexes, \
+                mock.patch.object(AppResources, "create_repository_container", return_value=container):
+            with self.assertRaises(RuntimeError):
+                app_resources.repository_container
+            asyncio.run(app_resources.startup())
+            assert app_resources.repository_container is container
+            connect_database.assert_called_once_with(event_listeners=[command_listener])
+            check_indexes.assert_called_once_with(create=True)
+            get_connection.return_value.admin.command.assert_called_once_with("ping")
+
+            password_executor = app_resources.password_executor
+            assert app_resources.executors == {"password": password_executor}
+
+            asyncio.run(app_resources.shutdown())
+            with self.assertRaises(RuntimeError):
+                app_resources.repository_container
+            with self.assertRaises(RuntimeError):
+                app_resources.password_executor
+            assert app_resources.executors == {}
+            disconnect_database.assert_called_once()
+            with self.assertRaises(RuntimeError):
+                password_executor.submit(print)
+
+    def test_restart(self):
+        app_resources = AppResources()
+        with mock.patch("resources.connect_database"), mock.patch("resources.disconnect_database"), \
+                mock.patch("resources.get_connection"), mock.patch("resources.check_indexes", return_value=[]), \
+                mock.patch.object(AppResources, "create_repository_container",
+                                  return_value=get_fake_async_repository_container()):
+            asyncio.run(app_resources.startup())
+            asyncio.run(app_resources.shutdown())
+            principal_cache.put("john.doe@gmail.com", "stale")
+            asyncio.run(app_resources.startup())
+            # The executor of the first run is shut down, the restarted application hashes with a new executor
+            password_hash = asyncio.run(get_password_hash_async(app_resources.password_executor, "test1234"))
+            assert asyncio.run(verify_password_async(app_resources.password_executor, "test1234", password_hash))
+            assert principal_cache.get("john.doe@gmail.com") is None
+            asyncio.run(app_resources.shutdown())
+
+    @parameterized.expand([
+        ["mongoengine", IndexSpec(key=[("title", 1)], unique=True), True],
+        ["motor", IndexSpec(key=[("title", 1)], unique=True), True],
+        ["mongoengine", IndexSpec(key=[("owner", 1)]), False]
+    ])
+    def test_missing_index(self, backend: str, spec: IndexSpec, fails: bool):
+        # insert_unique of both MongoDB backends relies on the unique indexes
+        app_resources = AppResources()
+        settings = mock.Mock(repository_backend=backend, create_indexes_on_startup=False,
+                             preload_caches_on_startup=False)
+        report = IndexReport(collection="category", missing=[spec], extra=[], created=False)
+        with mock.patch("resources.get_settings", return_value=settings), mock.patch("resources.connect_database"), \
+                mock.patch("resources.disconnect_database"), mock.patch("resources.get_connection"), \
+                mock.patch("resources.check_indexes", return_value=[report]) as check_indexes, \
+                mock.patch.object(AppResources, "create_repository_container",
+                                  return_value=get_fake_async_repository_container()):
+            if fails:
+                with self.assertRaises(RuntimeError):
+                    asyncio.run(app_resources.startup())
+            else:
+                asyncio.run(app_resources.startup())
+            asyncio.run(app_resources.shutdown())
+        check_indexes.assert_called_once_with(create=False)
@@ -0,0 +1,57 @@
+import unittest
+from unittest import mock
+from parameterized import parameterized
+
+from orm.models import Answer, Question, Quiz
+from orm.sequences import SequenceAllocator, sequence_allocator
+
+
+class FakeCounterCollection:
+    """
+    Fake in-memory mongoengine.counters collection, counts the counter updates (= database round trips)
+    """
+
+    def __init__(self, counters: dict = None):
+        self.counters = counters or {}
+        self.round_trips = 0
+
+    def find_one_and_update(self, filter, update, return_document, upsert):
+        self.round_trips += 1
+        sequence_id = filter["_id"]
+        self.counters[sequence_id] = self.counters.get(sequence_id, 0) + update["$inc"]["next"]
+        return {"_id": sequence_id, "next": self.counters[sequence_id]}
+
+
+class TestSequences(unittest.TestCase):
+
+    def setUp(self):
+        sequence_allocator.clear()
+
+    def test_allocator(self):
+        allocator = SequenceAllocator(block_size=2)
+        assert allocator.take("quiz.identifier") is None
+        allocator.add_block("quiz.identifier", 10)
+        allocator.add_block("quiz.identifier", 14)
+        assert [allocator.take("quiz.identifier") for _ in range(5)] == [9, 10, 13, 14, None]
+
+    @parameterized.expand([
+        [100, 4],
+        [1, 251]
+    ])
+    def test_block_sequence_round_trips(self, block_size: int, round_trips: int):
+        # Quiz with 50 questions and 4 answers each -> 1 + 50 + 200 identifiers
+        collection = FakeCounterCollection({"quiz.identifier": 41})
+        with mock.patch("orm.sequences.get_db", return_value={"mongoengine.counters": collection}), \
+                mock.patch.object(sequence_allocator, "block_size", block_size):
+            quiz = Quiz(title="Quiz", questions=[
+                Question(title=f"Question {q}", answers=[Answer(answer_text="Answer", is_correct=True)
+                                                         for _ in range(4)]) for q in range(50)])
+            son = quiz.to_mongo()
+
+        assert collection.round_trips == round_trips
+        # Existing counters are continued
+        assert son["_id"] == 42
+        question_ids = [question["_id"] for question in son["questions"]]
+        answer_ids = [answer["_id"] for question in son["questions"] for answer in question["answers"]]
+        assert question_ids == list(range(1, 51))
+        assert answer_ids == list(range(1, 201))
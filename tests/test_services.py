@@ -87,6 +87,8 @@ validation_result2_data = schemas.QuizValidationResult(total_points=3, points=1)
 validation_result3_data = None
 validation_result4_data = schemas.QuizValidationResult(total_points=3, points=0)
 
+answer_key_data = services.compile_answer_key(quiz_data)
+
 
 class TestServices(unittest.TestCase):
 
@@ -102,3 +104,20 @@ class TestServices(unittest.TestCase):
                            check_validation_result: schemas.QuizValidationResult):
         validation_result = services.validate_quiz(quiz, quiz_submit)
         assert validation_result == check_validation_result
+
+    def test_compile_answer_key(self):
+        answer_key = services.compile_answer_key(quiz_data)
+        assert answer_key.identifier == quiz_data.identifier
+        assert answer_key.total_points == 3
+        assert answer_key.questions == {1: {1: True, 2: True, 3: True, 4: False}}
+
+    @parameterized.expand([
+        [submit1_data, validation_result1_data],
+        [submit2_data, validation_result2_data],
+        [submit3_data, validation_result3_data],
+        [submit4_data, validation_result4_data]
+    ])
+    def test_grade_quiz(self, quiz_submit: schemas.QuizSubmit, check_validation_result: schemas.QuizValidationResult):
+        # The answer key is compiled once and reused for all submits
+        validation_result = services.grade_quiz(answer_key_data, quiz_submit)
+        assert validation_result == check_validation_result
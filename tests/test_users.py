@@ -1,9 +1,13 @@
 import unittest
+from unittest import mock
 from parameterized import parameterized
 import schemas
+from app import app
+from dependencies import login_rate_limit, login_username_limiter
+from utilities import ExecutorSaturatedError
 
 from .fake_client import client, get_auth_client
-from .fake_orm_dependicies import get_fake_repository_container
+from .fake_orm_dependicies import fake_password_executor, get_fake_repository_container
 
 
 class TestUsersApi(unittest.TestCase):
@@ -41,7 +45,9 @@ class TestUsersApi(unittest.TestCase):
         [{"email": "john.wick@gmail.com", "first_name": "John", "last_name": "Wick", "password": "Daisy"}, 422],
         # Invalid email -> email has no valid format
         [{"email": "test", "first_name": "Test", "last_name": "Test", "password": "SecuryPassword1234$"}, 422],
-        [{"email": "john.wick@gmail.com", "first_name": "John", "last_name": "Wick", "password": "Daisy2022!"}, 200]
+        [{"email": "john.wick@gmail.com", "first_name": "John", "last_name": "Wick", "password": "Daisy2022!"}, 200],
+        # User already exists
+        [{"email": "john.doe@gmail.com", "first_name": "John", "last_name": "Doe", "password": "Daisy2022!"}, 400]
     ])
     def test_user_signup(self, user_signup_data: dict, status_code: int):
         response = client.post(f"/{self.base_endpoint_name}/signup", json=user_signup_data)
@@ -56,3 +62,69 @@ class TestUsersApi(unittest.TestCase):
             db = get_fake_repository_container()
             user_del = db.user.get(user_signup_data.get("email"))
             db.user.delete(user_del)
+
+    def test_user_me_disabled(self):
+        auth_client = get_auth_client("tony.stark@gmail.com", "test1234")
+        assert auth_client.get(f"/{self.base_endpoint_name}/me").status_code == 200
+
+        # The cached user is invalidated when the user is written
+        db = get_fake_repository_container()
+        user = db.user.get("tony.stark@gmail.com")
+        db.user.delete(user)
+        db.user.persist(user.copy(update={"disabled": True}))
+        try:
+            assert auth_client.get(f"/{self.base_endpoint_name}/me").status_code == 401
+        finally:
+            db.user.delete(db.user.get("tony.stark@gmail.com"))
+            db.user.persist(user)
+
+    def test_login_saturated(self):
+        with mock.patch.object(fake_password_executor, "submit", side_effect=ExecutorSaturatedError()):
+            response = client.post(f"/{self.base_endpoint_name}/token", headers={
+                "Content-Type": "application/x-www-form-urlencoded"
+            }, data={"username": "john.doe@gmail.com", "password": "test1234"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+    def test_refresh_token(self):
+        response = client.post(f"/{self.base_endpoint_name}/token", headers={
+            "Content-Type": "application/x-www-form-urlencoded"
+        }, data={"username": "john.doe@gmail.com", "password": "test1234"})
+        refresh_token = response.json()["refresh_token"]
+
+        # A refresh token is no access token
+        response = client.get(f"/{self.base_endpoint_name}/me", headers={"Authorization": f"Bearer {refresh_token}"})
+        assert response.status_code == 401
+
+        response = client.post(f"/{self.base_endpoint_name}/token/refresh",
+                               data={"grant_type": "refresh_token", "refresh_token": refresh_token})
+        assert response.status_code == 200
+        access_token = response.json()["access_token"]
+        response = client.get(f"/{self.base_endpoint_name}/me", headers={"Authorization": f"Bearer {access_token}"})
+        assert response.status_code == 200
+
+        assert client.post(f"/{self.base_endpoint_name}/token/revoke", data={"token": refresh_token}).status_code == 200
+        response = client.post(f"/{self.base_endpoint_name}/token/refresh",
+                               data={"grant_type": "refresh_token", "refresh_token": refresh_token})
+        assert response.status_code == 401
+
+    @parameterized.expand([
+        [{"grant_type": "refresh_token", "refresh_token": "invalid"}, 401],
+        [{"grant_type": "password", "refresh_token": "invalid"}, 422],
+        [{"grant_type": "refresh_tokens", "refresh_token": "invalid"}, 422],
+        [{"grant_type": "my_refresh_token", "refresh_token": "invalid"}, 422]
+    ])
+    def test_refresh_token_invalid(self, data: dict, status_code: int):
+        response = client.post(f"/{self.base_endpoint_name}/token/refresh", data=data)
+        assert response.status_code == status_code
+
+    def test_login_rate_limit(self):
+        with mock.patch.dict(app.dependency_overrides), \
+                mock.patch.object(login_username_limiter, "acquire", return_value=1.5) as acquire:
+            del app.dependency_overrides[login_rate_limit]
+            response = client.post(f"/{self.base_endpoint_name}/token", headers={
+                "Content-Type": "application/x-www-form-urlencoded"
+            }, data={"username": "John.Doe@gmail.com", "password": "test1234"})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "2"
+        acquire.assert_called_once_with("john.doe@gmail.com")
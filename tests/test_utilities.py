@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+from threading import Event
+from parameterized import parameterized
+
+from utilities import AsyncSingleFlight, BoundedExecutor, ExecutorSaturatedError, first_or_default, LRUCache, \
+    SnapshotCache
+
+
+class TestUtilities(unittest.TestCase):
+
+    @parameterized.expand([
+        [[1, 2, 3], 1],
+        [[], None],
+        [None, None]
+    ])
+    def test_first_or_default(self, iterable, first):
+        assert first_or_default(iterable) == first
+
+    def test_lru_cache_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.put(1, "a")
+        cache.put(2, "b")
+        assert cache.get(1) == "a"  # 2 is now the least recently used item
+        cache.put(3, "c")
+        assert 2 not in cache
+        assert cache.get(1) == "a"
+        assert cache.get(3) == "c"
+        assert (cache.hits, cache.misses) == (3, 0)
+
+    def test_lru_cache_size(self):
+        cache = LRUCache(maxsize=5, getsizeof=len)
+        cache.put(1, "abc")
+        cache.put(2, "de")
+        cache.put(3, "f")
+        assert len(cache) == 2
+        cache.put(4, "too large")
+        assert 4 not in cache
+
+    def test_lru_cache_ttl(self):
+        cache = LRUCache(maxsize=10, ttl=0)
+        cache.put(1, "a")
+        assert cache.get(1) is None
+        assert cache.misses == 1
+
+    def test_lru_cache_invalidation(self):
+        cache = LRUCache(maxsize=10)
+        cache.put(1, "a")
+        generation = cache.generation
+        cache.invalidate(1)
+        assert cache.get(1) is None
+        # An item which was loaded before the invalidation is not cached
+        cache.put(1, "a", generation=generation)
+        assert 1 not in cache
+
+    def test_snapshot_cache(self):
+        cache = SnapshotCache()
+        assert cache.get() is None
+        cache.put("a")
+        assert cache.get() == "a"
+        generation = cache.generation
+        cache.invalidate()
+        cache.put("outdated", generation=generation)
+        assert cache.get() is None
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_snapshot_cache_ttl(self):
+        cache = SnapshotCache(ttl=0)
+        cache.put("a")
+        assert cache.get() is None
+
+    def test_lru_cache_item_ttl(self):
+        cache = LRUCache(maxsize=10, ttl=60)
+        cache.put(1, "a", ttl=0)
+        cache.put(2, "b", ttl=120)
+        assert cache.get(1) is None
+        assert cache.get(2) == "b"
+
+    def test_bounded_executor_saturation(self):
+        executor = BoundedExecutor(max_workers=1, queue_size=1)
+        release = Event()
+        futures = [executor.submit(release.wait), executor.submit(lambda: "queued")]
+        with self.assertRaises(ExecutorSaturatedError):
+            executor.submit(lambda: "rejected")
+        release.set()
+        assert [future.result(timeout=5) for future in futures] == [True, "queued"]
+        assert executor.submit(lambda: "accepted").result(timeout=5) == "accepted"
+        assert executor.rejected == 1
+        executor.shutdown()
+
+    def test_async_single_flight(self):
+        single_flight = AsyncSingleFlight()
+        calls = []
+
+        async def load(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return {"key": key}
+
+        async def run():
+            results = await asyncio.gather(*(single_flight.do(("get", key), load, key) for key in (1, 1, 2, 1)))
+            forgotten = single_flight.do(("get", 1), load, 1)
+            return results, await forgotten
+
+        (first, second, other, third), later = asyncio.run(run())
+        assert first is second is third and other == {"key": 2}
+        assert later == {"key": 1} and later is not first
+        assert calls == [1, 2, 1]
+        assert (single_flight.calls, single_flight.collapsed) == (5, 2)
@@ -1,3 +1,14 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+import asyncio
+import binascii
+import json
+
+
 def first_or_default(iterable):
     """
     Gets the first or default (= None) value from an iterable
@@ -5,3 +16,299 @@ def first_or_default(iterable):
     :return: First item or None
     """
     return next(iter(iterable or []), None)
+
+
+def encode_cursor(data: dict) -> str:
+    """
+    Encodes pagination data into an opaque cursor
+    :param data: Pagination data (must be json serializable)
+    :return: Cursor
+    """
+    return urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Optional[dict]:
+    """
+    Decodes a cursor that was created with encode_cursor
+    :param cursor: Cursor
+    :return: Pagination data or None if the cursor is invalid
+    """
+    try:
+        data = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class LRUCache:
+    """
+    Thread-safe, size bounded least recently used cache with an optional time to live
+    """
+
+    def __init__(self, maxsize: int, getsizeof: Optional[Callable[[Any], int]] = None, ttl: Optional[float] = None):
+        """
+        Initializes the cache
+        :param maxsize: Maximum size of the cache (sum of all item sizes)
+        :param getsizeof: Returns the size of an item (default is 1 -> maxsize is the maximum item count)
+        :param ttl: Time to live of an item in seconds (default is no expiration)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits, self.misses = 0, 0
+        self._getsizeof = getsizeof or (lambda value: 1)
+        self._items = OrderedDict()  # key -> (value, size, expires at)
+        self._size = 0
+        self._generation = 0
+        self._lock = Lock()
+
+    @property
+    def generation(self) -> int:
+        """
+        Is incremented on every invalidation, see put
+        :return: Current generation
+        """
+        return self._generation
+
+    def get(self, key, default=None):
+        """
+        Gets a cached item and marks it as recently used
+        :param key: Item key
+        :param default: Returned if the item is not cached or expired
+        :return: Cached item or default
+        """
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, generation: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Caches an item, the least recently used items are evicted if the cache is full
+        :param key: Item key
+        :param value: Item
+        :param generation: Generation that was read before the item was loaded, if an invalidation happened in the
+        meantime, the (possibly outdated) item is not cached
+        :param ttl: Time to live of this item in seconds, can only shorten the time to live of the cache
+        :return: None
+        """
+        size = self._getsizeof(value)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._items:
+                self._remove(key)
+            if size > self.maxsize:
+                return
+            if ttl is not None and self.ttl is not None:
+                ttl = min(ttl, self.ttl)
+            ttl = self.ttl if ttl is None else ttl
+            expires = monotonic() + ttl if ttl is not None else None
+            self._items[key] = (value, size, expires)
+            self._size += size
+            while self._size > self.maxsize:
+                self._remove(next(iter(self._items)))
+
+    def invalidate(self, key):
+        """
+        Removes an item from the cache
+        :param key: Item key
+        :return: None
+        """
+        with self._lock:
+            self._generation += 1
+            if key in self._items:
+                self._remove(key)
+
+    def clear(self):
+        """
+        Removes all items from the cache
+        :return: None
+        """
+        with self._lock:
+            self._generation += 1
+            self._items.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        _, size, _ = self._items.pop(key)
+        self._size -= size
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+
+class SnapshotCache:
+    """
+    Thread-safe cache of a single value (e.g. a snapshot of a small collection) with an optional time to live
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        """
+        Initializes the cache
+        :param ttl: Time to live of the value in seconds (default is no expiration)
+        """
+        self.ttl = ttl
+        self.hits, self.misses = 0, 0
+        self._value = None
+        self._expires: Optional[float] = None
+        self._generation = 0
+        self._lock = Lock()
+
+    @property
+    def generation(self) -> int:
+        """
+        Is incremented on every invalidation, see put
+        :return: Current generation
+        """
+        return self._generation
+
+    def get(self, default=None):
+        """
+        Gets the cached value
+        :param default: Returned if no value is cached or the value is expired
+        :return: Cached value or default
+        """
+        with self._lock:
+            if self._value is not None and self._expires is not None and self._expires <= monotonic():
+                self._value = None
+            if self._value is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._value
+
+    def put(self, value, generation: Optional[int] = None):
+        """
+        Caches a value
+        :param value: Value (None is not cached)
+        :param generation: Generation that was read before the value was loaded, if an invalidation happened in the
+        meantime, the (possibly outdated) value is not cached
+        :return: None
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._value = value
+            self._expires = monotonic() + self.ttl if self.ttl is not None else None
+
+    def invalidate(self):
+        """
+        Removes the cached value
+        :return: None
+        """
+        with self._lock:
+            self._generation += 1
+            self._value = None
+
+
+class AsyncSingleFlight:
+    """
+    Coalescing of concurrent calls of coroutine functions with the same key, the first caller executes the function
+    and the concurrent callers wait for its result (or exception) instead of executing it again.
+    The execution is shielded, a cancelled caller does not cancel the execution of the other callers
+    """
+
+    def __init__(self):
+        self.calls, self.collapsed = 0, 0
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable], *args, **kwargs):
+        """
+        Executes a coroutine function or joins the execution that is in flight for the same key.
+        The result is shared by all coalesced callers and must not be modified
+        :param key: Call key (e.g. method name and arguments)
+        :param fn: Coroutine function
+        :param args: Positional arguments of the coroutine function
+        :param kwargs: Keyword arguments of the coroutine function
+        :return: Result of the coroutine function
+        """
+        self.calls += 1
+        task = self._flights.get(key)
+        if task is None:
+            task = self._flights[key] = asyncio.ensure_future(fn(*args, **kwargs))
+            task.add_done_callback(lambda _: self.forget(key, task))
+        else:
+            self.collapsed += 1
+        return await asyncio.shield(task)
+
+    def forget(self, key: Hashable, task: Optional[asyncio.Future] = None):
+        """
+        Detaches the call in flight for a key, later callers start a new execution (e.g. after the data was updated)
+        :param key: Call key
+        :param task: Only detaches this call
+        :return: None
+        """
+        if task is None or self._flights.get(key) is task:
+            self._flights.pop(key, None)
+
+
+class ExecutorSaturatedError(Exception):
+    """
+    Raised if a task is submitted to a saturated bounded executor
+    """
+
+
+class BoundedExecutor:
+    """
+    Thread pool executor with a bounded queue, tasks are rejected (instead of queued) once the executor is saturated
+    """
+
+    def __init__(self, max_workers: int, queue_size: int, thread_name_prefix: str = ""):
+        """
+        Initializes the executor
+        :param max_workers: Maximum number of worker threads
+        :param queue_size: Maximum number of tasks that wait for a free worker
+        :param thread_name_prefix: Name prefix of the worker threads
+        """
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._semaphore = BoundedSemaphore(max_workers + queue_size)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Submits a task
+        :param fn: Callable
+        :param args: Positional arguments of the callable
+        :param kwargs: Keyword arguments of the callable
+        :raises ExecutorSaturatedError: If all workers are busy and the queue is full
+        :return: Future of the result
+        """
+        if not self._semaphore.acquire(blocking=False):
+            self.rejected += 1
+            raise ExecutorSaturatedError()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        future.add_done_callback(lambda _: self._semaphore.release())
+        return future
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """
+        Runs a task and waits for the result without blocking the event loop
+        :param fn: Callable
+        :param args: Positional arguments of the callable
+        :param kwargs: Keyword arguments of the callable
+        :raises ExecutorSaturatedError: If all workers are busy and the queue is full
+        :return: Result of the callable
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        """
+        Shuts the executor down
+        :param wait: If true, waits until all pending tasks are done
+        :return: None
+        """
+        self._executor.shutdown(wait=wait)